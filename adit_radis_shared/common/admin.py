@@ -1,5 +1,22 @@
 from django.contrib import admin
 
-from .models import ProjectSettings
+from .models import ArchivedJob, OutboxMail, ProjectSettings
 
 admin.site.register(ProjectSettings, admin.ModelAdmin)
+
+
+class OutboxMailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "created", "attempts", "next_attempt")
+    readonly_fields = ("created",)
+
+
+admin.site.register(OutboxMail, OutboxMailAdmin)
+
+
+class ArchivedJobAdmin(admin.ModelAdmin):
+    list_display = ("job_id", "task_name", "queue_name", "status", "finished_at")
+    list_filter = ("status", "queue_name")
+    search_fields = ("task_name",)
+
+
+admin.site.register(ArchivedJob, ArchivedJobAdmin)
@@ -0,0 +1,182 @@
+from collections.abc import Callable, Hashable
+from functools import wraps
+from typing import Any
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.models import AbstractBaseUser, AnonymousUser, PermissionsMixin
+from django.http import HttpRequest, HttpResponse
+from django.http.response import HttpResponseBase
+from django.template.response import SimpleTemplateResponse, TemplateResponse
+from opentelemetry import metrics
+
+from .utils.single_flight import SingleFlight
+
+meter = metrics.get_meter(__name__)
+
+coalesced_requests_counter = meter.create_counter(
+    "http.server.coalesced_requests",
+    unit="{request}",
+    description="Number of GET requests that were answered by a concurrent identical request.",
+)
+
+CoalescingKeyFunc = Callable[[HttpRequest, AbstractBaseUser | AnonymousUser], Hashable]
+
+
+def default_coalescing_key(
+    request: HttpRequest, user: AbstractBaseUser | AnonymousUser
+) -> Hashable:
+    """Identical requests have the same URL and come from the same user.
+
+    As only the first request runs the view (with its permission and object checks),
+    only the requests of the same user (e.g. reloads or multiple tabs) are coalesced.
+    """
+    return (
+        request.method,
+        request.get_full_path(),
+        request.headers.get("HX-Request"),
+        user.pk,
+        getattr(user, "active_group_id", None),
+    )
+
+
+def permission_coalescing_key(
+    request: HttpRequest, user: AbstractBaseUser | AnonymousUser
+) -> Hashable:
+    """Identical requests have the same URL and the same permissions of the user.
+
+    Only use it for views whose checks and response depend on the permissions of the
+    user alone (and not on the user itself, like object checks or the own objects).
+    """
+    # A custom user model without the permission mixin has no permissions.
+    permissions: set[str] = set()
+    if isinstance(user, PermissionsMixin | AnonymousUser):
+        permissions = user.get_all_permissions()
+
+    return (
+        request.method,
+        request.get_full_path(),
+        request.headers.get("HX-Request"),
+        user.is_authenticated,
+        getattr(user, "is_staff", False),
+        getattr(user, "is_superuser", False),
+        getattr(user, "active_group_id", None),
+        frozenset(permissions),
+    )
+
+
+class _ResponseSnapshot:
+    """What is shared of a response with the other identical requests.
+
+    The snapshot is taken right after the view returned (before any middleware of
+    the first request touches the response). A not yet rendered template response
+    is re-created for each request, so that it is rendered with its own context
+    processors (CSRF token, user, messages, ...) but still with the shared (and
+    possibly already evaluated) context data. Cookies are never shared.
+    """
+
+    def __init__(self, response: HttpResponseBase) -> None:
+        self.status = response.status_code
+        self.headers = list(response.headers.items())
+        self.streaming = response.streaming
+
+        self.is_template = False
+        self.content: bytes | None = None
+        if isinstance(response, SimpleTemplateResponse) and not response.is_rendered:
+            self.is_template = True
+            self.template_name = response.template_name
+            self.context_data = response.context_data
+            self.using = response.using
+        elif isinstance(response, HttpResponse):
+            self.content = response.content
+
+    def to_response(self, request: HttpRequest) -> HttpResponseBase:
+        response: HttpResponse
+        if self.is_template:
+            response = TemplateResponse(
+                request,
+                self.template_name,
+                self.context_data,
+                status=self.status,
+                using=self.using,
+            )
+        else:
+            response = HttpResponse(self.content, status=self.status)
+
+        for header, value in self.headers:
+            response[header] = value
+        return response
+
+
+def coalesce_requests(
+    view_func: Callable | None = None, *, key_func: CoalescingKeyFunc = default_coalescing_key
+) -> Any:
+    """View decorator that coalesces concurrent identical GET requests.
+
+    Only the first request calls the view and all identical requests that arrive in
+    the meantime share its response. Works for sync and async views. By default only
+    the requests of the same user are identical (see `default_coalescing_key`), pass
+    `key_func=permission_coalescing_key` to share the response of an expensive page
+    between users with the same permissions. The key must contain everything the
+    response depends on, as the view (including its permission checks) only runs for
+    the first request. The context data of a template response is shared, so
+    rendering the template must not modify it (like django-tables2 tables do). Other
+    responses must not contain per user data (like a CSRF token) and streaming
+    responses are never shared.
+    """
+
+    def decorator(view_func: Callable) -> Callable:
+        single_flight = SingleFlight[tuple[HttpResponseBase, _ResponseSnapshot]]()
+        view_name = f"{view_func.__module__}.{view_func.__qualname__}"
+
+        def share(
+            request: HttpRequest, result: tuple[HttpResponseBase, _ResponseSnapshot], shared: bool
+        ) -> HttpResponseBase | None:
+            response, snapshot = result
+            if not shared:
+                return response
+            if snapshot.streaming:
+                return None
+            coalesced_requests_counter.add(1, {"view": view_name})
+            return snapshot.to_response(request)
+
+        if iscoroutinefunction(view_func):
+
+            async def _async_view(request: HttpRequest, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view_func(request, *args, **kwargs)
+
+                async def call_view():
+                    response = await view_func(request, *args, **kwargs)
+                    return response, _ResponseSnapshot(response)
+
+                # The key function may query the database (e.g. for the permissions).
+                key = await sync_to_async(key_func)(request, await request.auser())
+                response = share(request, *await single_flight.ado(key, call_view))
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                return response
+
+            view = wraps(view_func)(_async_view)
+            markcoroutinefunction(view)
+            return view
+
+        @wraps(view_func)
+        def _view(request: HttpRequest, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view_func(request, *args, **kwargs)
+
+            def call_view():
+                response = view_func(request, *args, **kwargs)
+                return response, _ResponseSnapshot(response)
+
+            key = key_func(request, request.user)
+            response = share(request, *single_flight.do(key, call_view))
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            return response
+
+        return _view
+
+    if view_func is not None:
+        return decorator(view_func)
+    return decorator
@@ -0,0 +1,40 @@
+from collections.abc import Sequence
+
+import django_filters
+from django.db.models import Q, QuerySet
+from django_filters.constants import EMPTY_VALUES
+
+
+class TrigramSearchFilter(django_filters.CharFilter):
+    """A case insensitive substring search over one or multiple text fields.
+
+    A leading wildcard search can't use a regular index and so scans the whole
+    table. Each searched field should therefore have a trigram index (see
+    `common.utils.migration_utils.trigram_index`) that PostgreSQL uses for the
+    `icontains` lookups of this filter. By default the field of the filter is
+    searched, but multiple fields can be provided by `search_fields` (which are
+    then combined by OR).
+    """
+
+    def __init__(self, *args, search_fields: Sequence[str] | None = None, **kwargs):
+        kwargs.setdefault("lookup_expr", "icontains")
+        super().__init__(*args, **kwargs)
+        self.search_fields = search_fields
+
+    def filter(self, qs: QuerySet, value: str | None) -> QuerySet:
+        if value in EMPTY_VALUES:
+            return qs
+
+        assert value is not None
+        value = value.strip()
+        if not value:
+            return qs
+
+        query = Q()
+        for field_name in self.search_fields or [self.field_name]:
+            query |= Q(**{f"{field_name}__{self.lookup_expr}": value})
+
+        qs = self.get_method(qs)(query)
+        if self.distinct:
+            qs = qs.distinct()
+        return qs
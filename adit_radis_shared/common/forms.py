@@ -1,38 +1,110 @@
+from collections.abc import Callable, Mapping
+from typing import Any
+
 from crispy_forms.bootstrap import FieldWithButtons
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Div, Field, Hidden, Layout, Submit
 from django import forms
+from django.contrib.auth.models import Group
 from django.http.request import QueryDict
 
 from adit_radis_shared.accounts.models import User
 
+from .models import BroadcastAudience
+
 
 class RecipientsField(forms.ModelMultipleChoiceField):
     def label_from_instance(self, obj: User):
         return f"{obj.username} <{obj.email}>"
 
 
+class UserSearchSelectMultiple(forms.SelectMultiple):
+    """A multiple select of users that is filled by a server side search.
+
+    Only the selected users are rendered as options (instead of all users of the
+    site), further users are searched by an htmx request to `search_url` (see
+    `BroadcastView`) that replaces the options by the selected and matching users.
+    """
+
+    template_name = "common/widgets/user_search_select.html"
+
+    def __init__(self, attrs=None, search_url: str = ""):
+        super().__init__(attrs)
+        self.search_url = search_url
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        field = getattr(choices, "field", None)
+        if field is not None:
+            selected = [pk for pk in value if str(pk).isdigit()]
+            self.choices = [
+                (user.pk, field.label_from_instance(user))
+                for user in field.queryset.filter(pk__in=selected)
+            ]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["search_url"] = self.search_url
+        return context
+
+
 class BroadcastForm(forms.Form):
-    recipients = RecipientsField(
+    audience = forms.ChoiceField(
         label="Recipients",
+        choices=BroadcastAudience.choices,
+        initial=BroadcastAudience.ACTIVE,
+        widget=forms.RadioSelect,
+    )
+    groups = forms.ModelMultipleChoiceField(
+        label="Groups",
+        queryset=Group.objects.order_by("name"),
+        required=False,
+    )
+    users = RecipientsField(
+        label="Users",
         queryset=User.objects.order_by("username"),
+        required=False,
+        widget=UserSearchSelectMultiple,
     )
     subject = forms.CharField(label="Subject", max_length=200)
     message = forms.CharField(label="Message", max_length=10000, widget=forms.Textarea)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields["recipients"].widget.attrs["size"] = 10
+        self.fields["users"].widget.attrs["size"] = 10
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data is None:
+            return cleaned_data
+
+        audience = cleaned_data.get("audience")
+        if audience == BroadcastAudience.GROUPS and not cleaned_data.get("groups"):
+            self.add_error("groups", "Select at least one group.")
+        elif audience == BroadcastAudience.USERS and not cleaned_data.get("users"):
+            self.add_error("users", "Select at least one user.")
+        return cleaned_data
 
 
 class SingleFilterFieldFormHelper(FormHelper):
-    """One filter of a model is rendered in a field with button form."""
+    """One filter of a model is rendered in a field with button form.
+
+    If `facet_counts` (a mapping of choice value to count, see `get_facet_counts`)
+    is provided the count is appended to each option of a choice field. It can also
+    be a function returning the mapping, so that the counts are only queried when
+    the form is rendered.
+    """
 
     def __init__(
         self,
         params: QueryDict | dict,
         field_name: str,
         button_label: str = "Filter",
+        facet_counts: Mapping[str, int] | Callable[[], Mapping[str, int]] | None = None,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -41,6 +113,7 @@ class SingleFilterFieldFormHelper(FormHelper):
         self.disable_csrf = True
 
         self.params = params
+        self.facet_counts = facet_counts
         self._field_name = field_name
         self._field = Field(field_name, css_class="form-control-sm")
 
@@ -65,7 +138,53 @@ class SingleFilterFieldFormHelper(FormHelper):
                 hidden_fields.append(Hidden(key, self.params.get(key)))
 
     def render_layout(self, form: forms.Form, *args, **kwargs):
-        if isinstance(form.fields.get(self._field_name), forms.ChoiceField):
+        field = form.fields.get(self._field_name)
+        if not isinstance(field, forms.ChoiceField):
+            return self.layout.render(form, *args, **kwargs)
+
+        if "form-select" not in self._field.attrs["class"]:
             self._field.attrs["class"] += " form-select form-select-sm"
 
-        return self.layout.render(form, *args, **kwargs)
+        if self.facet_counts is None:
+            return self.layout.render(form, *args, **kwargs)
+
+        # The labels with the counts are only used for this rendering, so that
+        # rendering the form again doesn't add the counts twice.
+        choices = field.choices
+        field.choices = self._add_facet_counts(choices)
+        try:
+            return self.layout.render(form, *args, **kwargs)
+        finally:
+            field.choices = choices
+
+    def _add_facet_counts(self, choices) -> list[tuple[Any, str]]:
+        facet_counts = self.facet_counts
+        if callable(facet_counts):
+            facet_counts = facet_counts()
+        assert facet_counts is not None
+
+        labeled_choices: list[tuple[Any, str]] = []
+        for value, label in choices:
+            if value in ("", None):
+                count = sum(facet_counts.values())
+            else:
+                count = facet_counts.get(str(value), 0)
+            labeled_choices.append((value, f"{label} ({count})"))
+        return labeled_choices
+
+
+class SearchFieldFormHelper(SingleFilterFieldFormHelper):
+    """A search field (e.g. of a `TrigramSearchFilter`) rendered in a field with button form."""
+
+    def __init__(
+        self,
+        params: QueryDict | dict,
+        field_name: str,
+        button_label: str = "Search",
+        placeholder: str = "Search",
+        **kwargs,
+    ):
+        super().__init__(params, field_name, button_label=button_label, **kwargs)
+
+        self._field.attrs["placeholder"] = placeholder
+        self._field.attrs["type"] = "search"
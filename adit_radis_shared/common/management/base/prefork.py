@@ -0,0 +1,240 @@
+import logging
+import os
+import select
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Callable
+
+from django import db
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkSupervisor:
+    """Forks a number of worker processes and keeps them running.
+
+    The workers are forked from the (already set up) Django process, so that the
+    loaded code is shared copy-on-write instead of every worker booting Django on
+    its own. A worker that dies is replaced by a new one (after `restart_delay`
+    seconds if it died right after it was started to not end up in a crash loop).
+
+    A worker can ask to be recycled (see `request_recycle`), then a replacement is
+    started right away while the old worker finishes its work and exits.
+
+    `run` blocks until all workers are gone and must be called from a thread that
+    is allowed to fork (so there shouldn't be other threads holding locks). `stop`
+    may be called from any thread (e.g. a signal handler).
+    """
+
+    def __init__(
+        self,
+        target: Callable[[int], int | None],
+        processes: int,
+        *,
+        name: str = "worker",
+        restart_delay: float = 1.0,
+        shutdown_timeout: float = 30.0,
+    ) -> None:
+        """
+        Args:
+            target: Is called in the forked worker with the index of the worker (from
+                0 to processes - 1) and may return an exit code.
+            processes: The number of worker processes to keep running.
+            name: The name of the workers (used for logging).
+            restart_delay: Seconds to wait before restarting a worker that crashed
+                right after it was started.
+            shutdown_timeout: Seconds to wait for the workers to exit on `stop` before
+                they are killed.
+        """
+        if processes < 1:
+            raise ValueError("At least one worker process is needed.")
+
+        self.target = target
+        self.processes = processes
+        self.name = name
+        self.restart_delay = restart_delay
+        self.shutdown_timeout = shutdown_timeout
+
+        self.restarts = 0
+        self.recycles = 0
+        self._workers: dict[int, tuple[int, float]] = {}  # pid -> (index, start time)
+        self._retiring: set[int] = set()
+        # The workers tell the supervisor by this pipe that they want to be recycled.
+        self._recycle_read_fd, self._recycle_write_fd = os.pipe()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+        self._stopped.set()
+        self._exit_code = 0
+
+    @property
+    def exit_code(self) -> int:
+        """See `run`."""
+        return self._exit_code
+
+    @property
+    def pids(self) -> list[int]:
+        with self._lock:
+            return list(self._workers)
+
+    def spawn(self, index: int) -> int:
+        """Fork a new worker with the given index and return its pid."""
+        # Database connections must not be shared between processes.
+        db.connections.close_all()
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(index)
+
+        with self._lock:
+            self._workers[pid] = (index, time.monotonic())
+        if self._stopping.is_set():
+            # Stopped while forking, so the new worker missed the signal.
+            os.kill(pid, signal.SIGTERM)
+        logger.info("Started %s %d with pid %d.", self.name, index, pid)
+        return pid
+
+    def _run_worker(self, index: int) -> None:
+        os.close(self._recycle_read_fd)
+
+        # The forked worker inherits the signal handlers of the supervising server
+        # command. It should just die on those signals (unless the target installs
+        # its own handlers to shut down gracefully).
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        exit_code = 1
+        try:
+            exit_code = self.target(index) or 0
+        except SystemExit as err:
+            exit_code = err.code if isinstance(err.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def run(self) -> int:
+        """Start the workers and supervise them until `stop` is called.
+
+        Returns the exit code of the supervisor, which is 0 if all workers exited
+        cleanly on shutdown and otherwise the exit code of the first worker that
+        didn't.
+        """
+        if self._stopping.is_set():
+            return 0
+
+        self._stopped.clear()
+        try:
+            for index in range(self.processes):
+                if self._stopping.is_set():
+                    break
+                self.spawn(index)
+
+            while self._reap_exited():
+                readable, _, _ = select.select([self._recycle_read_fd], [], [], 0.5)
+                if readable:
+                    self._handle_recycle_requests()
+        finally:
+            self._stopped.set()
+
+        return self._exit_code
+
+    def _reap_exited(self) -> bool:
+        """Reap all exited workers and return if there are still workers running."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return False
+            if pid == 0:
+                return True
+            self._reap(pid, status)
+
+    def request_recycle(self) -> None:
+        """Ask the supervisor to replace this worker (only to be called in a worker).
+
+        The replacement is started right away, the calling worker should then finish
+        its work and exit.
+        """
+        os.write(self._recycle_write_fd, f"{os.getpid()}\n".encode())
+
+    def _handle_recycle_requests(self) -> None:
+        # Messages are shorter than PIPE_BUF, so the writes of the workers are atomic.
+        data = os.read(self._recycle_read_fd, 4096).decode()
+        for line in data.split():
+            pid = int(line)
+            with self._lock:
+                worker = self._workers.get(pid)
+            if worker is None or pid in self._retiring or self._stopping.is_set():
+                continue
+            self._retiring.add(pid)
+            self.recycles += 1
+            logger.info("Recycling %s %d (pid %d).", self.name, worker[0], pid)
+            self.spawn(worker[0])
+
+    def _reap(self, pid: int, status: int) -> None:
+        with self._lock:
+            worker = self._workers.pop(pid, None)
+        if worker is None:
+            return
+
+        index, started = worker
+        exit_code = os.waitstatus_to_exitcode(status)
+
+        if pid in self._retiring:
+            self._retiring.discard(pid)
+            if exit_code != 0:
+                logger.warning(
+                    "Recycled %s %d (pid %d) exited with %d.", self.name, index, pid, exit_code
+                )
+            return
+
+        if self._stopping.is_set():
+            # Being terminated by the shutdown signal is a clean exit, too.
+            if exit_code not in (0, -signal.SIGTERM, -signal.SIGINT) and not self._exit_code:
+                self._exit_code = exit_code if exit_code > 0 else 128 - exit_code
+            logger.info("%s %d (pid %d) exited with %d.", self.name, index, pid, exit_code)
+            return
+
+        logger.warning(
+            "%s %d (pid %d) exited unexpectedly with %d. Restarting it.",
+            self.name,
+            index,
+            pid,
+            exit_code,
+        )
+        if time.monotonic() - started < self.restart_delay:
+            self._stopping.wait(self.restart_delay)
+        if not self._stopping.is_set():
+            self.restarts += 1
+            self.spawn(index)
+
+    def stop(self, sig: int = signal.SIGTERM) -> None:
+        """Send the workers a signal to stop and wait until they exited.
+
+        Workers that are still running after `shutdown_timeout` seconds are killed.
+        """
+        self._stopping.set()
+        self._signal_workers(sig)
+
+        if self._stopped.wait(self.shutdown_timeout):
+            return
+
+        logger.warning("Killing %s processes that did not stop in time.", self.name)
+        self._signal_workers(signal.SIGKILL)
+        self._stopped.wait(5)
+
+    def _signal_workers(self, sig: int) -> None:
+        for pid in self.pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
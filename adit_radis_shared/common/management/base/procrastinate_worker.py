@@ -1,19 +1,80 @@
+import asyncio
+import itertools
 import logging
+import os
 import shlex
+import signal
 import subprocess
+import sys
+import threading
+from typing import Any
 
-from .server_command import ServerCommand
+from opentelemetry import metrics
+from procrastinate import App
+from procrastinate.contrib.django import app
+
+from ....telemetry import is_telemetry_active
+from ...utils.queue_metrics import record_job_metrics, register_queue_metrics
+from ...utils.worker_utils import (
+    ConcurrencyAutoscaler,
+    fetch_queue_stats,
+    get_rss,
+    on_job_finished,
+    wrap_task_funcs,
+)
+from .prefork import PreforkSupervisor
+from .server_command import AsyncServerCommand
 
 logger = logging.getLogger(__name__)
 
+meter = metrics.get_meter(__name__)
+
+concurrency_counter = meter.create_up_down_counter(
+    "procrastinate.worker.concurrency",
+    unit="{job}",
+    description="Number of jobs an in-process worker processes concurrently.",
+)
+
+
+class ProcrastinateServerCommand(AsyncServerCommand):
+    """Starts a Procrastinate worker.
+
+    By default the worker runs in a subprocess (`./manage.py procrastinate worker`).
+    With `--in-process` it runs in the event loop of this command instead, so that
+    Django is only booted once and only one interpreter is held in memory (which
+    roughly halves the memory and the startup time of the worker). With
+    `--processes` multiple in-process workers are forked (so CPU bound jobs can use
+    multiple cores) and supervised by this command.
+    """
 
-class ProcrastinateServerCommand(ServerCommand):
     help = "Starts a Procrastinate worker"
     server_name = "Procrastinate worker"
     worker_process: subprocess.Popen | None
+    worker_task: asyncio.Task | None
+    supervisor: PreforkSupervisor | None
+
+    # Seconds to wait for running jobs to finish when shutting down the in-process
+    # worker (afterwards they are cancelled).
+    shutdown_graceful_timeout: float = 30
+
+    # Autoscaling (see `ConcurrencyAutoscaler`): The queues are sampled every
+    # `autoscale_interval` seconds, the concurrency is raised when a job waits longer
+    # than `autoscale_up_wait` seconds and lowered after `autoscale_down_samples`
+    # samples with empty queues.
+    autoscale_interval: float = 10
+    autoscale_up_wait: float = 5
+    autoscale_down_samples: int = 6
+
+    # Seconds between the checks of the memory limit of a worker process (the job
+    # limit is also checked after each job).
+    recycle_check_interval: float = 10
 
     def __init__(self, *args, **kwargs):
         self.worker_process = None
+        self.worker_task = None
+        self.supervisor = None
+        self._worker_done = threading.Event()
+        self._in_worker_process = False
         super().__init__(*args, **kwargs)
 
     def add_arguments(self, parser):
@@ -37,7 +98,38 @@ class ProcrastinateServerCommand(ServerCommand):
             "--concurrency",
             type=int,
             default=1,
-            help="Number of child processes processing the queue (defaults to number of CPUs).",
+            help=(
+                "Number of jobs that are processed concurrently "
+                "(the minimum when autoscaling with --max-concurrency)."
+            ),
+        )
+        parser.add_argument(
+            "--max-concurrency",
+            type=int,
+            default=None,
+            help=(
+                "Autoscale the concurrency between --concurrency and this maximum "
+                "depending on the waiting jobs (implies --in-process)."
+            ),
+        )
+        parser.add_argument(
+            "-p",
+            "--processes",
+            type=int,
+            default=1,
+            help="Number of worker processes that are forked (implies --in-process).",
+        )
+        parser.add_argument(
+            "--max-jobs-per-process",
+            type=int,
+            default=None,
+            help="Recycle a worker process after it processed this many jobs.",
+        )
+        parser.add_argument(
+            "--max-memory",
+            type=int,
+            default=None,
+            help="Recycle a worker process when its memory (RSS) exceeds this many MiB.",
         )
         parser.add_argument(
             "--delete-jobs",
@@ -45,8 +137,26 @@ class ProcrastinateServerCommand(ServerCommand):
             default="always",
             help="When to delete jobs from the queue.",
         )
+        parser.add_argument(
+            "--in-process",
+            action="store_true",
+            help="Run the worker in this process instead of a subprocess.",
+        )
 
     def run_server(self, **options):
+        if is_telemetry_active():
+            # Registered in this process only, so with multiple worker processes the
+            # jobs are sampled by the supervisor (see `register_queue_metrics`).
+            register_queue_metrics()
+
+        if options["processes"] > 1 or options["max_jobs_per_process"] or options["max_memory"]:
+            self.run_worker_processes(**options)
+            return
+
+        if options["in_process"] or options["max_concurrency"]:
+            super().run_server(**options)
+            return
+
         cmd = "./manage.py procrastinate"
 
         # https://procrastinate.readthedocs.io/en/stable/howto/basics/command_line.html
@@ -65,7 +175,216 @@ class ProcrastinateServerCommand(ServerCommand):
         self.worker_process = subprocess.Popen(shlex.split(cmd))
         self.worker_process.wait()
 
+    def run_worker_processes(self, **options):
+        """Fork the in-process workers and supervise them until the shutdown.
+
+        A worker process that reached its job or memory limit is recycled: The
+        supervisor starts its replacement while it finishes its running jobs.
+        """
+
+        def run_worker_process(index: int) -> None:
+            self._in_worker_process = True
+            super(ProcrastinateServerCommand, self).run_server(**options)
+
+        self.supervisor = PreforkSupervisor(
+            run_worker_process,
+            options["processes"],
+            name=self.server_name,
+            shutdown_timeout=self.shutdown_graceful_timeout + 10,
+        )
+        self.supervisor.run()
+
+    async def run_server_async(self, **options):
+        logging.getLogger("procrastinate").setLevel(options["loglevel"].upper())
+
+        queues = [queue for queue in options["queues"].split(",") if queue] or None
+        worker_options = {
+            "queues": queues,
+            "delete_jobs": options["delete_jobs"],
+            "shutdown_graceful_timeout": self.shutdown_graceful_timeout,
+            # Signals are handled by the server command (in the main thread).
+            "install_signal_handlers": False,
+        }
+        if is_telemetry_active():
+            # The options passed to the worker replace the worker defaults. Outermost,
+            # so that the job still carries the time of its defer (see `trace_job`).
+            worker_middleware = app.worker_defaults.get("worker_middleware") or []
+            worker_options["worker_middleware"] = [record_job_metrics, *worker_middleware]
+
+        # The Django connector can't be used by a worker (as it doesn't support
+        # LISTEN/NOTIFY), so the worker gets its own async connector (like the worker
+        # command of Procrastinate). How often the worker updates its heartbeat and
+        # when other workers are considered stalled is configured by the
+        # PROCRASTINATE_WORKER_DEFAULTS setting.
+        worker_connector = app.connector.get_worker_connector()  # type: ignore
+        try:
+            with app.replace_connector(worker_connector) as worker_app:
+                async with worker_app.open_async():
+                    await self._run_worker(worker_app, worker_options, **options)
+        finally:
+            self._worker_done.set()
+
+    async def _run_worker(self, worker_app: App, worker_options: dict[str, Any], **options):
+        if options["max_concurrency"]:
+            autoscaler = ConcurrencyAutoscaler(
+                options["concurrency"],
+                options["max_concurrency"],
+                scale_up_wait=self.autoscale_up_wait,
+                scale_down_samples=self.autoscale_down_samples,
+            )
+            worker = self._run_autoscaled(worker_app, autoscaler, worker_options)
+        else:
+            worker = worker_app.run_worker_async(
+                concurrency=options["concurrency"], **worker_options
+            )
+            concurrency_counter.add(
+                options["concurrency"], {"queues": str(worker_options["queues"])}
+            )
+
+        self.worker_task = asyncio.create_task(worker)
+        watch_task: asyncio.Task | None = None
+        if self._in_worker_process:
+            # A forked worker process handles the signals forwarded by the supervisor
+            # itself (in its event loop that runs in its only thread).
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                self.loop.add_signal_handler(sig, self.worker_task.cancel)
+
+            if options["max_jobs_per_process"] or options["max_memory"]:
+                watch_task = asyncio.create_task(
+                    self._watch_recycling(
+                        worker_app, options["max_jobs_per_process"], options["max_memory"]
+                    )
+                )
+
+        try:
+            await self.worker_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if watch_task:
+                watch_task.cancel()
+
+    async def _watch_recycling(
+        self, worker_app: App, max_jobs: int | None, max_memory: int | None
+    ) -> None:
+        """Recycle this worker process when it reached its job or memory limit."""
+        assert self.supervisor and self.worker_task
+
+        jobs = 0
+        job_finished = asyncio.Event()
+
+        def count_job() -> None:
+            nonlocal jobs
+            jobs += 1
+            job_finished.set()
+
+        def on_job() -> None:
+            # Sync jobs run in a thread of an executor.
+            self.loop.call_soon_threadsafe(count_job)
+
+        wrap_task_funcs(worker_app, on_job_finished(on_job))
+
+        while True:
+            try:
+                await asyncio.wait_for(job_finished.wait(), self.recycle_check_interval)
+            except TimeoutError:
+                pass
+            job_finished.clear()
+
+            if max_jobs and jobs >= max_jobs:
+                reason = f"processed {jobs} jobs"
+            elif max_memory and (rss := get_rss()) > max_memory * 1024 * 1024:
+                reason = f"uses {rss // (1024 * 1024)} MiB of memory"
+            else:
+                continue
+
+            logger.info("Recycling worker process %d as it %s.", os.getpid(), reason)
+            self.supervisor.request_recycle()
+            # Cancelling the worker lets it finish the running jobs first.
+            self.worker_task.cancel()
+            return
+
+    async def _run_autoscaled(
+        self, worker_app: App, autoscaler: ConcurrencyAutoscaler, worker_options: dict[str, Any]
+    ) -> None:
+        """Scale the number of job slots by the depth and wait time of the queues.
+
+        Each slot is a Procrastinate worker that processes one job at a time (the
+        concurrency of a worker can't be changed while it runs). A slot that is
+        removed is cancelled, which lets it finish its current job first.
+        """
+        queues: list[str] | None = worker_options["queues"]
+        attributes = {"queues": str(queues)}
+        slots: list[asyncio.Task] = []
+        stopping: set[asyncio.Task] = set()
+        counter = itertools.count(1)
+
+        def resize(target: int) -> None:
+            while len(slots) < target:
+                name = f"{self.server_name}-slot-{next(counter)}"
+                slots.append(
+                    asyncio.create_task(
+                        worker_app.run_worker_async(concurrency=1, name=name, **worker_options)
+                    )
+                )
+                concurrency_counter.add(1, attributes)
+            while len(slots) > target:
+                slot = slots.pop()
+                slot.cancel()
+                stopping.add(slot)
+                slot.add_done_callback(stopping.discard)
+                concurrency_counter.add(-1, attributes)
+
+        resize(autoscaler.minimum)
+        try:
+            while True:
+                await asyncio.sleep(self.autoscale_interval)
+
+                for slot in [slot for slot in slots if slot.done()]:
+                    slots.remove(slot)
+                    concurrency_counter.add(-1, attributes)
+                    if not slot.cancelled() and slot.exception():
+                        logger.error("Worker slot crashed.", exc_info=slot.exception())
+
+                try:
+                    stats = await fetch_queue_stats(worker_app.connector, queues)
+                except Exception:
+                    logger.exception("Failed to fetch the queue stats for autoscaling.")
+                    resize(max(len(slots), autoscaler.minimum))
+                    continue
+
+                target = autoscaler.decide(len(slots), stats)
+                if target != len(slots):
+                    logger.info(
+                        "Scaling worker concurrency from %d to %d (%d waiting jobs, %.1fs wait).",
+                        len(slots),
+                        target,
+                        stats.depth,
+                        stats.oldest_wait,
+                    )
+                resize(target)
+        finally:
+            resize(0)
+            await asyncio.gather(*stopping, return_exceptions=True)
+
     def on_shutdown(self):
-        assert self.worker_process
-        self.worker_process.terminate()
-        self.worker_process.wait()
+        if self.supervisor:
+            self.supervisor.stop()
+            if exit_code := self.supervisor.exit_code:
+                # Exit with the status of the failed worker (instead of the signal).
+                self.stderr.write(f"Worker processes exited with code {exit_code}.")
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+            return
+
+        if self.worker_process:
+            self.worker_process.terminate()
+            self.worker_process.wait()
+            return
+
+        # Cancelling the worker lets it finish its running jobs (up to the graceful
+        # timeout) before it stops.
+        if self.worker_task:
+            self.loop.call_soon_threadsafe(self.worker_task.cancel)
+            self._worker_done.wait(self.shutdown_graceful_timeout + 10)
@@ -12,6 +12,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from watchfiles import PythonFilter, watch
 
+from ....runtime_metrics import monitor_event_loop
 from ...utils.debounce import debounce
 
 
@@ -142,6 +143,7 @@ class AsyncServerCommand(ServerCommand, ABC):
     def run_server(self, **options):
         async def _run_server(**options):
             self.loop = asyncio.get_event_loop()
+            monitor_event_loop(self.loop, self.server_name)
             await self.run_server_async(**options)
 
         asyncio.run(_run_server(**options))
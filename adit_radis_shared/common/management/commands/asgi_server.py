@@ -0,0 +1,116 @@
+import os
+import socket
+import sys
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.utils.module_loading import import_string
+
+from ....runtime_metrics import monitor_event_loop
+from ..base.prefork import PreforkSupervisor
+from ..base.server_command import ServerCommand
+
+
+class Command(ServerCommand):
+    help = "Starts multiple Daphne ASGI worker processes that share one listening socket."
+    server_name = "ASGI server"
+
+    supervisor: PreforkSupervisor | None
+
+    def __init__(self, *args, **kwargs):
+        self.supervisor = None
+        super().__init__(*args, **kwargs)
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument("-b", "--bind", default="127.0.0.1", help="The address to bind to.")
+        parser.add_argument("-p", "--port", type=int, default=8000, help="The port to bind to.")
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (defaults to number of CPUs).",
+        )
+        parser.add_argument(
+            "--application",
+            default=None,
+            help="Dotted path of the ASGI application (defaults to settings.ASGI_APPLICATION).",
+        )
+        parser.add_argument(
+            "--proxy-headers",
+            action="store_true",
+            help="Use X-Forwarded-For and X-Forwarded-Port headers of a proxy in front.",
+        )
+        parser.add_argument(
+            "--backlog", type=int, default=2048, help="Size of the listening socket backlog."
+        )
+
+    def handle(self, *args, **options):
+        if ":" in options["bind"]:
+            raise CommandError("Only IPv4 addresses can be bound to.")
+        super().handle(*args, **options)
+
+    def run_server(self, **options):
+        # The application (and so Django with all apps) is loaded before forking,
+        # so that the workers share its memory copy-on-write.
+        application = import_string(options["application"] or settings.ASGI_APPLICATION)
+
+        # The socket is bound once and then inherited by all workers, so that the
+        # kernel distributes the incoming connections between them.
+        # The fd endpoint of Twisted can't be given the address family of the socket
+        # (it always adopts it as IPv4), so only IPv4 is supported.
+        sock = socket.create_server(
+            (options["bind"], options["port"]), family=socket.AF_INET, backlog=options["backlog"]
+        )
+        sock.set_inheritable(True)
+        endpoint = f"fd:fileno={sock.fileno()}"
+
+        def run_worker(index: int) -> None:
+            # Importing the Daphne server installs the Twisted reactor into a new event
+            # loop, which must happen in the forked process. The Daphne app already
+            # imported it in the supervisor, but then all workers would share the
+            # selector of its loop. So the server is imported again (like the test
+            # server of Daphne does).
+            sys.modules.pop("twisted.internet.reactor", None)
+            sys.modules.pop("daphne.server", None)
+            from daphne.server import Server, twisted_loop
+
+            # The reactor runs in this asyncio event loop (created by Daphne).
+            monitor_event_loop(twisted_loop, f"daphne-{index}")
+
+            Server(
+                application=application,
+                endpoints=[endpoint],
+                server_name=f"daphne-{index}",
+                proxy_forwarded_address_header=(
+                    "X-Forwarded-For" if options["proxy_headers"] else None
+                ),
+                proxy_forwarded_port_header=(
+                    "X-Forwarded-Port" if options["proxy_headers"] else None
+                ),
+                proxy_forwarded_proto_header=(
+                    "X-Forwarded-Proto" if options["proxy_headers"] else None
+                ),
+            ).run()
+
+        self.stdout.write(
+            f"Listening on {options['bind']}:{options['port']} "
+            f"with {options['workers']} worker processes."
+        )
+
+        self.supervisor = PreforkSupervisor(
+            run_worker, options["workers"], name="ASGI worker", shutdown_timeout=30
+        )
+        try:
+            exit_code = self.supervisor.run()
+        finally:
+            sock.close()
+
+        if exit_code:
+            self.stderr.write(f"ASGI workers exited with code {exit_code}.")
+
+    def on_shutdown(self):
+        if self.supervisor:
+            self.supervisor.stop()
@@ -1,33 +1,58 @@
-import asyncio
-
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from procrastinate.contrib.django import app
+
+from ...utils.worker_utils import retry_stalled_jobs
 
 
 class Command(BaseCommand):
     help = "Retry stalled jobs in the procrastinate queue."
 
-    async def handle_retry_stalled_jobs(self):
-        stalled_jobs = await app.job_manager.get_stalled_jobs()
-
-        priority: int = settings.STALLED_JOBS_RETRY_PRIORITY
-
-        stalled_jobs_num = 0
-        for job in stalled_jobs:
-            await app.job_manager.retry_job(job, priority=priority)
-            stalled_jobs_num += 1
-
-        return stalled_jobs_num
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-q", "--queue", default=None, help="Only retry the stalled jobs of this queue."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Maximum number of jobs that are retried in one transaction.",
+        )
+        parser.add_argument(
+            "--seconds-since-heartbeat",
+            type=float,
+            default=None,
+            help=(
+                "Seconds without a heartbeat after which a worker is considered stalled "
+                "(defaults to the stalled_worker_timeout of the workers)."
+            ),
+        )
 
     def handle(self, *args, **options):
         self.stdout.write("Retrying stalled jobs... ", ending="")
         self.stdout.flush()
 
-        stalled_jobs_num = asyncio.run(self.handle_retry_stalled_jobs())
+        seconds_since_heartbeat: float | None = options["seconds_since_heartbeat"]
+        if seconds_since_heartbeat is None:
+            # Only the jobs of workers that missed their heartbeats for longer than the
+            # workers themselves wait before they prune a stalled worker are retried.
+            worker_defaults = getattr(settings, "PROCRASTINATE_WORKER_DEFAULTS", None) or {}
+            seconds_since_heartbeat = float(worker_defaults.get("stalled_worker_timeout", 30))
+
+        priority: int = settings.STALLED_JOBS_RETRY_PRIORITY
+        retried = retry_stalled_jobs(
+            priority=priority,
+            queue=options["queue"],
+            batch_size=options["batch_size"],
+            seconds_since_heartbeat=seconds_since_heartbeat,
+        )
+
+        stalled_jobs_num = sum(retried.values())
         if stalled_jobs_num == 0:
             self.stdout.write("No stalled jobs found")
         elif stalled_jobs_num == 1:
             self.stdout.write("Found 1 stalled job")
         else:
             self.stdout.write(f"Found {stalled_jobs_num} stalled jobs")
+
+        for (queue_name, task_name), count in sorted(retried.items()):
+            self.stdout.write(f"  {queue_name}: {task_name} ({count})")
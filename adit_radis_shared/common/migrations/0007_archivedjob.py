@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0006_outboxmail"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("job_id", models.BigIntegerField(db_index=True)),
+                ("queue_name", models.CharField(max_length=128)),
+                ("task_name", models.CharField(max_length=128)),
+                ("status", models.CharField(max_length=32)),
+                ("args", models.JSONField(default=dict)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("events", models.JSONField(default=list)),
+                ("finished_at", models.DateTimeField(db_index=True)),
+                ("archived_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "verbose_name_plural": "Archived jobs",
+            },
+        ),
+    ]
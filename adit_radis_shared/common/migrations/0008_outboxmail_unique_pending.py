@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("common", "0007_archivedjob"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboxmail",
+            name="dedup_key",
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name="outboxmail",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("next_attempt__isnull", False)),
+                fields=("dedup_key",),
+                name="unique_pending_outbox_mail",
+            ),
+        ),
+    ]
@@ -1,13 +1,18 @@
+from collections.abc import Hashable, Iterable
 from typing import Any, Protocol
 
-from django.core.exceptions import SuspiciousOperation
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import QuerySet
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AbstractBaseUser, AnonymousUser
+from django.core.exceptions import FieldDoesNotExist, SuspiciousOperation
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Model, QuerySet
 from django.http import HttpRequest, HttpResponseBase
 from django.views.generic import TemplateView
 from django_filters.filterset import FilterSet
 from django_filters.views import FilterMixin
+from django_tables2 import Column, Table
 
+from .decorators import coalesce_requests, default_coalescing_key
 from .models import AppSettings
 from .types import HtmxHttpRequest
 from .utils.auth_utils import is_logged_in_user
@@ -112,40 +117,48 @@ class RelatedFilterMixin(FilterMixin):
         return context
 
 
-class PageSizeSelectMixinProtocol(ViewProtocol, Protocol):
+class PageSizesProtocol(Protocol):
     paginate_by: int
     page_sizes: list[int]
 
 
+class PageSizeSelectMixinProtocol(PageSizesProtocol, ViewProtocol, Protocol):
+    pass
+
+
 class PageSizeSelectMixin:
     """A mixin to show a page size selector."""
 
     def get(
         self: PageSizeSelectMixinProtocol, request: HttpRequest, *args: Any, **kwargs: Any
     ) -> HttpResponseBase:
-        # Make the initial paginate_by attribute the default page size if set
-        if not hasattr(self, "paginate_by") or self.paginate_by is None:
-            self.paginate_by = 50
-
-        try:
-            per_page = int(request.GET.get("per_page", self.paginate_by))
-        except ValueError:
-            per_page = self.paginate_by
-
-        per_page = min(per_page, 100)
-        self.paginate_by = per_page  # used by MultipleObjectMixin and django-tables2
-
+        self.paginate_by = _get_page_size(self, request)
         return super().get(request, *args, **kwargs)
 
     def get_context_data(self: PageSizeSelectMixinProtocol, **kwargs):
         context = super().get_context_data(**kwargs)
+        context["page_sizes"] = _get_page_sizes(self)
+        return context
 
-        if not hasattr(self, "page_sizes") or self.page_sizes is None:
-            self.page_sizes = [25, 50, 100, 250, 500]
 
-        context["page_sizes"] = self.page_sizes
+def _get_page_size(view: PageSizesProtocol, request: HttpRequest) -> int:
+    # Make the initial paginate_by attribute the default page size if set
+    if not hasattr(view, "paginate_by") or view.paginate_by is None:
+        view.paginate_by = 50
 
-        return context
+    try:
+        per_page = int(request.GET.get("per_page", view.paginate_by))
+    except ValueError:
+        per_page = view.paginate_by
+
+    # used by MultipleObjectMixin and django-tables2
+    return min(per_page, 100)
+
+
+def _get_page_sizes(view: PageSizesProtocol) -> list[int]:
+    if not hasattr(view, "page_sizes") or view.page_sizes is None:
+        view.page_sizes = [25, 50, 100, 250, 500]
+    return view.page_sizes
 
 
 class RelatedPaginationMixinProtocol(ViewProtocol, Protocol):
@@ -198,3 +211,331 @@ class RelatedPaginationMixin:
         context["page_obj"] = paginated_queryset
 
         return context
+
+
+def project_queryset_for_table(
+    queryset: QuerySet,
+    table_class: type[Table],
+    exclude: Iterable[str] = (),
+    extra_fields: Iterable[str] = (),
+) -> QuerySet:
+    """Restrict a queryset to what the visible columns of a table actually render.
+
+    Every visible column accessor is resolved against the model of the queryset.
+    Concrete fields end up in `.only()`, forward foreign keys and one-to-one
+    relations in `select_related()` and many-to-many or reverse relations in
+    `prefetch_related()`. A relation that is rendered itself (and not only one
+    of its fields) is fetched completely as its `__str__` may use any field.
+    If an accessor can't be resolved to a model field (e.g. a model method or
+    property) the field projection is skipped, but the related objects are
+    still joined or prefetched.
+    """
+    model: type[Model] = queryset.model
+    assert model._meta.pk
+
+    only_fields: set[str] = {model._meta.pk.name, *extra_fields}
+    full_relations: set[str] = set()
+    select_related: set[str] = set()
+    prefetch_related: set[str] = set()
+    projectable = True
+
+    # Set by the metaclass of the table, so unknown to type checkers.
+    base_columns: dict[str, Column] = getattr(table_class, "base_columns")
+    for name, column in base_columns.items():
+        if name in exclude or not column.visible:
+            continue
+
+        accessor = str(column.accessor or name).replace(".", "__")
+        bits = accessor.split("__")
+        current_model = model
+        path: list[str] = []
+        for index, bit in enumerate(bits):
+            try:
+                field = current_model._meta.get_field(bit)
+            except FieldDoesNotExist:
+                projectable = False
+                break
+
+            path.append(bit)
+            lookup = "__".join(path)
+
+            if not field.is_relation:
+                # Remaining bits (if any) are resolved on the field value itself
+                # (e.g. a key of a JSONField), so the field is all we need.
+                only_fields.add(lookup)
+                break
+
+            if field.many_to_many or field.one_to_many:
+                prefetch_related.add(lookup)
+                break
+
+            select_related.add(lookup)
+            only_fields.add(lookup)
+            if index == len(bits) - 1:
+                full_relations.add(lookup)
+            related_model = field.related_model
+            assert related_model and not isinstance(related_model, str)
+            current_model = related_model
+
+    if select_related:
+        queryset = queryset.select_related(*sorted(select_related))
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*sorted(prefetch_related))
+
+    if projectable:
+        # Sub fields of a relation that is rendered completely must not restrict
+        # the fields fetched for that relation.
+        only_fields = {
+            field
+            for field in only_fields
+            if not any(field.startswith(f"{relation}__") for relation in full_relations)
+        }
+        queryset = queryset.only(*sorted(only_fields))
+
+    return queryset
+
+
+class ColumnProjectionMixinProtocol(ViewProtocol, Protocol):
+    projection_extra_fields: list[str]
+
+    def get_table_class(self) -> type[Table]: ...
+
+    def get_table_data(self) -> Any: ...
+
+    def get_table_kwargs(self) -> dict[str, Any]: ...
+
+
+class ColumnProjectionMixin:
+    """A mixin that only fetches the data the visible table columns need.
+
+    It derives `.only()`, `select_related()` and `prefetch_related()` from the
+    columns of the django-tables2 table so that no unused model fields are loaded
+    and related columns don't trigger a query per row. Fields that are needed
+    elsewhere (e.g. by `get_absolute_url()` of a linkified column) can be added
+    with `projection_extra_fields`.
+    It must be placed in front of SingleTableMixin.
+    """
+
+    projection_extra_fields: list[str] = []
+
+    def get_table_data(self: ColumnProjectionMixinProtocol):
+        data = super().get_table_data()
+        if not isinstance(data, QuerySet):
+            return data
+
+        return project_queryset_for_table(
+            data,
+            self.get_table_class(),
+            exclude=self.get_table_kwargs().get("exclude") or (),
+            extra_fields=self.projection_extra_fields,
+        )
+
+
+class AsyncPaginator(Paginator):
+    """A paginator that counts and fetches the page of a queryset with the async ORM.
+
+    In contrast to the `AsyncPaginator` of Django (6.0+) the paginator and its pages
+    keep the sync interface (like `count` or `has_next`) that the pagination
+    templates use, only the queries are done by the async ORM.
+    """
+
+    object_list: QuerySet
+
+    async def acount(self) -> int:
+        if "count" not in self.__dict__:
+            # Populate the cached property, so that all the sync (non query) methods
+            # of the paginator (like num_pages or validate_number) can be used.
+            self.__dict__["count"] = await self.object_list.acount()
+        return self.count
+
+    async def apage(self, number: int | str) -> Page:
+        await self.acount()
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        objects = [obj async for obj in self.object_list[bottom:top]]
+        return Page(objects, number, self)
+
+    async def aget_page(self, number: int | str | None) -> Page:
+        """Return a valid page, even if the page argument isn't a number or isn't in range."""
+        try:
+            return await self.apage(number or 1)
+        except PageNotAnInteger:
+            return await self.apage(1)
+        except EmptyPage:
+            return await self.apage(self.num_pages)
+
+
+class AsyncViewProtocol(Protocol):
+    request: HttpRequest
+
+    async def dispatch(
+        self, request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> HttpResponseBase: ...
+
+    async def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponseBase: ...
+
+    async def aget_context_data(self, **kwargs: Any) -> dict[str, Any]: ...
+
+
+class AsyncLockedMixinProtocol(AsyncViewProtocol, Protocol):
+    settings_model: type[AppSettings]
+    section_name: str
+
+
+class AsyncLockedMixin:
+    """The async counterpart of `LockedMixin` to be used with async views."""
+
+    async def dispatch(
+        self: AsyncLockedMixinProtocol, request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> HttpResponseBase:
+        settings = await self.settings_model.aget()
+        user = await request.auser()
+
+        if settings.locked and not (is_logged_in_user(user) and user.is_superuser):
+            if request.method != "GET":
+                raise SuspiciousOperation()
+
+            # The template response is rendered later by the (async) request handler
+            return TemplateView.as_view(
+                template_name="common/section_locked.html",
+                extra_context={"section_name": self.section_name},
+            )(request)
+
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncPageSizeSelectMixinProtocol(PageSizesProtocol, AsyncViewProtocol, Protocol):
+    pass
+
+
+class AsyncPageSizeSelectMixin:
+    """The async counterpart of `PageSizeSelectMixin` to be used with async views."""
+
+    async def get(
+        self: AsyncPageSizeSelectMixinProtocol, request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> HttpResponseBase:
+        self.paginate_by = _get_page_size(self, request)
+        return await super().get(request, *args, **kwargs)
+
+    async def aget_context_data(self: AsyncPageSizeSelectMixinProtocol, **kwargs):
+        context = await super().aget_context_data(**kwargs)
+        context["page_sizes"] = _get_page_sizes(self)
+        return context
+
+
+class AsyncRelatedFilterMixinProtocol(AsyncViewProtocol, Protocol):
+    filterset: FilterSet
+    object_list: QuerySet
+
+    def get_strict(self) -> bool: ...
+
+    def get_filterset_class(self) -> type[FilterSet]: ...
+
+    def get_filterset(self, filterset_class: type[FilterSet]) -> FilterSet: ...
+
+    def get_filtered_queryset(self) -> QuerySet: ...
+
+
+class AsyncRelatedFilterMixin(FilterMixin):
+    """The async counterpart of `RelatedFilterMixin` to be used with async views.
+
+    The filtered queryset is only built here (the filterset and the validation of its
+    form may query the database, e.g. for model choice fields, and are therefore set
+    up in a thread), but it is evaluated later by the async ORM (e.g. by
+    `AsyncRelatedPaginationMixin`).
+    """
+
+    request: HttpRequest
+
+    def get_filter_queryset(self) -> QuerySet:
+        raise NotImplementedError("Must be implemented by the derived view.")
+
+    def get_filterset_kwargs(self, _):
+        return {
+            "data": self.request.GET or None,
+            "request": self.request,
+            "queryset": self.get_filter_queryset(),
+        }
+
+    def get_filtered_queryset(self: AsyncRelatedFilterMixinProtocol) -> QuerySet:
+        """Set up the filterset and return the filtered (but not yet evaluated) queryset."""
+        filterset_class = self.get_filterset_class()
+        self.filterset = self.get_filterset(filterset_class)
+
+        if not self.filterset.is_bound or self.filterset.is_valid() or not self.get_strict():
+            return self.filterset.qs
+
+        queryset = self.filterset.queryset
+        if queryset is not None:
+            return queryset.none()
+        return self.filterset.qs.none()
+
+    async def aget_context_data(self: AsyncRelatedFilterMixinProtocol, **kwargs):
+        context = await super().aget_context_data(**kwargs)
+
+        self.object_list = await sync_to_async(self.get_filtered_queryset)()
+
+        context["filter"] = self.filterset
+        context["object_list"] = self.object_list
+        return context
+
+
+class AsyncRelatedPaginationMixinProtocol(AsyncViewProtocol, Protocol):
+    paginate_by: int
+
+    def get_related_queryset(self) -> QuerySet: ...
+
+
+class AsyncRelatedPaginationMixin:
+    """The async counterpart of `RelatedPaginationMixin` to be used with async views.
+
+    The related queryset is counted and the requested page fetched by the async ORM.
+    If used in combination with `AsyncRelatedFilterMixin`, the `AsyncRelatedPaginationMixin`
+    must be inherited first."""
+
+    request: HttpRequest
+
+    def get_related_queryset(self) -> QuerySet:
+        raise NotImplementedError("You must implement this method")
+
+    async def aget_context_data(self: AsyncRelatedPaginationMixinProtocol, **kwargs):
+        context = await super().aget_context_data(**kwargs)
+
+        if "object_list" in context:
+            queryset = context["object_list"]
+        else:
+            queryset = self.get_related_queryset()
+
+        paginator = AsyncPaginator(queryset, self.paginate_by)
+        paginated_queryset = await paginator.aget_page(self.request.GET.get("page"))
+
+        context["object_list"] = paginated_queryset
+        context["paginator"] = paginator
+        context["is_paginated"] = paginated_queryset.has_other_pages()
+        context["page_obj"] = paginated_queryset
+
+        return context
+
+
+class CoalesceRequestsMixin:
+    """A mixin that coalesces concurrent identical GET requests (see `coalesce_requests`).
+
+    The requests are coalesced before the view is dispatched, so the key returned by
+    `get_coalescing_key()` must cover everything the permission checks and the
+    response of the view depend on. As the context data of a template response is
+    shared between the requests, rendering the template must not modify it.
+    """
+
+    @classmethod
+    def get_coalescing_key(
+        cls, request: HttpRequest, user: AbstractBaseUser | AnonymousUser
+    ) -> Hashable:
+        return default_coalescing_key(request, user)
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)  # type: ignore
+        return coalesce_requests(view, key_func=cls.get_coalescing_key)
@@ -1,4 +1,6 @@
+from django.core.mail import EmailMultiAlternatives
 from django.db import models
+from django.utils import timezone
 
 
 class ProjectSettings(models.Model):
@@ -33,3 +35,84 @@ class AppSettings(models.Model):
         # (see apps.py of the specific app)
         assert app_settings
         return app_settings
+
+    @classmethod
+    async def aget(cls) -> "AppSettings":
+        app_settings = await cls.objects.afirst()
+        assert app_settings
+        return app_settings
+
+
+class BroadcastAudience(models.TextChoices):
+    EVERYONE = "everyone", "Everyone"
+    ACTIVE = "active", "All active users"
+    GROUPS = "groups", "Members of selected groups"
+    USERS = "users", "Selected users"
+
+
+class OutboxMail(models.Model):
+    """An Email that is waiting to be sent by the `send_outbox_mails` task.
+
+    Mails are written to the outbox inside the transaction of the caller (so they
+    are only sent if that transaction commits) and deleted once they were sent.
+    """
+
+    subject = models.CharField(max_length=998)
+    text_content = models.TextField()
+    html_content = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    # A hash of the content, so the same mail is only queued once while it is pending
+    # (unique among the pending mails only, see Meta)
+    dedup_key = models.CharField(max_length=64)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # None if the mail should not be retried anymore (see last_error)
+    next_attempt = models.DateTimeField(null=True, default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = "Outbox mails"
+        constraints = [
+            # A mail that was given up must not block queueing the same mail again.
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=models.Q(next_attempt__isnull=False),
+                name="unique_pending_outbox_mail",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} {self.subject} [{self.pk}]"
+
+    def to_email_message(self) -> EmailMultiAlternatives:
+        message = EmailMultiAlternatives(
+            self.subject, self.text_content, self.from_email or None, self.recipients
+        )
+        if self.html_content:
+            message.attach_alternative(self.html_content, "text/html")
+        return message
+
+
+class ArchivedJob(models.Model):
+    """A finished Procrastinate job (with its events) that was pruned from the queue.
+
+    Archived (in bulk by SQL) by the `prune_job_history` task.
+    """
+
+    job_id = models.BigIntegerField(db_index=True)
+    queue_name = models.CharField(max_length=128)
+    task_name = models.CharField(max_length=128)
+    status = models.CharField(max_length=32)
+    args = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField(default=0)
+    # The events of the job as a list of {"type": ..., "at": ...} dicts
+    events = models.JSONField(default=list)
+    finished_at = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Archived jobs"
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__} {self.task_name} [{self.job_id}]"
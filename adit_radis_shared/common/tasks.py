@@ -1,25 +1,253 @@
 import logging
+import math
+from collections.abc import Iterable
+from datetime import timedelta
+from itertools import batched
+from smtplib import SMTPRecipientsRefused
 
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.core.management import call_command
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from procrastinate import RetryStrategy
 from procrastinate.contrib.django import app
+from procrastinate.types import JSONValue, TimeDeltaParams
+
+from adit_radis_shared.accounts.models import User
+
+from .models import BroadcastAudience, OutboxMail
+from .utils import worker_utils
 
 logger = logging.getLogger(__name__)
 
 
+def get_broadcast_recipients(
+    audience: str, group_ids: list[int] | None = None, user_ids: list[int] | None = None
+) -> QuerySet[User, str]:
+    """The (distinct) Email addresses of the users of a broadcast audience."""
+    users = User.objects.exclude(email="")
+    if audience == BroadcastAudience.ACTIVE:
+        users = users.filter(is_active=True)
+    elif audience == BroadcastAudience.GROUPS:
+        users = users.filter(groups__in=group_ids or [])
+    elif audience == BroadcastAudience.USERS:
+        users = users.filter(pk__in=user_ids or [])
+    elif audience != BroadcastAudience.EVERYONE:
+        raise ValueError(f"Invalid broadcast audience: {audience}")
+    return users.order_by("email").values_list("email", flat=True).distinct()
+
+
 @app.task
-def broadcast_mail(recipients: list[str], subject: str, message: str):
-    send_mail(subject, message, settings.SUPPORT_EMAIL, recipients)
-    logger.info("Successfully sent an Email to %d recipents.", len(recipients))
+def broadcast_mail(
+    subject: str,
+    message: str,
+    recipients: list[str] | None = None,
+    audience: str | None = None,
+    group_ids: list[int] | None = None,
+    user_ids: list[int] | None = None,
+):
+    """Fan out a broadcast Email into chunks that are sent by separate jobs.
+
+    This keeps each SMTP session below the recipient limits of the mail server,
+    lets multiple workers send in parallel and only retries the failed chunks.
+    The recipients are either passed explicitly or resolved here from an audience
+    (see `BroadcastAudience`) by streaming their Email addresses from the database.
+    """
+    chunk_size: int = getattr(settings, "BROADCAST_MAIL_CHUNK_SIZE", 50)
+
+    emails: Iterable[str]
+    if recipients is not None:
+        emails = recipients
+        total = len(recipients)
+    else:
+        assert audience is not None
+        queryset = get_broadcast_recipients(audience, group_ids, user_ids)
+        total = queryset.count()
+        emails = queryset.iterator(chunk_size=2000)
+
+    chunks = math.ceil(total / chunk_size)
+    for index, chunk in enumerate(batched(emails, chunk_size), start=1):
+        broadcast_mail_chunk.defer(
+            recipients=list(chunk), subject=subject, message=message, chunk=index, chunks=chunks
+        )
+
+    logger.info("Queued an Email to %d recipients in %d chunks.", total, chunks)
+
+
+@app.task(retry=RetryStrategy(max_attempts=5, exponential_wait=5))
+def broadcast_mail_chunk(
+    recipients: list[str], subject: str, message: str, chunk: int, chunks: int
+):
+    """Send a broadcast Email to a chunk of recipients over one SMTP connection.
+
+    Every recipient gets a separate message (so recipients don't see each other).
+    If the connection fails after some messages were already sent, the remaining
+    recipients are queued as a new job, so that nobody gets the Email twice (the
+    arguments of that job are the persisted progress of the chunk). Otherwise the
+    whole chunk is retried by Procrastinate.
+    """
+    sent = 0
+    refused: list[str] = []
+    try:
+        with get_connection() as connection:
+            for recipient in recipients:
+                email = EmailMessage(subject, message, settings.SUPPORT_EMAIL, [recipient])
+                try:
+                    connection.send_messages([email])
+                except SMTPRecipientsRefused:
+                    refused.append(recipient)
+                sent += 1
+    except Exception:
+        if not sent:
+            raise
+
+        remaining: list[JSONValue] = list(recipients[sent:])
+        if not remaining:
+            # Only closing the connection failed, all messages were already sent.
+            logger.warning(
+                "Closing the connection of broadcast chunk %d/%d failed.",
+                chunk,
+                chunks,
+                exc_info=True,
+            )
+        else:
+            logger.warning(
+                "Sending broadcast chunk %d/%d failed after %d recipients, "
+                "queued the remaining %d recipients.",
+                chunk,
+                chunks,
+                sent,
+                len(remaining),
+                exc_info=True,
+            )
+            schedule_in: TimeDeltaParams = {"seconds": 30}
+            broadcast_mail_chunk.configure(schedule_in=schedule_in).defer(
+                recipients=remaining, subject=subject, message=message, chunk=chunk, chunks=chunks
+            )
+            return
+
+    if refused:
+        logger.warning("Recipients refused by the mail server: %s", ", ".join(refused))
+
+    logger.info(
+        "Successfully sent broadcast chunk %d/%d to %d recipients.",
+        chunk,
+        chunks,
+        sent - len(refused),
+    )
+
+
+@app.task(queueing_lock="send_outbox_mails")
+def send_outbox_mails():
+    """Send the pending mails of the outbox (see `common.utils.mail.queue_mail`).
 
+    The task is deferred whenever a mail is queued, the mails whose (exponentially
+    backed off) retry is due are picked up by `retry_outbox_mails`. Mails are sent in
+    batches over one SMTP connection, which is only opened if some mail is due.
+    A batch is claimed in a short transaction (see `_claim_outbox_mails`) and sent
+    outside of it, so that no row locks are held while waiting for the mail server.
+    """
+    batch_size: int = getattr(settings, "MAIL_OUTBOX_BATCH_SIZE", 100)
+    max_attempts: int = getattr(settings, "MAIL_OUTBOX_MAX_ATTEMPTS", 10)
+    lease: float = getattr(settings, "MAIL_OUTBOX_LEASE", 600)
 
-@app.periodic(cron="*/10 * * * *")
+    mails = _claim_outbox_mails(batch_size, lease)
+    if not mails:
+        return
+
+    sent = 0
+    failed = 0
+    with get_connection() as connection:
+        while mails:
+            sent_ids: list[int] = []
+            for mail in mails:
+                try:
+                    connection.send_messages([mail.to_email_message()])
+                except Exception as err:
+                    failed += 1
+                    mail.attempts += 1
+                    mail.last_error = str(err)
+                    if mail.attempts >= max_attempts:
+                        mail.next_attempt = None
+                        logger.error("Giving up sending mail %s: %s", mail, err)
+                    else:
+                        backoff = min(60 * 2 ** (mail.attempts - 1), 3600)
+                        mail.next_attempt = timezone.now() + timedelta(seconds=backoff)
+                    mail.save(update_fields=["attempts", "last_error", "next_attempt"])
+                else:
+                    sent_ids.append(mail.pk)
+
+            OutboxMail.objects.filter(pk__in=sent_ids).delete()
+            sent += len(sent_ids)
+
+            mails = _claim_outbox_mails(batch_size, lease)
+
+    logger.info("Sent %d mails of the outbox, %d failed.", sent, failed)
+
+
+@app.periodic(cron="* * * * *")
+@app.task(queueing_lock="retry_outbox_mails")
+def retry_outbox_mails(timestamp: int):
+    """Send the mails of the outbox whose retry is due (see `send_outbox_mails`)."""
+    send_outbox_mails()
+
+
+def _claim_outbox_mails(batch_size: int, lease: float) -> list[OutboxMail]:
+    """Claim a batch of due mails by moving their next attempt behind a lease.
+
+    Other workers skip the claimed mails until the lease (in seconds) expires, so
+    the mails of a worker that dies while sending are picked up again later.
+    """
+    with transaction.atomic():
+        mails = list(
+            OutboxMail.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt__lte=timezone.now())
+            .order_by("next_attempt", "id")[:batch_size]
+        )
+        OutboxMail.objects.filter(pk__in=[mail.pk for mail in mails]).update(
+            next_attempt=timezone.now() + timedelta(seconds=lease)
+        )
+    return mails
+
+
+@app.periodic(cron="* * * * *")
 @app.task(queueing_lock="retry_stalled_jobs")
 def retry_stalled_jobs(timestamp: int):
+    """Retry the jobs of workers whose heartbeat expired.
+
+    As only the jobs of dead workers are retried (never slow jobs of workers that
+    are still alive) and the retry is a cheap set-based query, it runs every minute.
+    """
     call_command("retry_stalled_jobs")
 
 
+@app.periodic(cron=getattr(settings, "JOB_HISTORY_PRUNE_CRON", "15 * * * *"))
+@app.task(queueing_lock="prune_job_history")
+def prune_job_history(timestamp: int):
+    """Archive and delete the finished jobs (and their events) of the job queue.
+
+    Jobs are kept for JOB_HISTORY_MAX_AGE_DAYS days after they finished. As the task
+    runs every hour, each run only has to remove the jobs of one hour (in small
+    batches, see `prune_job_history` of the worker utils).
+    """
+    max_age_days: float = getattr(settings, "JOB_HISTORY_MAX_AGE_DAYS", 30)
+    report = worker_utils.prune_job_history(
+        max_age=max_age_days * 24 * 60 * 60,
+        batch_size=getattr(settings, "JOB_HISTORY_PRUNE_BATCH_SIZE", 500),
+        pause=getattr(settings, "JOB_HISTORY_PRUNE_PAUSE", 0.5),
+        archive=getattr(settings, "JOB_HISTORY_ARCHIVE", True),
+    )
+    logger.info(
+        "Pruned %d jobs and %d events (%d jobs archived) in %d batches.",
+        report.jobs,
+        report.events,
+        report.archived,
+        report.batches,
+    )
+
+
 @app.periodic(cron=getattr(settings, "BACKUP_CRON", "0 3 * * *"))
 @app.task(queueing_lock="backup_db")
 def backup_db(timestamp: int):
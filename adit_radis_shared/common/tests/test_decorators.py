@@ -0,0 +1,295 @@
+"""Tests for the view decorators in ``common.decorators`` and the underlying
+``SingleFlight`` helper.
+
+Concurrency is simulated with asyncio tasks (deterministic, as everything runs on
+one event loop) and with threads that block the first call on an event until the
+other calls joined it.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+from django.test import RequestFactory
+
+from adit_radis_shared.accounts.factories import UserFactory
+from adit_radis_shared.common.decorators import coalesce_requests, permission_coalescing_key
+from adit_radis_shared.common.utils.single_flight import SingleFlight
+from adit_radis_shared.common.utils.testing_helpers import add_permission
+
+
+def _request(path="/", method="get", user=None) -> Any:
+    request = getattr(RequestFactory(), method)(path)
+    request.user = user or AnonymousUser()
+
+    async def auser():
+        return request.user
+
+    request.auser = auser
+    return request
+
+
+# --- SingleFlight -----------------------------------------------------------
+
+
+def test_single_flight_shares_result_between_async_callers():
+    single_flight = SingleFlight[int]()
+    calls = 0
+
+    async def work() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def run():
+        return await asyncio.gather(*(single_flight.ado("key", work) for _ in range(3)))
+
+    results = asyncio.run(run())
+
+    assert calls == 1
+    assert results == [(42, False), (42, True), (42, True)]
+
+
+def test_single_flight_does_not_share_different_keys():
+    single_flight = SingleFlight[str]()
+
+    async def run():
+        async def work(value: str) -> str:
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(
+            single_flight.ado("a", lambda: work("a")), single_flight.ado("b", lambda: work("b"))
+        )
+
+    assert asyncio.run(run()) == [("a", False), ("b", False)]
+
+
+def test_single_flight_propagates_exception_to_async_callers():
+    single_flight = SingleFlight[int]()
+
+    async def work() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(
+            *(single_flight.ado("key", work) for _ in range(2)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_single_flight_cancelled_caller_does_not_cancel_the_others():
+    single_flight = SingleFlight[int]()
+    loop_errors: list[dict[str, Any]] = []
+
+    async def work() -> int:
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: loop_errors.append(context)
+        )
+        callers = [asyncio.ensure_future(single_flight.ado("key", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        callers[1].cancel()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    leader, cancelled, other = asyncio.run(run())
+
+    assert leader == (42, False)
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert other == (42, True)
+    # The leader could still set the result of the shared future.
+    assert loop_errors == []
+
+
+def test_single_flight_shares_result_between_threads():
+    single_flight = SingleFlight[int]()
+    started = threading.Event()
+    release = threading.Event()
+    calls = 0
+    results: list[tuple[int, bool]] = []
+
+    def work() -> int:
+        nonlocal calls
+        calls += 1
+        started.set()
+        release.wait(timeout=5)
+        return 42
+
+    def call():
+        results.append(single_flight.do("key", work))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(timeout=5)
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    time.sleep(0.1)  # give the followers time to join the leader
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert calls == 1
+    assert sorted(results) == [(42, False), (42, True), (42, True), (42, True)]
+
+
+def test_single_flight_releases_key_after_call():
+    single_flight = SingleFlight[int]()
+
+    assert single_flight.do("key", lambda: 1) == (1, False)
+    assert single_flight.do("key", lambda: 2) == (2, False)
+
+
+# --- coalesce_requests ------------------------------------------------------
+
+
+def test_coalesce_requests_shares_response_of_async_view():
+    calls = 0
+
+    @coalesce_requests
+    async def view(request):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        response = HttpResponse(b"expensive")
+        response["X-Custom"] = "yes"
+        return response
+
+    async def run():
+        return await asyncio.gather(*(view(_request()) for _ in range(3)))
+
+    with patch("adit_radis_shared.common.decorators.coalesced_requests_counter") as counter:
+        responses = async_to_sync(run)()
+
+    assert calls == 1
+    assert [response.content for response in responses] == [b"expensive"] * 3
+    assert all(response["X-Custom"] == "yes" for response in responses)
+    # Each request gets its own response object.
+    assert len({id(response) for response in responses}) == 3
+    assert counter.add.call_count == 2
+
+
+def test_coalesce_requests_does_not_coalesce_different_urls():
+    calls = 0
+
+    @coalesce_requests
+    async def view(request):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return HttpResponse(request.path)
+
+    async def run():
+        return await asyncio.gather(view(_request("/a/")), view(_request("/b/")))
+
+    responses = async_to_sync(run)()
+
+    assert calls == 2
+    assert [response.content for response in responses] == [b"/a/", b"/b/"]
+
+
+def test_coalesce_requests_recreates_template_response_for_each_request():
+    @coalesce_requests
+    async def view(request):
+        await asyncio.sleep(0.01)
+        return TemplateResponse(request, "example_app/example_list.html", {"foo": "bar"})
+
+    requests = [_request() for _ in range(2)]
+
+    async def run():
+        return await asyncio.gather(*(view(request) for request in requests))
+
+    responses = async_to_sync(run)()
+
+    for request, response in zip(requests, responses):
+        assert isinstance(response, TemplateResponse)
+        assert response._request is request
+        assert response.context_data == {"foo": "bar"}
+
+
+def test_coalesce_requests_passes_through_non_get_requests():
+    calls = 0
+
+    @coalesce_requests
+    def view(request):
+        nonlocal calls
+        calls += 1
+        return HttpResponse()
+
+    view(_request(method="post"))
+    view(_request(method="post"))
+
+    assert calls == 2
+
+
+def test_coalesce_requests_sync_view_returns_own_response_when_alone():
+    @coalesce_requests
+    def view(request):
+        return HttpResponse(b"ok")
+
+    response = view(_request())
+
+    assert response.content == b"ok"
+
+
+def _counting_view(**kwargs):
+    calls = 0
+
+    @coalesce_requests(**kwargs)
+    async def view(request):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return HttpResponse(b"secret")
+
+    def run(*users) -> int:
+        async def gather():
+            await asyncio.gather(*(view(_request(user=user)) for user in users))
+
+        async_to_sync(gather)()
+        return calls
+
+    return run
+
+
+@pytest.mark.django_db
+def test_coalesce_requests_does_not_share_between_users_by_default():
+    run = _counting_view()
+    alice = UserFactory.create()
+    bob = UserFactory.create()
+
+    assert run(alice, bob) == 2
+
+
+@pytest.mark.django_db
+def test_coalesce_requests_by_permissions_does_not_share_between_other_permissions():
+    run = _counting_view(key_func=permission_coalescing_key)
+    alice = UserFactory.create()
+    bob = UserFactory.create()
+    add_permission(bob, "token_authentication", "can_generate_never_expiring_token")
+
+    assert run(alice, bob) == 2
+
+
+@pytest.mark.django_db
+def test_coalesce_requests_by_permissions_shares_between_same_permissions():
+    run = _counting_view(key_func=permission_coalescing_key)
+    alice = UserFactory.create()
+    bob = UserFactory.create()
+
+    assert run(alice, bob) == 1
@@ -0,0 +1,58 @@
+"""Tests for the shared django-filter filters in ``common.filters``.
+
+The filters are exercised through small FilterSets over the ``example_app``'s
+``ExampleJob`` model.
+"""
+
+import django_filters
+import pytest
+
+from adit_radis_shared.common.filters import TrigramSearchFilter
+from example_project.example_app.factories import ExampleJobFactory
+from example_project.example_app.models import ExampleJob
+
+
+class _NameSearchFilter(django_filters.FilterSet):
+    name = TrigramSearchFilter()
+
+    class Meta:
+        model = ExampleJob
+        fields = ("name",)
+
+
+class _MultiFieldSearchFilter(django_filters.FilterSet):
+    q = TrigramSearchFilter(search_fields=["name", "status"])
+
+    class Meta:
+        model = ExampleJob
+        fields = ()
+
+
+@pytest.mark.django_db
+def test_trigram_search_filter_matches_case_insensitive_substring():
+    ExampleJobFactory.create(name="Kidney transfer")
+    ExampleJobFactory.create(name="Brain CT")
+
+    filterset = _NameSearchFilter(data={"name": "DNEY"}, queryset=ExampleJob.objects.all())
+
+    assert [job.name for job in filterset.qs] == ["Kidney transfer"]
+
+
+@pytest.mark.django_db
+def test_trigram_search_filter_ignores_blank_search():
+    ExampleJobFactory.create_batch(3)
+
+    filterset = _NameSearchFilter(data={"name": "   "}, queryset=ExampleJob.objects.all())
+
+    assert filterset.qs.count() == 3
+
+
+@pytest.mark.django_db
+def test_trigram_search_filter_combines_search_fields_with_or():
+    ExampleJobFactory.create(name="alpha", status=ExampleJob.Status.DONE)
+    ExampleJobFactory.create(name="do something", status=ExampleJob.Status.PENDING)
+    ExampleJobFactory.create(name="beta", status=ExampleJob.Status.PENDING)
+
+    filterset = _MultiFieldSearchFilter(data={"q": "do"}, queryset=ExampleJob.objects.all())
+
+    assert sorted(job.name for job in filterset.qs) == ["alpha", "do something"]
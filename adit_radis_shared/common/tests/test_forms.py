@@ -1,6 +1,6 @@
 """Tests for ``common.forms``.
 
-``BroadcastForm`` validates recipients against the User queryset; the
+``BroadcastForm`` validates the selected audience and its users or groups; the
 ``SingleFilterFieldFormHelper`` builds a crispy-forms layout that mirrors the
 current query params as hidden fields.
 """
@@ -15,8 +15,10 @@ from adit_radis_shared.accounts.factories import UserFactory
 from adit_radis_shared.common.forms import (
     BroadcastForm,
     RecipientsField,
+    SearchFieldFormHelper,
     SingleFilterFieldFormHelper,
 )
+from adit_radis_shared.common.models import BroadcastAudience
 
 
 @pytest.mark.django_db
@@ -24,26 +26,59 @@ def test_broadcast_form_valid_with_existing_recipient():
     user = UserFactory.create()
     form = BroadcastForm(
         data={
-            "recipients": [user.pk],
+            "audience": BroadcastAudience.USERS,
+            "users": [user.pk],
             "subject": "Hello",
             "message": "World",
         }
     )
     assert form.is_valid(), form.errors
-    assert list(form.cleaned_data["recipients"]) == [user]
+    assert list(form.cleaned_data["users"]) == [user]
 
 
 @pytest.mark.django_db
-def test_broadcast_form_invalid_without_recipients():
-    form = BroadcastForm(data={"subject": "Hi", "message": "There"})
+def test_broadcast_form_valid_for_everyone_without_selection():
+    form = BroadcastForm(
+        data={"audience": BroadcastAudience.EVERYONE, "subject": "Hi", "message": "There"}
+    )
+    assert form.is_valid(), form.errors
+
+
+@pytest.mark.django_db
+def test_broadcast_form_invalid_without_selected_users():
+    form = BroadcastForm(
+        data={"audience": BroadcastAudience.USERS, "subject": "Hi", "message": "There"}
+    )
     assert not form.is_valid()
-    assert "recipients" in form.errors
+    assert "users" in form.errors
 
 
 @pytest.mark.django_db
-def test_broadcast_form_recipients_widget_size_is_set():
+def test_broadcast_form_invalid_without_selected_groups():
+    form = BroadcastForm(
+        data={"audience": BroadcastAudience.GROUPS, "subject": "Hi", "message": "There"}
+    )
+    assert not form.is_valid()
+    assert "groups" in form.errors
+
+
+@pytest.mark.django_db
+def test_broadcast_form_users_widget_size_is_set():
     form = BroadcastForm()
-    assert form.fields["recipients"].widget.attrs["size"] == 10
+    assert form.fields["users"].widget.attrs["size"] == 10
+
+
+@pytest.mark.django_db
+def test_user_search_select_only_renders_selected_users():
+    selected = UserFactory.create(username="alice", email="alice@example.test")
+    UserFactory.create(username="bob")
+    form = BroadcastForm(data={"users": [selected.pk]})
+
+    html = str(form["users"])
+
+    assert "alice &lt;alice@example.test&gt;" in html
+    assert "bob" not in html
+    assert 'name="user_search"' in html
 
 
 @pytest.mark.django_db
@@ -106,3 +141,44 @@ def test_single_filter_helper_render_keeps_plain_class_for_char_field():
 
     # A non-choice field keeps only the form-control sizing class.
     assert "form-select" not in helper._field.attrs["class"]
+
+
+def test_single_filter_helper_appends_facet_counts_to_choices():
+    from django.template import Context
+
+    class _ChoiceFilterForm(forms.Form):
+        status = forms.ChoiceField(
+            choices=[("", "---------"), ("PE", "Pending"), ("DO", "Done")], required=False
+        )
+
+    facet_calls: list[bool] = []
+
+    def facet_counts() -> dict[str, int]:
+        facet_calls.append(True)
+        return {"PE": 2, "DO": 3}
+
+    helper = SingleFilterFieldFormHelper(QueryDict(""), "status", facet_counts=facet_counts)
+    form = _ChoiceFilterForm()
+
+    # The counts are only queried when the form is rendered.
+    assert facet_calls == []
+
+    first_html = helper.render_layout(form, Context({}))
+    second_html = helper.render_layout(form, Context({}))
+
+    for html in (first_html, second_html):
+        assert "--------- (5)" in html
+        assert "Pending (2)" in html
+        assert "Done (3)" in html
+    assert "(3) (3)" not in second_html
+    assert helper._field.attrs["class"].count("form-select ") == 1
+    # The field itself keeps its original choices.
+    choices = form.fields["status"].choices  # type: ignore[attr-defined]
+    assert list(choices) == [("", "---------"), ("PE", "Pending"), ("DO", "Done")]
+
+
+def test_search_field_helper_renders_search_input_with_placeholder():
+    helper = SearchFieldFormHelper(QueryDict("page=2"), "name", placeholder="Search jobs")
+
+    assert helper._field.attrs["placeholder"] == "Search jobs"
+    assert helper._field.attrs["type"] == "search"
@@ -5,25 +5,39 @@ combined with Django's ``RequestFactory``. Where a mixin needs real model data
 (pagination / filtering) the ``example_app``'s ``ExampleJob`` model is used.
 """
 
-from typing import Any
+from collections.abc import Awaitable, Callable
+from typing import Any, cast
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import SuspiciousOperation
+from django.db import connection
+from django.http import HttpRequest
+from django.http.response import HttpResponseBase
 from django.template.response import TemplateResponse
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.views.generic import DetailView, ListView
 from django_filters.views import FilterView
-from django_tables2 import SingleTableMixin
+from django_tables2 import ManyToManyColumn, SingleTableMixin, Table
 
-from adit_radis_shared.accounts.factories import AdminUserFactory
+from adit_radis_shared.accounts.factories import AdminUserFactory, GroupFactory, UserFactory
+from adit_radis_shared.accounts.models import User
 from adit_radis_shared.common.mixins import (
+    AsyncLockedMixin,
+    AsyncPageSizeSelectMixin,
+    AsyncRelatedFilterMixin,
+    AsyncRelatedPaginationMixin,
+    ColumnProjectionMixin,
     HtmxOnlyMixin,
     LockedMixin,
     PageSizeSelectMixin,
     RelatedFilterMixin,
     RelatedPaginationMixin,
+    project_queryset_for_table,
 )
+from adit_radis_shared.common.views import AsyncTemplateView
 from example_project.example_app.factories import ExampleJobFactory
 from example_project.example_app.filters import ExampleJobFilter
 from example_project.example_app.models import ExampleJob
@@ -332,3 +346,196 @@ def test_related_filter_kwargs_include_request_and_queryset():
     assert kwargs["request"] is request
     assert kwargs["data"] is not None
     assert kwargs["queryset"] is not None
+
+
+# --- ColumnProjectionMixin --------------------------------------------------
+
+
+class _UserTable(Table):
+    groups = ManyToManyColumn()
+
+    class Meta:
+        model = User
+        fields = ("username", "active_group", "groups")
+
+
+class _ColumnProjectionView(ColumnProjectionMixin, SingleTableMixin, ListView):
+    model = User
+    table_class = _UserTable
+    template_name = "example_app/example_list.html"
+    ordering = "id"
+
+
+def _count_table_queries(per_page: int) -> int:
+    request = RequestFactory().get("/")
+    request.user = AnonymousUser()
+    view = _ColumnProjectionView()
+    view.setup(request)
+    view.paginate_by = per_page
+    view.object_list = view.get_queryset()
+
+    with CaptureQueriesContext(connection) as context:
+        table = view.get_table()
+        table.as_html(request)
+
+    return len(context.captured_queries)
+
+
+def test_project_queryset_only_fetches_visible_columns():
+    queryset = project_queryset_for_table(ExampleJob.objects.all(), ExampleJobTable)
+
+    fields, defer = queryset.query.deferred_loading
+    assert defer is False
+    assert set(fields) == {"id", "name", "status"}
+
+
+def test_project_queryset_skips_excluded_columns():
+    queryset = project_queryset_for_table(
+        ExampleJob.objects.all(), ExampleJobTable, exclude=["status"]
+    )
+
+    fields, _ = queryset.query.deferred_loading
+    assert set(fields) == {"id", "name"}
+
+
+@pytest.mark.django_db
+def test_project_queryset_joins_and_prefetches_relations(django_assert_num_queries):
+    group = GroupFactory.create()
+    for _ in range(3):
+        user = UserFactory.create()
+        user.groups.add(group)
+        user.change_active_group(group)
+
+    queryset = project_queryset_for_table(User.objects.all(), _UserTable)
+
+    # The users joined with their active group and then the groups of all users.
+    with django_assert_num_queries(2):
+        for user in queryset:
+            assert user.active_group == group
+            assert list(user.groups.all()) == [group]
+    fields, _ = queryset.query.deferred_loading
+    assert set(fields) == {"id", "username", "active_group"}
+
+
+@pytest.mark.django_db
+def test_column_projection_query_count_independent_of_page_size():
+    for i in range(12):
+        group = GroupFactory.create(name=f"Group {i}")
+        user = UserFactory.create()
+        user.groups.add(group)
+        user.active_group = group
+        user.save()
+
+    assert _count_table_queries(per_page=2) == _count_table_queries(per_page=10)
+
+
+# --- Async mixins -----------------------------------------------------------
+#
+# The async views are driven by async_to_sync so that the async ORM runs in the
+# test thread and therefore sees the data of the (non transactional) test.
+
+
+class _AsyncFakeSettings(_FakeSettings):
+    @classmethod
+    async def aget(cls):
+        return cls
+
+
+class _AsyncLockedView(AsyncLockedMixin, AsyncTemplateView):
+    settings_model = _AsyncFakeSettings
+    section_name = "Example"
+    template_name = "example_app/example_list.html"
+
+
+def _call_async_view(view_class, request) -> HttpResponseBase:
+    # as_view() of an async view returns a coroutine function, but is typed as sync.
+    view = cast(Callable[[HttpRequest], Awaitable[HttpResponseBase]], view_class.as_view())
+    return async_to_sync(view)(request)
+
+
+def _async_request(query="", method="get", user=None) -> Any:
+    request = getattr(RequestFactory(), method)(f"/?{query}")
+    request.user = user or AnonymousUser()
+
+    async def auser():
+        return request.user
+
+    request.auser = auser
+    return request
+
+
+@pytest.mark.django_db
+def test_async_locked_mixin_passes_through_when_unlocked():
+    _AsyncFakeSettings.locked = False
+    response = _call_async_view(_AsyncLockedView, _async_request())
+
+    assert isinstance(response, TemplateResponse)
+    assert response.template_name == ["example_app/example_list.html"]
+
+
+@pytest.mark.django_db
+def test_async_locked_mixin_blocks_anonymous_get_with_locked_section():
+    _AsyncFakeSettings.locked = True
+    try:
+        response = _call_async_view(_AsyncLockedView, _async_request())
+
+        assert isinstance(response, TemplateResponse)
+        assert response.template_name == ["common/section_locked.html"]
+    finally:
+        _AsyncFakeSettings.locked = False
+
+
+@pytest.mark.django_db
+def test_async_locked_mixin_raises_on_non_get_when_locked():
+    _AsyncFakeSettings.locked = True
+    try:
+        with pytest.raises(SuspiciousOperation):
+            _call_async_view(_AsyncLockedView, _async_request(method="post"))
+    finally:
+        _AsyncFakeSettings.locked = False
+
+
+class _AsyncListView(
+    AsyncPageSizeSelectMixin,
+    AsyncRelatedPaginationMixin,
+    AsyncRelatedFilterMixin,
+    AsyncTemplateView,
+):
+    filterset_class = ExampleJobFilter
+    template_name = "example_app/example_list.html"
+    strict = False
+
+    def get_filter_queryset(self):
+        return ExampleJob.objects.all().order_by("id")
+
+
+def _async_list_context(query="") -> dict[str, Any]:
+    response = _call_async_view(_AsyncListView, _async_request(query))
+    assert isinstance(response, TemplateResponse)
+    assert response.context_data is not None
+    return response.context_data
+
+
+@pytest.mark.django_db
+def test_async_list_view_paginates_filtered_queryset():
+    ExampleJobFactory.create_batch(3, status=ExampleJob.Status.PENDING)
+    ExampleJobFactory.create_batch(30, status=ExampleJob.Status.DONE)
+
+    context = _async_list_context("status=DO&per_page=25&page=2")
+
+    assert context["paginator"].count == 30
+    assert context["page_obj"].number == 2
+    assert len(context["object_list"]) == 5
+    assert {job.status for job in context["object_list"]} == {ExampleJob.Status.DONE}
+    assert context["is_paginated"] is True
+    assert context["page_sizes"] == [25, 50, 100, 250, 500]
+
+
+@pytest.mark.django_db
+def test_async_list_view_out_of_range_page_returns_last():
+    ExampleJobFactory.create_batch(3)
+
+    context = _async_list_context("page=999")
+
+    assert context["page_obj"].number == 1
+    assert len(context["object_list"]) == 3
@@ -0,0 +1,119 @@
+"""Tests for the ``PreforkSupervisor`` of the multi-process server commands.
+
+The supervisor really forks here. The workers only sleep (or exit right away),
+so no Django or database state is touched in the forked processes.
+"""
+
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from adit_radis_shared.common.management.base.prefork import PreforkSupervisor
+
+
+def _sleep_forever(index: int) -> None:
+    while True:
+        time.sleep(1)
+
+
+def _run_in_thread(supervisor: PreforkSupervisor) -> tuple[threading.Thread, list[int]]:
+    result: list[int] = []
+    thread = threading.Thread(target=lambda: result.append(supervisor.run()))
+    thread.start()
+    return thread, result
+
+
+def _wait_for(condition, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.05)
+
+
+def test_supervisor_starts_and_stops_workers():
+    supervisor = PreforkSupervisor(_sleep_forever, 3, shutdown_timeout=5)
+    thread, result = _run_in_thread(supervisor)
+
+    _wait_for(lambda: len(supervisor.pids) == 3)
+    pids = supervisor.pids
+    supervisor.stop()
+    thread.join(5)
+
+    assert result == [0]
+    assert supervisor.pids == []
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+def test_supervisor_restarts_crashed_worker(tmp_path: Path):
+    marker = tmp_path / "crashed"
+
+    def crash_once(index: int) -> int | None:
+        if not marker.exists():
+            marker.touch()
+            return 3
+        _sleep_forever(index)
+
+    supervisor = PreforkSupervisor(crash_once, 1, restart_delay=0, shutdown_timeout=5)
+    thread, result = _run_in_thread(supervisor)
+
+    _wait_for(lambda: supervisor.restarts == 1 and len(supervisor.pids) == 1)
+    supervisor.stop()
+    thread.join(5)
+
+    # The crash happened before the shutdown, so it doesn't count for the exit code.
+    assert result == [0]
+
+
+def test_supervisor_reports_failing_worker_on_shutdown():
+    def fail_on_term(index: int) -> int:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        stop.wait()
+        return 2
+
+    supervisor = PreforkSupervisor(fail_on_term, 2, shutdown_timeout=5)
+    thread, result = _run_in_thread(supervisor)
+
+    _wait_for(lambda: len(supervisor.pids) == 2)
+    # Give the workers time to install their signal handler.
+    time.sleep(0.5)
+    supervisor.stop()
+    thread.join(5)
+
+    assert result == [2]
+
+
+def test_supervisor_needs_at_least_one_process():
+    with pytest.raises(ValueError):
+        PreforkSupervisor(_sleep_forever, 0)
+
+
+def test_supervisor_starts_replacement_before_recycled_worker_exits(tmp_path: Path):
+    marker = tmp_path / "recycled"
+    supervisor: PreforkSupervisor
+
+    def recycle_once(index: int) -> None:
+        if marker.exists():
+            _sleep_forever(index)
+        marker.touch()
+        supervisor.request_recycle()
+        # Still "draining" while the replacement starts.
+        time.sleep(1)
+
+    supervisor = PreforkSupervisor(recycle_once, 1, shutdown_timeout=5)
+    thread, result = _run_in_thread(supervisor)
+
+    _wait_for(lambda: supervisor.recycles == 1 and len(supervisor.pids) == 2)
+    _wait_for(lambda: len(supervisor.pids) == 1)
+    supervisor.stop()
+    thread.join(5)
+
+    assert supervisor.restarts == 0
+    assert result == [0]
@@ -0,0 +1,118 @@
+"""Tests for the ``ProcrastinateServerCommand`` that the ``bg_worker`` command uses.
+
+The in-process worker runs in a thread against the test database (so the test
+needs committed data). For the worker processes, the command is run in a forked
+process that forks the workers itself and is stopped by a signal like the
+container would be. Those workers don't touch the database.
+"""
+
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from django import db
+from procrastinate.contrib.django.models import ProcrastinateJob
+
+from adit_radis_shared.common.management.commands.bg_worker import Command
+from example_project.example_app.tasks import example_task
+
+
+def _wait_for(condition, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.05)
+
+
+def _parse_options(command: Command, *args: str) -> dict:
+    parser = command.create_parser("manage.py", "bg_worker")
+    return vars(parser.parse_args(args))
+
+
+# --- In-process worker --------------------------------------------------------
+
+
+@pytest.mark.django_db(transaction=True)
+def test_in_process_worker_processes_jobs_and_stops_cleanly():
+    command = Command()
+    options = _parse_options(command, "--in-process", "--queues", "in_process_test")
+    thread = threading.Thread(target=command.run_server, kwargs=options)
+    thread.start()
+
+    try:
+        _wait_for(lambda: command.worker_task is not None)
+        job_id = example_task.configure(queue="in_process_test").defer()
+        # The worker deletes the jobs it processed.
+        _wait_for(lambda: not ProcrastinateJob.objects.filter(id=job_id).exists())
+    finally:
+        command.on_shutdown()
+        thread.join(command.shutdown_graceful_timeout)
+
+    assert not thread.is_alive()
+    assert command.worker_task is not None and command.worker_task.done()
+
+
+# --- Worker processes ---------------------------------------------------------
+
+
+class _ProcessesCommand(Command):
+    """Workers that wait for the shutdown signal, the first one then fails."""
+
+    ready_dir: Path
+    fail_first: bool
+
+    async def run_server_async(self, **options):
+        stopped = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(sig, stopped.set)
+        (self.ready_dir / str(os.getpid())).touch()
+
+        while not stopped.is_set():
+            await self.loop.run_in_executor(None, stopped.wait, 0.1)
+
+        if self.fail_first:
+            try:
+                os.close(os.open(self.ready_dir / "failed", os.O_CREAT | os.O_EXCL))
+            except FileExistsError:
+                return
+            raise SystemExit(3)
+
+
+def _run_worker_processes(tmp_path: Path, fail_first: bool) -> int:
+    """Run the command with two worker processes, stop it and return its exit code."""
+    command = _ProcessesCommand()
+    command.ready_dir = tmp_path
+    command.fail_first = fail_first
+    options = _parse_options(command, "--processes", "2")
+
+    # The forked command must not share the database connection of the test.
+    db.connections.close_all()
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            command.handle(**options)
+            exit_code = 0
+        finally:
+            os._exit(exit_code)
+
+    try:
+        _wait_for(lambda: len(list(tmp_path.iterdir())) == 2)
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def test_worker_processes_exit_by_signal_when_stopped_cleanly(tmp_path: Path):
+    # The signal is raised again, so the command exits like it was terminated.
+    assert _run_worker_processes(tmp_path, fail_first=False) == -signal.SIGTERM
+
+
+def test_worker_processes_exit_with_code_of_failed_worker(tmp_path: Path):
+    assert _run_worker_processes(tmp_path, fail_first=True) == 3
+    assert (tmp_path / "failed").exists()
@@ -1,19 +1,34 @@
-"""Unit tests for the shared periodic tasks in ``common.tasks``.
+"""Unit tests for the shared tasks in ``common.tasks``.
 
-Only ``backup_db`` is covered here. The real ``dbbackup`` management command is
-mocked out (no backup is ever performed); the tests assert the task gates on the
+For ``backup_db`` the real ``dbbackup`` management command is mocked out (no
+backup is ever performed); the tests assert the task gates on the
 ``BACKUP_ENABLED`` setting and, when enabled, invokes ``dbbackup`` with the
-expected arguments.
+expected arguments. The broadcast mail tasks send to Django's in-memory mail
+outbox and defer their follow-up jobs to the in-memory Procrastinate app, as
+does ``send_outbox_mails`` that drains the mail outbox table.
 
 ``backup_db`` is a Procrastinate task, but ``Task.__call__`` simply forwards to
 the wrapped function, so it can be called directly without a worker or queue.
 """
 
-from unittest.mock import patch
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+from unittest.mock import MagicMock, patch
 
 import pytest
+from django.core import mail
+from django.utils import timezone
 
-from adit_radis_shared.common.tasks import backup_db
+from adit_radis_shared.accounts.factories import GroupFactory, UserFactory
+from adit_radis_shared.common.models import BroadcastAudience, OutboxMail
+from adit_radis_shared.common.tasks import (
+    backup_db,
+    broadcast_mail,
+    broadcast_mail_chunk,
+    get_broadcast_recipients,
+    retry_outbox_mails,
+    send_outbox_mails,
+)
+from adit_radis_shared.common.utils.mail import queue_mail
 
 
 def test_backup_db_invokes_dbbackup_with_expected_arguments(settings):
@@ -67,3 +82,236 @@ def test_backup_db_propagates_command_errors(settings):
     ):
         with pytest.raises(RuntimeError, match="backup failed"):
             backup_db(timestamp=0)
+
+
+def test_broadcast_mail_fans_out_chunks(settings, in_memory_app):
+    settings.BROADCAST_MAIL_CHUNK_SIZE = 2
+    recipients = [f"user{i}@example.test" for i in range(5)]
+
+    broadcast_mail(recipients=recipients, subject="Hello", message="World")
+
+    jobs = list(in_memory_app.job_manager.list_jobs())
+    assert [job.task_name.split(".")[-1] for job in jobs] == ["broadcast_mail_chunk"] * 3
+    assert [job.task_kwargs["recipients"] for job in jobs] == [
+        recipients[0:2],
+        recipients[2:4],
+        recipients[4:5],
+    ]
+    assert [(job.task_kwargs["chunk"], job.task_kwargs["chunks"]) for job in jobs] == [
+        (1, 3),
+        (2, 3),
+        (3, 3),
+    ]
+    assert len(mail.outbox) == 0
+
+
+@pytest.mark.django_db
+def test_broadcast_mail_resolves_audience_in_task(settings, in_memory_app):
+    settings.BROADCAST_MAIL_CHUNK_SIZE = 2
+    group = GroupFactory.create()
+    members = [UserFactory.create(email=f"member{i}@example.test") for i in range(3)]
+    for member in members:
+        member.groups.add(group)
+    UserFactory.create(email="other@example.test")
+    UserFactory.create(email="")
+
+    broadcast_mail(
+        subject="Hello", message="World", audience=BroadcastAudience.GROUPS, group_ids=[group.pk]
+    )
+
+    jobs = list(in_memory_app.job_manager.list_jobs())
+    assert [job.task_kwargs["recipients"] for job in jobs] == [
+        ["member0@example.test", "member1@example.test"],
+        ["member2@example.test"],
+    ]
+    assert [job.task_kwargs["chunks"] for job in jobs] == [2, 2]
+
+
+@pytest.mark.django_db
+def test_get_broadcast_recipients_of_active_users():
+    UserFactory.create(email="active@example.test", is_active=True)
+    UserFactory.create(email="inactive@example.test", is_active=False)
+
+    assert list(get_broadcast_recipients(BroadcastAudience.ACTIVE)) == ["active@example.test"]
+    assert list(get_broadcast_recipients(BroadcastAudience.EVERYONE)) == [
+        "active@example.test",
+        "inactive@example.test",
+    ]
+
+
+def test_broadcast_mail_chunk_sends_one_message_per_recipient(settings):
+    settings.SUPPORT_EMAIL = "support@example.test"
+    recipients = ["a@example.test", "b@example.test"]
+
+    broadcast_mail_chunk(recipients=recipients, subject="Hello", message="World", chunk=1, chunks=1)
+
+    assert [message.to for message in mail.outbox] == [[r] for r in recipients]
+    assert all(message.from_email == "support@example.test" for message in mail.outbox)
+
+
+def test_broadcast_mail_chunk_skips_refused_recipients():
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.send_messages.side_effect = [SMTPRecipientsRefused({}), 1]
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        broadcast_mail_chunk(
+            recipients=["a@example.test", "b@example.test"],
+            subject="Hello",
+            message="World",
+            chunk=1,
+            chunks=1,
+        )
+
+    assert connection.send_messages.call_count == 2
+
+
+def test_broadcast_mail_chunk_requeues_remaining_recipients(in_memory_app):
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.send_messages.side_effect = [1, SMTPServerDisconnected()]
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        broadcast_mail_chunk(
+            recipients=["a@example.test", "b@example.test", "c@example.test"],
+            subject="Hello",
+            message="World",
+            chunk=2,
+            chunks=3,
+        )
+
+    jobs = list(in_memory_app.job_manager.list_jobs())
+    assert len(jobs) == 1
+    assert jobs[0].task_kwargs["recipients"] == ["b@example.test", "c@example.test"]
+    assert jobs[0].task_kwargs["chunk"] == 2
+
+
+def test_broadcast_mail_chunk_does_not_requeue_when_only_closing_fails(in_memory_app):
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.__exit__.side_effect = SMTPServerDisconnected()
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        broadcast_mail_chunk(
+            recipients=["a@example.test", "b@example.test"],
+            subject="Hello",
+            message="World",
+            chunk=1,
+            chunks=1,
+        )
+
+    assert connection.send_messages.call_count == 2
+    assert list(in_memory_app.job_manager.list_jobs()) == []
+
+
+def test_broadcast_mail_chunk_raises_when_nothing_was_sent():
+    connection = MagicMock()
+    connection.__enter__.side_effect = SMTPServerDisconnected()
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        with pytest.raises(SMTPServerDisconnected):
+            broadcast_mail_chunk(
+                recipients=["a@example.test"], subject="Hello", message="World", chunk=1, chunks=1
+            )
+
+
+@pytest.mark.django_db
+def test_send_outbox_mails_sends_and_deletes_due_mails():
+    queue_mail("First", "Body", ["a@example.test"])
+    queue_mail("Second", "Body", ["b@example.test"], html_content="<p>Body</p>")
+
+    send_outbox_mails()
+
+    assert [message.subject for message in mail.outbox] == ["First", "Second"]
+    assert mail.outbox[1].alternatives[0][0] == "<p>Body</p>"  # type: ignore[attr-defined]
+    assert not OutboxMail.objects.exists()
+
+
+@pytest.mark.django_db
+def test_send_outbox_mails_backs_off_failed_mails():
+    queue_mail("Subject", "Body", ["a@example.test"])
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.send_messages.side_effect = SMTPServerDisconnected("gone")
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        send_outbox_mails()
+        # Not due again yet, so it is not retried in the same run or the next one.
+        send_outbox_mails()
+
+    outbox_mail = OutboxMail.objects.get()
+    assert connection.send_messages.call_count == 1
+    assert outbox_mail.attempts == 1
+    assert outbox_mail.last_error == "gone"
+    assert outbox_mail.next_attempt is not None
+
+
+@pytest.mark.django_db
+def test_send_outbox_mails_gives_up_after_max_attempts(settings):
+    settings.MAIL_OUTBOX_MAX_ATTEMPTS = 1
+    queue_mail("Subject", "Body", ["a@example.test"])
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.send_messages.side_effect = SMTPServerDisconnected("gone")
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        send_outbox_mails()
+
+    assert OutboxMail.objects.get().next_attempt is None
+
+
+@pytest.mark.django_db
+def test_retry_outbox_mails_sends_due_mails():
+    queue_mail("Subject", "Body", ["a@example.test"])
+
+    retry_outbox_mails(timestamp=0)
+
+    assert [message.subject for message in mail.outbox] == ["Subject"]
+    assert not OutboxMail.objects.exists()
+
+
+@pytest.mark.django_db
+def test_send_outbox_mails_does_not_connect_without_due_mails():
+    with patch("adit_radis_shared.common.tasks.get_connection") as get_connection:
+        send_outbox_mails()
+
+    get_connection.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_send_outbox_mails_claims_mails_while_sending():
+    queue_mail("Subject", "Body", ["a@example.test"])
+    next_attempts = []
+
+    def send_messages(messages):
+        # Another worker would skip the mail that is being sent.
+        next_attempts.append(OutboxMail.objects.get().next_attempt)
+        return 1
+
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.send_messages.side_effect = send_messages
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        send_outbox_mails()
+
+    assert next_attempts[0] > timezone.now()
+    assert not OutboxMail.objects.exists()
+
+
+@pytest.mark.django_db
+def test_given_up_mail_does_not_block_queueing_it_again(settings):
+    settings.MAIL_OUTBOX_MAX_ATTEMPTS = 1
+    queue_mail("Subject", "Body", ["a@example.test"])
+    connection = MagicMock()
+    connection.__enter__.return_value = connection
+    connection.send_messages.side_effect = SMTPServerDisconnected("gone")
+
+    with patch("adit_radis_shared.common.tasks.get_connection", return_value=connection):
+        send_outbox_mails()
+
+    queue_mail("Subject", "Body", ["a@example.test"])
+    queue_mail("Subject", "Body", ["a@example.test"])
+
+    assert OutboxMail.objects.filter(next_attempt=None).count() == 1
+    assert OutboxMail.objects.exclude(next_attempt=None).count() == 1
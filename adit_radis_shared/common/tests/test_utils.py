@@ -1,22 +1,54 @@
 """Tests for the small pure helpers under ``common.utils``.
 
-Covered: mail helpers, the HTMX toast trigger, the auth type-guard and the
-``iter_over_async`` bridge.
+Covered: mail helpers, the HTMX toast trigger, the auth type-guard, the
+``iter_over_async`` bridge, the facet counts, the worker helpers (including
+the job history pruning), the queue metrics and the job tracing.
 """
 
 import asyncio
+import inspect
+import io
 import json
+import os
+import time
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from unittest.mock import patch
 
 import pytest
 from django.contrib.auth.models import AnonymousUser
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
 from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from procrastinate import testing
+from procrastinate.contrib.django import DjangoApp
+from procrastinate.jobs import Job
 
 from adit_radis_shared.accounts.factories import UserFactory
+from adit_radis_shared.common.models import ArchivedJob, OutboxMail
+from adit_radis_shared.common.tasks import send_outbox_mails
+from adit_radis_shared.common.utils import job_tracing, queue_metrics
 from adit_radis_shared.common.utils.async_utils import iter_over_async
 from adit_radis_shared.common.utils.auth_utils import is_logged_in_user
+from adit_radis_shared.common.utils.facet_utils import get_facet_counts
 from adit_radis_shared.common.utils.htmx_triggers import trigger_toast
 from adit_radis_shared.common.utils.mail import send_mail_to_admins, send_mail_to_user
+from adit_radis_shared.common.utils.queue_metrics import fetch_job_counts, record_job_metrics
+from adit_radis_shared.common.utils.worker_utils import (
+    ConcurrencyAutoscaler,
+    QueueStats,
+    on_job_finished,
+    prune_job_history,
+    retry_stalled_jobs,
+)
+from example_project.example_app.factories import ExampleJobFactory
+from example_project.example_app.models import ExampleJob
 
 # --- mail helpers -----------------------------------------------------------
 
@@ -26,14 +58,18 @@ def test_send_mail_to_admins_requires_some_content():
         send_mail_to_admins("Subject")
 
 
+@pytest.mark.django_db
 def test_send_mail_to_admins_sends_with_text_content():
     send_mail_to_admins("Subject", text_content="Body text")
+    send_outbox_mails()
     assert len(mail.outbox) == 1
     assert "Body text" in mail.outbox[0].body
 
 
+@pytest.mark.django_db
 def test_send_mail_to_admins_strips_html_when_no_text():
     send_mail_to_admins("Subject", html_content="<p>Hello <b>admin</b></p>")
+    send_outbox_mails()
     assert len(mail.outbox) == 1
     # HTML is stripped for the plaintext part.
     assert "Hello admin" in mail.outbox[0].body
@@ -46,6 +82,7 @@ def test_send_mail_to_user_prefixes_subject_and_targets_user(settings):
     user = UserFactory.create(email="target@example.test")
 
     send_mail_to_user(user, "Hi", text_content="Body")
+    send_outbox_mails()
 
     assert len(mail.outbox) == 1
     sent = mail.outbox[0]
@@ -53,6 +90,53 @@ def test_send_mail_to_user_prefixes_subject_and_targets_user(settings):
     assert sent.to == ["target@example.test"]
 
 
+@pytest.mark.django_db
+def test_send_mail_to_user_only_queues_mail():
+    user = UserFactory.create()
+
+    send_mail_to_user(user, "Hi", html_content="<p>Body</p>")
+
+    # Nothing is sent in the request, the mail waits in the outbox.
+    assert len(mail.outbox) == 0
+    outbox_mail = OutboxMail.objects.get()
+    assert outbox_mail.recipients == [user.email]
+    assert outbox_mail.html_content == "<p>Body</p>"
+
+
+@pytest.mark.django_db
+def test_send_mail_to_user_deduplicates_pending_mails():
+    user = UserFactory.create()
+
+    send_mail_to_user(user, "Hi", text_content="Body")
+    send_mail_to_user(user, "Hi", text_content="Body")
+    send_mail_to_user(user, "Hi", text_content="Other body")
+
+    assert OutboxMail.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_queued_mail_is_discarded_with_rolled_back_transaction():
+    user = UserFactory.create()
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            send_mail_to_user(user, "Hi", text_content="Body")
+            raise RuntimeError()
+
+    assert not OutboxMail.objects.exists()
+
+
+@pytest.mark.django_db
+def test_queued_mail_triggers_sending_on_commit(django_capture_on_commit_callbacks):
+    user = UserFactory.create()
+
+    with patch("adit_radis_shared.common.utils.mail.send_outbox_mails") as task:
+        with django_capture_on_commit_callbacks(execute=True):
+            send_mail_to_user(user, "Hi", text_content="Body")
+
+    task.defer.assert_called_once_with()
+
+
 @pytest.mark.django_db
 def test_send_mail_to_user_requires_some_content():
     user = UserFactory.create()
@@ -128,3 +212,397 @@ def test_iter_over_async_handles_empty_iterator():
         loop.close()
 
     assert result == []
+
+
+# --- facet counts -----------------------------------------------------------
+
+
+@pytest.mark.django_db
+def test_get_facet_counts_uses_a_single_query():
+    ExampleJobFactory.create_batch(2, status=ExampleJob.Status.PENDING)
+    ExampleJobFactory.create_batch(3, status=ExampleJob.Status.DONE)
+
+    with CaptureQueriesContext(connection) as context:
+        counts = get_facet_counts(ExampleJob.objects.all(), "status", timeout=0)
+
+    assert len(context.captured_queries) == 1
+    assert counts == {ExampleJob.Status.PENDING: 2, ExampleJob.Status.DONE: 3}
+
+
+@pytest.mark.django_db
+def test_get_facet_counts_respects_queryset_filter():
+    ExampleJobFactory.create_batch(2, name="foo", status=ExampleJob.Status.PENDING)
+    ExampleJobFactory.create_batch(3, name="bar", status=ExampleJob.Status.PENDING)
+
+    counts = get_facet_counts(ExampleJob.objects.filter(name="foo"), "status", timeout=0)
+
+    assert counts == {ExampleJob.Status.PENDING: 2}
+
+
+@pytest.mark.django_db
+def test_get_facet_counts_are_cached():
+    cache.clear()
+    ExampleJobFactory.create_batch(2, status=ExampleJob.Status.PENDING)
+
+    assert get_facet_counts(ExampleJob.objects.all(), "status") == {"PE": 2}
+
+    ExampleJobFactory.create(status=ExampleJob.Status.PENDING)
+    with CaptureQueriesContext(connection) as context:
+        counts = get_facet_counts(ExampleJob.objects.all(), "status")
+
+    # Served from the cache, so the new job is not yet counted.
+    assert len(context.captured_queries) == 0
+    assert counts == {"PE": 2}
+
+
+# --- worker autoscaling -----------------------------------------------------
+
+
+def test_autoscaler_scales_up_when_jobs_wait_too_long():
+    autoscaler = ConcurrencyAutoscaler(1, 8, scale_up_wait=5)
+
+    assert autoscaler.decide(1, QueueStats(depth=3, oldest_wait=1)) == 1
+    assert autoscaler.decide(1, QueueStats(depth=3, oldest_wait=6)) == 4
+    # Never above the maximum.
+    assert autoscaler.decide(4, QueueStats(depth=100, oldest_wait=60)) == 8
+
+
+def test_autoscaler_scales_down_only_after_idle_samples():
+    autoscaler = ConcurrencyAutoscaler(2, 8, scale_down_samples=3)
+    idle = QueueStats(depth=0, oldest_wait=0)
+
+    assert autoscaler.decide(4, idle) == 4
+    assert autoscaler.decide(4, idle) == 4
+    assert autoscaler.decide(4, idle) == 3
+
+    # A waiting job resets the idle streak (hysteresis).
+    assert autoscaler.decide(3, idle) == 3
+    assert autoscaler.decide(3, QueueStats(depth=1, oldest_wait=0)) == 3
+    assert autoscaler.decide(3, idle) == 3
+    assert autoscaler.decide(3, idle) == 3
+    assert autoscaler.decide(3, idle) == 2
+
+    # Never below the minimum.
+    for _ in range(3):
+        assert autoscaler.decide(2, idle) == 2
+
+
+def test_autoscaler_validates_bounds():
+    with pytest.raises(ValueError):
+        ConcurrencyAutoscaler(0, 4)
+    with pytest.raises(ValueError):
+        ConcurrencyAutoscaler(4, 2)
+
+
+# --- job hooks --------------------------------------------------------------
+
+
+def test_on_job_finished_wraps_sync_and_async_task_functions():
+    finished: list[str] = []
+    wrap = on_job_finished(lambda: finished.append("job"))
+
+    def sync_task(value: int) -> int:
+        return value * 2
+
+    async def async_task(value: int) -> int:
+        return value * 3
+
+    def failing_task() -> None:
+        raise RuntimeError("failed")
+
+    assert wrap(sync_task)(2) == 4
+    wrapped_async_task = wrap(async_task)
+    assert inspect.iscoroutinefunction(wrapped_async_task)
+    assert asyncio.run(wrapped_async_task(2)) == 6
+    with pytest.raises(RuntimeError):
+        wrap(failing_task)()
+
+    assert finished == ["job", "job", "job"]
+
+
+# --- stalled jobs -----------------------------------------------------------
+
+
+def _create_running_job(
+    queue: str, task: str, heartbeat_age: int | None, abort_requested: bool = False
+) -> int:
+    """Insert a running job (of a worker with a heartbeat of the given age in seconds)."""
+    with connection.cursor() as cursor:
+        worker_id = None
+        if heartbeat_age is not None:
+            cursor.execute(
+                "INSERT INTO procrastinate_workers (last_heartbeat) "
+                "VALUES (now() - make_interval(secs => %s)) RETURNING id",
+                [heartbeat_age],
+            )
+            worker_id = cursor.fetchone()[0]
+        cursor.execute(
+            "INSERT INTO procrastinate_jobs (queue_name, task_name, status, worker_id) "
+            "VALUES (%s, %s, 'todo', %s) RETURNING id",
+            [queue, task, worker_id],
+        )
+        job_id = cursor.fetchone()[0]
+        cursor.execute(
+            "UPDATE procrastinate_jobs SET status = 'doing', abort_requested = %s WHERE id = %s",
+            [abort_requested, job_id],
+        )
+    return job_id
+
+
+def _job_state(job_id: int) -> tuple[str, int, int]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT status, attempts, priority FROM procrastinate_jobs WHERE id = %s", [job_id]
+        )
+        return cursor.fetchone()
+
+
+@pytest.mark.django_db
+def test_retry_stalled_jobs_retries_jobs_of_stalled_workers_in_batches():
+    stalled = [_create_running_job("default", "app.task_a", 120) for _ in range(3)]
+    stalled.append(_create_running_job("dicom", "app.task_b", None))
+    alive = _create_running_job("default", "app.task_a", 0)
+
+    retried = retry_stalled_jobs(priority=10, batch_size=2)
+
+    assert retried == {("default", "app.task_a"): 3, ("dicom", "app.task_b"): 1}
+    assert all(_job_state(job_id) == ("todo", 1, 10) for job_id in stalled)
+    assert _job_state(alive) == ("doing", 0, 0)
+
+
+@pytest.mark.django_db
+def test_retry_stalled_jobs_of_one_queue():
+    default_job = _create_running_job("default", "app.task", 120)
+    dicom_job = _create_running_job("dicom", "app.task", 120)
+
+    assert retry_stalled_jobs(queue="dicom") == {("dicom", "app.task"): 1}
+    assert _job_state(default_job)[0] == "doing"
+    assert _job_state(dicom_job)[0] == "todo"
+
+
+@pytest.mark.django_db
+def test_retry_stalled_jobs_fails_jobs_requested_to_abort():
+    job_id = _create_running_job("default", "app.task", 120, abort_requested=True)
+
+    assert retry_stalled_jobs() == {}
+    assert _job_state(job_id) == ("failed", 0, 0)
+
+
+@pytest.mark.django_db
+def test_retry_stalled_jobs_command_uses_the_stalled_worker_timeout(settings):
+    settings.STALLED_JOBS_RETRY_PRIORITY = 10
+    settings.PROCRASTINATE_WORKER_DEFAULTS = {"stalled_worker_timeout": 300}
+    slow_job = _create_running_job("default", "app.task", 120)
+    stalled_job = _create_running_job("default", "app.task", 600)
+
+    call_command("retry_stalled_jobs", stdout=io.StringIO())
+
+    assert _job_state(slow_job)[0] == "doing"
+    assert _job_state(stalled_job) == ("todo", 1, 10)
+
+
+# --- job history -------------------------------------------------------------
+
+
+def _create_finished_job(status: str, age: int) -> int:
+    """Insert a job that finished (with the given status) `age` seconds ago."""
+    job_id = _create_running_job("default", "app.task", None)
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE procrastinate_jobs SET status = %s WHERE id = %s", [status, job_id])
+        cursor.execute(
+            "UPDATE procrastinate_events SET at = now() - make_interval(secs => %s) "
+            "WHERE job_id = %s",
+            [age, job_id],
+        )
+    return job_id
+
+
+def _job_exists(job_id: int) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM procrastinate_jobs WHERE id = %s", [job_id])
+        return cursor.fetchone() is not None
+
+
+@pytest.mark.django_db
+def test_prune_job_history_archives_and_deletes_old_finished_jobs_in_batches():
+    old_jobs = [_create_finished_job("succeeded", 7200) for _ in range(2)]
+    old_jobs.append(_create_finished_job("failed", 7200))
+    recent_job = _create_finished_job("succeeded", 60)
+    running_job = _create_running_job("default", "app.task", 0)
+
+    report = prune_job_history(max_age=3600, batch_size=2, pause=0)
+
+    assert (report.jobs, report.archived, report.batches) == (3, 3, 2)
+    assert report.events == 9  # deferred, started and succeeded/failed of each job
+    assert not any(_job_exists(job_id) for job_id in old_jobs)
+    assert _job_exists(recent_job) and _job_exists(running_job)
+
+    archived = ArchivedJob.objects.get(job_id=old_jobs[2])
+    assert archived.status == "failed"
+    assert [event["type"] for event in archived.events] == ["deferred", "started", "failed"]
+
+
+@pytest.mark.django_db
+def test_prune_job_history_without_archive():
+    job_id = _create_finished_job("cancelled", 7200)
+
+    report = prune_job_history(max_age=3600, pause=0, archive=False)
+
+    assert (report.jobs, report.archived) == (1, 0)
+    assert not _job_exists(job_id)
+    assert not ArchivedJob.objects.exists()
+
+
+# --- queue metrics ----------------------------------------------------------
+
+
+@pytest.mark.django_db
+def test_fetch_job_counts_groups_jobs_by_queue_task_and_status():
+    _create_running_job("default", "app.task_a", 0)
+    _create_running_job("default", "app.task_a", 0)
+    _create_running_job("dicom", "app.task_b", 0)
+
+    counts = fetch_job_counts()
+
+    assert counts[("default", "app.task_a", "doing")] == 2
+    assert counts[("dicom", "app.task_b", "doing")] == 1
+
+
+def test_observed_job_counts_drop_to_zero_when_gone(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(queue_metrics, "_registered_pid", os.getpid())
+    monkeypatch.setattr(queue_metrics, "_seen_series", set())
+    monkeypatch.setattr(queue_metrics.db, "close_old_connections", lambda: None)
+    monkeypatch.setattr(
+        queue_metrics, "fetch_job_counts", lambda: {("default", "app.task", "todo"): 3}
+    )
+    first = queue_metrics._observe_jobs(None)  # type: ignore
+    monkeypatch.setattr(queue_metrics, "fetch_job_counts", lambda: {})
+    second = queue_metrics._observe_jobs(None)  # type: ignore
+
+    attributes = {"queue": "default", "task": "app.task", "status": "todo"}
+    assert [(o.value, o.attributes) for o in first] == [(3, attributes)]
+    assert [(o.value, o.attributes) for o in second] == [(0, attributes)]
+
+
+def test_job_counts_are_only_observed_in_registering_process(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(queue_metrics, "_registered_pid", os.getpid() + 1)
+    monkeypatch.setattr(
+        queue_metrics, "fetch_job_counts", lambda: {("default", "app.task", "todo"): 3}
+    )
+
+    # Like a forked worker process that inherited the gauge of its supervisor.
+    assert queue_metrics._observe_jobs(None) == []  # type: ignore
+
+
+class _Recorder:
+    def __init__(self):
+        self.records = []
+
+    def record(self, value, attributes):
+        self.records.append((value, attributes))
+
+
+def test_record_job_metrics_records_wait_and_run_time(monkeypatch: pytest.MonkeyPatch):
+    wait, duration = _Recorder(), _Recorder()
+    monkeypatch.setattr(queue_metrics, "job_wait_histogram", wait)
+    monkeypatch.setattr(queue_metrics, "job_duration_histogram", duration)
+
+    started = time.time()
+    job = SimpleNamespace(
+        id=1,
+        queue="default",
+        task_name="app.task",
+        scheduled_at=datetime.fromtimestamp(started - 5, tz=UTC),
+        task_kwargs={},
+    )
+    context = SimpleNamespace(job=job, start_timestamp=started)
+
+    async def succeed():
+        return "done"
+
+    async def fail():
+        raise RuntimeError
+
+    assert asyncio.run(record_job_metrics(succeed, context, None)) == "done"  # type: ignore
+    with pytest.raises(RuntimeError):
+        asyncio.run(record_job_metrics(fail, context, None))  # type: ignore
+
+    attributes = {"queue": "default", "task": "app.task"}
+    assert [round(value) for value, _ in wait.records] == [5, 5]
+    assert all(recorded == attributes for _, recorded in wait.records)
+    assert [recorded["status"] for _, recorded in duration.records] == ["succeeded", "failed"]
+
+
+def test_record_job_metrics_takes_the_wait_from_the_job(monkeypatch: pytest.MonkeyPatch):
+    wait = _Recorder()
+    monkeypatch.setattr(queue_metrics, "job_wait_histogram", wait)
+
+    started = time.time()
+    traced_job = Job(
+        id=1,
+        queue="default",
+        task_name="app.task",
+        lock=None,
+        queueing_lock=None,
+        task_kwargs={job_tracing.TRACE_CONTEXT_KWARG: {"deferred_at": started - 3}},
+    )
+    untraced_job = traced_job.evolve(task_kwargs={})
+
+    async def succeed():
+        return "done"
+
+    for job in [traced_job, untraced_job]:
+        context = SimpleNamespace(job=job, start_timestamp=started)
+        asyncio.run(record_job_metrics(succeed, context, None))  # type: ignore
+
+    # The wait of a job that was neither scheduled nor traced is unknown.
+    assert [round(value) for value, _ in wait.records] == [3]
+
+
+# --- job tracing --------------------------------------------------------------
+
+
+@pytest.fixture
+def span_exporter(monkeypatch: pytest.MonkeyPatch) -> InMemorySpanExporter:
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(job_tracing, "tracer", provider.get_tracer(__name__))
+    return exporter
+
+
+def test_trace_context_is_only_injected_within_a_span(span_exporter: InMemorySpanExporter):
+    job = Job(queue="default", task_name="app.task", lock=None, queueing_lock=None)
+
+    assert job_tracing.inject_trace_context(job) is job
+
+    with job_tracing.tracer.start_as_current_span("request"):
+        traced_job = job_tracing.inject_trace_context(job)
+
+    metadata = traced_job.task_kwargs[job_tracing.TRACE_CONTEXT_KWARG]
+    assert isinstance(metadata, dict)
+    traceparent, deferred_at = metadata["traceparent"], metadata["deferred_at"]
+    assert isinstance(traceparent, str) and traceparent.startswith("00-")
+    assert isinstance(deferred_at, float) and deferred_at <= time.time()
+
+
+def test_deferred_job_continues_the_trace_of_the_deferrer(span_exporter: InMemorySpanExporter):
+    tracing_app = DjangoApp(connector=testing.InMemoryConnector())
+    job_tracing.setup_job_tracing(tracing_app)
+    received: list[dict] = []
+
+    @tracing_app.task(name="traced_task")
+    def traced_task(**kwargs):
+        received.append(kwargs)
+
+    with job_tracing.tracer.start_as_current_span("request") as request_span:
+        traced_task.defer(value=1)
+    tracing_app.run_worker(wait=False, install_signal_handlers=False)
+
+    assert received == [{"value": 1}]
+    spans = {span.name: span for span in span_exporter.get_finished_spans()}
+    job_span = spans["process traced_task"]
+    assert job_span.parent and job_span.parent.span_id == request_span.get_span_context().span_id
+    assert job_span.context is not None
+    assert job_span.context.trace_id == request_span.get_span_context().trace_id
+    assert job_span.attributes["procrastinate.job.queue_wait"] >= 0  # type: ignore
@@ -1,16 +1,28 @@
 """Integration tests for ``common.views`` through the example_project URLs.
 
 These go through the real Django test client so URL routing, middleware and
-templates are all exercised together.
+templates are all exercised together. ``AsyncAdminProxyView`` is called directly
+and proxies to a local stand-in upstream running the ``ok_server`` handler (or an
+upstream that echoes the request and sets cookies).
 """
 
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
 import pytest
-from django.test import Client
+from asgiref.sync import async_to_sync
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.test import AsyncRequestFactory, Client
 from django.urls import reverse
 
 from adit_radis_shared.accounts.factories import AdminUserFactory, UserFactory
-from adit_radis_shared.common.models import ProjectSettings
+from adit_radis_shared.common.management.commands.ok_server import SimpleHTTPRequestHandler
+from adit_radis_shared.common.models import BroadcastAudience, ProjectSettings
 from adit_radis_shared.common.site import THEME_PREFERENCE_KEY
+from adit_radis_shared.common.views import AsyncAdminProxyView
 
 # --- BaseHomeView -----------------------------------------------------------
 
@@ -107,7 +119,8 @@ def test_broadcast_view_defers_mail_on_valid_post(client: Client, in_memory_app)
     response = client.post(
         reverse("broadcast"),
         {
-            "recipients": [recipient.pk],
+            "audience": BroadcastAudience.USERS,
+            "users": [recipient.pk],
             "subject": "Maintenance",
             "message": "Tonight at 9pm",
         },
@@ -120,7 +133,31 @@ def test_broadcast_view_defers_mail_on_valid_post(client: Client, in_memory_app)
     jobs = list(in_memory_app.job_manager.list_jobs())
     assert len(jobs) == 1
     assert jobs[0].task_name.endswith("broadcast_mail")
-    assert jobs[0].task_kwargs["recipients"] == ["recipient@example.test"]
+    # Only the selection is passed, the recipients are resolved by the task.
+    assert jobs[0].task_kwargs["audience"] == BroadcastAudience.USERS
+    assert jobs[0].task_kwargs["user_ids"] == [recipient.pk]
+    assert jobs[0].task_kwargs["group_ids"] == []
+
+
+@pytest.mark.django_db
+def test_broadcast_view_searches_users_for_htmx_request(client: Client):
+    staff = AdminUserFactory.create()
+    selected = UserFactory.create(username="selected", email="selected@example.test")
+    UserFactory.create(username="alice", email="alice@example.test")
+    UserFactory.create(username="bob", email="bob@example.test")
+    client.force_login(staff)
+
+    response = client.get(
+        reverse("broadcast"),
+        {"user_search": "ALI", "users": [selected.pk]},
+        headers={"HX-Request": "true"},
+    )
+
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert f'<option value="{selected.pk}" selected>' in content
+    assert "alice &lt;alice@example.test&gt;" in content
+    assert "bob" not in content
 
 
 # --- HtmxTemplateView -------------------------------------------------------
@@ -139,3 +176,172 @@ def test_htmx_template_view_requires_htmx_header(client: Client):
 
     # With the header it renders normally.
     assert client.get(url, headers={"HX-Request": "true"}).status_code == 200
+
+
+# --- AsyncAdminProxyView ----------------------------------------------------
+
+
+class EchoHTTPRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._echo(b"")
+
+    def do_POST(self):
+        self._echo(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def _echo(self, body: bytes):
+        content = f"{self.command} {self.path}\n".encode() + body
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Set-Cookie", "first=1; Path=/")
+        self.send_header("Set-Cookie", "second=2; Path=/; HttpOnly")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(handler_class):
+    server = HTTPServer(("127.0.0.1", 0), handler_class)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ok_server_url():
+    """A local stand-in upstream (the handler of the ``ok_server`` command)."""
+    yield from _serve(SimpleHTTPRequestHandler)
+
+
+@pytest.fixture
+def echo_server_url():
+    """A local stand-in upstream that echoes the request and sets two cookies."""
+    yield from _serve(EchoHTTPRequestHandler)
+
+
+def _proxy_request(user, path: str = "/admin-tool/", method: str = "get", **kwargs):
+    request = getattr(AsyncRequestFactory(), method)(path, **kwargs)
+
+    async def auser():
+        return user
+
+    request.auser = auser
+    return request
+
+
+def _call_proxy(view_class, request, path: str = ""):
+    async def run():
+        response = await view_class.as_view()(request, path=path)
+        content = b""
+        if response.streaming:
+            content = b"".join([chunk async for chunk in response])
+        return response, content
+
+    return async_to_sync(run)()
+
+
+@pytest.mark.django_db
+def test_async_admin_proxy_view_streams_upstream_response(echo_server_url):
+    class ProxyView(AsyncAdminProxyView):
+        upstream = echo_server_url
+        url_prefix = "admin-tool"
+
+    response, content = _call_proxy(
+        ProxyView, _proxy_request(AdminUserFactory.create(), "/admin-tool/status?q=1"), "status"
+    )
+
+    assert response.status_code == 200
+    assert response.streaming
+    assert content == b"GET /status?q=1\n"
+
+
+@pytest.mark.django_db
+def test_async_admin_proxy_view_forwards_request_method_and_body(echo_server_url):
+    class ProxyView(AsyncAdminProxyView):
+        upstream = echo_server_url
+        url_prefix = "admin-tool"
+
+    request = _proxy_request(
+        AdminUserFactory.create(),
+        "/admin-tool/submit",
+        method="post",
+        data=b"name=value",
+        content_type="application/x-www-form-urlencoded",
+    )
+    response, content = _call_proxy(ProxyView, request, "submit")
+
+    assert response.status_code == 200
+    assert content == b"POST /submit\nname=value"
+
+
+@pytest.mark.django_db
+def test_async_admin_proxy_view_is_exempt_from_csrf_checks(echo_server_url):
+    class ProxyView(AsyncAdminProxyView):
+        upstream = echo_server_url
+        url_prefix = "admin-tool"
+
+    request = _proxy_request(
+        AdminUserFactory.create(),
+        "/admin-tool/submit",
+        method="post",
+        data=b"name=value",
+        content_type="application/x-www-form-urlencoded",
+    )
+    # A form post without a CSRF token is passed on (the upstream checks it itself).
+    csrf_middleware = CsrfViewMiddleware(lambda request: HttpResponse())
+    assert csrf_middleware.process_view(request, ProxyView.as_view(), (), {}) is None
+
+    response, content = _call_proxy(ProxyView, request, "submit")
+
+    assert response.status_code == 200
+    assert content == b"POST /submit\nname=value"
+
+
+@pytest.mark.django_db
+def test_async_admin_proxy_view_keeps_all_upstream_cookies(echo_server_url):
+    class ProxyView(AsyncAdminProxyView):
+        upstream = echo_server_url
+        url_prefix = "admin-tool"
+
+    response, _ = _call_proxy(ProxyView, _proxy_request(AdminUserFactory.create()))
+
+    assert response.cookies["first"].value == "1"
+    assert response.cookies["second"].value == "2"
+    assert response.cookies["second"]["httponly"]
+
+
+@pytest.mark.django_db
+def test_async_admin_proxy_view_forbidden_for_non_staff(ok_server_url):
+    class ProxyView(AsyncAdminProxyView):
+        upstream = ok_server_url
+        url_prefix = "admin-tool"
+
+    with pytest.raises(PermissionDenied):
+        _call_proxy(ProxyView, _proxy_request(UserFactory.create(is_staff=False)))
+
+
+@pytest.mark.django_db
+def test_async_admin_proxy_view_returns_bad_gateway_for_unreachable_upstream():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    class ProxyView(AsyncAdminProxyView):
+        upstream = f"http://127.0.0.1:{port}"
+        url_prefix = "admin-tool"
+
+    response, _ = _call_proxy(ProxyView, _proxy_request(AdminUserFactory.create()))
+
+    assert response.status_code == 502
+
+
+def test_async_admin_proxy_view_rewrites_upstream_redirects():
+    view = AsyncAdminProxyView()
+    view.upstream = "http://upstream:8080/"
+    view.url_prefix = "admin-tool"
+
+    assert view.rewrite_location("http://upstream:8080/login") == "/admin-tool/login"
+    assert view.rewrite_location("https://example.test/") == "https://example.test/"
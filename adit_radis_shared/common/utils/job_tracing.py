@@ -0,0 +1,126 @@
+"""Trace context propagation from deferring a Procrastinate job to processing it.
+
+When a job is deferred while a span is active (e.g. in a traced web request), the
+W3C trace context (`traceparent` / `tracestate`) and the time of the defer are put
+into the job metadata. The worker continues the trace with a consumer span around
+the job (with the time the job waited in the queue as an attribute), so that the
+job shows up in the trace of the request that deferred it.
+
+Procrastinate has no job metadata, so the metadata is stored with the job
+arguments under `TRACE_CONTEXT_KWARG` and removed again before the task is called.
+Both sides are set up together by `setup_job_tracing`, which must be configured as
+Procrastinate's app ready hook (so that every process that defers or processes jobs
+has it):
+
+    PROCRASTINATE_ON_APP_READY = "adit_radis_shared.common.utils.job_tracing.setup_job_tracing"
+
+Nothing is injected as long as telemetry is not set up (see `setup_opentelemetry`),
+as then there is no active span.
+"""
+
+import functools
+import time
+from typing import Any
+
+from opentelemetry import propagate, trace
+from procrastinate import App, JobContext
+from procrastinate.jobs import Job
+from procrastinate.middleware import AsyncCallNext
+
+TRACE_CONTEXT_KWARG = "_trace_context"
+
+tracer = trace.get_tracer(__name__)
+
+
+def inject_trace_context(job: Job) -> Job:
+    """Return the job with the current trace context in its metadata."""
+    if TRACE_CONTEXT_KWARG in job.task_kwargs:
+        return job
+
+    carrier: dict[str, Any] = {}
+    propagate.inject(carrier)
+    if not carrier:
+        return job
+
+    carrier["deferred_at"] = time.time()
+    return job.evolve(task_kwargs={**job.task_kwargs, TRACE_CONTEXT_KWARG: carrier})
+
+
+def _get_metadata(job: Job) -> dict[str, Any] | None:
+    metadata = job.task_kwargs.get(TRACE_CONTEXT_KWARG)
+    return metadata if isinstance(metadata, dict) else None
+
+
+def get_queue_wait(job: Job, started_at: float) -> float | None:
+    """How long a job waited in its queue until a worker started it.
+
+    Only known for scheduled jobs and for jobs that carry the time of their defer
+    in their metadata, so it must be called before `trace_job` removed it.
+    """
+    metadata = _get_metadata(job)
+    ready_since: float | None = metadata.get("deferred_at") if metadata else None
+    if job.scheduled_at:
+        # A scheduled (or retried) job is only ready from its scheduled time on.
+        scheduled_at = job.scheduled_at.timestamp()
+        ready_since = max(ready_since or scheduled_at, scheduled_at)
+    if ready_since is None:
+        return None
+    return max(0.0, started_at - ready_since)
+
+
+async def trace_job(call_next: AsyncCallNext, context: JobContext, worker: Any) -> Any:
+    """A Procrastinate worker middleware that continues the trace of the deferrer."""
+    job = context.job
+    metadata = _get_metadata(job)
+    queue_wait = get_queue_wait(job, context.start_timestamp)
+    # The job arguments are passed to the task after the middlewares ran.
+    job.task_kwargs.pop(TRACE_CONTEXT_KWARG, None)
+
+    attributes: dict[str, Any] = {
+        "messaging.system": "procrastinate",
+        "messaging.operation.type": "process",
+        "messaging.destination.name": job.queue,
+        "messaging.message.id": str(job.id),
+        "procrastinate.task": job.task_name,
+        "procrastinate.job.attempts": job.attempts,
+    }
+    if queue_wait is not None:
+        attributes["procrastinate.job.queue_wait"] = queue_wait
+
+    with tracer.start_as_current_span(
+        f"process {job.task_name}",
+        context=propagate.extract(metadata) if metadata else None,
+        kind=trace.SpanKind.CONSUMER,
+        attributes=attributes,
+        start_time=int(context.start_timestamp * 1e9),
+    ):
+        return await call_next()
+
+
+def setup_job_tracing(app: App) -> None:
+    """Propagate the trace context through the jobs of a Procrastinate app.
+
+    Meant as `PROCRASTINATE_ON_APP_READY` hook (see module docstring). All ways of
+    deferring a job end up in the batch defer methods of the job manager.
+    """
+    job_manager = app.job_manager
+
+    batch_defer_jobs = job_manager.batch_defer_jobs
+    batch_defer_jobs_async = job_manager.batch_defer_jobs_async
+
+    @functools.wraps(batch_defer_jobs)
+    def traced_batch_defer_jobs(jobs: list[Job], connection: Any | None = None) -> list[Job]:
+        return batch_defer_jobs([inject_trace_context(job) for job in jobs], connection)
+
+    @functools.wraps(batch_defer_jobs_async)
+    async def traced_batch_defer_jobs_async(
+        jobs: list[Job], connection: Any | None = None
+    ) -> list[Job]:
+        return await batch_defer_jobs_async([inject_trace_context(job) for job in jobs], connection)
+
+    job_manager.batch_defer_jobs = traced_batch_defer_jobs
+    job_manager.batch_defer_jobs_async = traced_batch_defer_jobs_async
+
+    worker_middleware = app.worker_defaults.get("worker_middleware") or []
+    # Outermost, so that the span covers the other middlewares, too.
+    app.worker_defaults["worker_middleware"] = [trace_job, *worker_middleware]
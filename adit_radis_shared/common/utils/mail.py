@@ -1,8 +1,58 @@
+import hashlib
+import json
+
 from django.conf import settings
-from django.core.mail import mail_admins, send_mail
+from django.db import transaction
 from django.utils.html import strip_tags
+from procrastinate.exceptions import AlreadyEnqueued
 
 from adit_radis_shared.accounts.models import User
+from adit_radis_shared.common.models import OutboxMail
+from adit_radis_shared.common.tasks import send_outbox_mails
+
+
+def queue_mail(
+    subject: str,
+    text_content: str,
+    recipients: list[str],
+    html_content: str | None = None,
+    from_email: str | None = None,
+) -> None:
+    """Put an Email into the outbox to be sent by a background worker.
+
+    The mail is written in the transaction of the caller (and so only sent if it
+    commits) and the caller never waits for the mail server. An identical mail
+    that is still pending in the outbox is not queued a second time.
+    """
+    if not recipients:
+        return
+
+    content = json.dumps([subject, text_content, html_content, from_email, sorted(recipients)])
+    dedup_key = hashlib.sha256(content.encode()).hexdigest()
+
+    OutboxMail.objects.bulk_create(
+        [
+            OutboxMail(
+                subject=subject,
+                text_content=text_content,
+                html_content=html_content or "",
+                from_email=from_email or "",
+                recipients=recipients,
+                dedup_key=dedup_key,
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+    transaction.on_commit(_trigger_outbox)
+
+
+def _trigger_outbox() -> None:
+    try:
+        send_outbox_mails.defer()
+    except AlreadyEnqueued:
+        # A job to send the mails is already waiting
+        pass
 
 
 def send_mail_to_admins(
@@ -15,8 +65,17 @@ def send_mail_to_admins(
         assert html_content is not None
         text_content = strip_tags(html_content)
 
-    # Emails for admins are automatically prefixed.
-    mail_admins(subject, text_content, html_message=html_content)
+    # Like Django's mail_admins() we prefix the subject and send from the server Email.
+    recipients = [
+        admin if isinstance(admin, str) else admin[1] for admin in getattr(settings, "ADMINS", [])
+    ]
+    queue_mail(
+        settings.EMAIL_SUBJECT_PREFIX + subject,
+        text_content,
+        recipients,
+        html_content=html_content,
+        from_email=settings.SERVER_EMAIL,
+    )
 
 
 def send_mail_to_user(
@@ -30,10 +89,4 @@ def send_mail_to_user(
         assert html_content is not None
         text_content = strip_tags(html_content)
 
-    send_mail(
-        subject,
-        text_content,
-        None,
-        html_message=html_content,
-        recipient_list=[user.email],
-    )
+    queue_mail(subject, text_content, [user.email], html_content=html_content)
@@ -1,5 +1,8 @@
 from string import Template
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
+
 
 def procrastinate_on_delete_sql(app_name: str, model_name: str, reverse=False):
     """Create the SQL to set the on_delete behavior of a foreign key to SET_NULL.
@@ -22,3 +25,18 @@ def procrastinate_on_delete_sql(app_name: str, model_name: str, reverse=False):
         template += "\nON DELETE SET NULL;"
 
     return Template(template).substitute(app_name=app_name, model_name=model_name)
+
+
+def trigram_index(field_name: str, name: str) -> GinIndex:
+    """Create a trigram GIN index that supports case insensitive substring searches.
+
+    Django translates `icontains` on PostgreSQL to `UPPER(field) LIKE UPPER('%term%')`,
+    which can't use a B-tree index because of the leading wildcard. A trigram index
+    on the same `UPPER(field)` expression is used for those queries instead (see
+    `common.filters.TrigramSearchFilter`). Use it in the `Meta.indexes` of a model.
+    The migration that adds the index must run the `TrigramExtension` operation
+    (from `django.contrib.postgres.operations`) before to enable `pg_trgm`, and
+    `django.contrib.postgres` must be installed (otherwise the operator class ends
+    up inside the indexed expression).
+    """
+    return GinIndex(OpClass(Upper(field_name), name="gin_trgm_ops"), name=name)
@@ -0,0 +1,135 @@
+"""OpenTelemetry metrics of the Procrastinate job queue.
+
+- `procrastinate.jobs`: The number of jobs by queue, task and status, sampled with
+  one aggregate query each time the metrics are exported (see
+  `register_queue_metrics`).
+- `procrastinate.job.wait.duration`: How long a job waited from being ready (when
+  it was scheduled for or, if not scheduled, deferred) until a worker started it.
+  Only recorded for scheduled jobs and jobs that were deferred within a span (see
+  `job_tracing.get_queue_wait`), so that no query is needed per job.
+- `procrastinate.job.duration`: How long a job ran (by its outcome).
+
+The job histograms are recorded by the `record_job_metrics` worker middleware.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable
+from typing import Any
+
+from django import db
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+from procrastinate import JobContext
+from procrastinate.middleware import AsyncCallNext
+
+from .job_tracing import get_queue_wait
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+
+job_wait_histogram = meter.create_histogram(
+    "procrastinate.job.wait.duration",
+    unit="s",
+    description="Time a job waited in its queue until a worker started it.",
+)
+
+job_duration_histogram = meter.create_histogram(
+    "procrastinate.job.duration",
+    unit="s",
+    description="Time a worker spent processing a job.",
+)
+
+JOB_COUNTS_QUERY = """
+SELECT queue_name, task_name, status::text, count(*)
+FROM procrastinate_jobs
+GROUP BY queue_name, task_name, status
+"""
+
+# The process that registered the gauge (forked worker processes inherit it).
+_registered_pid: int | None = None
+_registered_lock = threading.Lock()
+_seen_series: set[tuple[str, str, str]] = set()
+
+
+def fetch_job_counts() -> dict[tuple[str, str, str], int]:
+    """The number of jobs by queue, task name and status."""
+    with db.connection.cursor() as cursor:
+        cursor.execute(JOB_COUNTS_QUERY)
+        return {(queue, task, status): count for queue, task, status, count in cursor.fetchall()}
+
+
+def _observe_jobs(options: CallbackOptions) -> Iterable[Observation]:
+    if os.getpid() != _registered_pid:
+        # Only the process that registered the gauge samples the jobs (and not the
+        # worker processes it forked), so that the series is exported only once.
+        return []
+
+    # Called in the thread of the metric reader, which keeps its own connection.
+    db.close_old_connections()
+    try:
+        counts = fetch_job_counts()
+    except Exception:
+        logger.warning("Failed to sample the Procrastinate jobs.", exc_info=True)
+        return []
+    finally:
+        db.close_old_connections()
+
+    # Series that disappeared (e.g. all jobs of a queue were processed) drop to zero
+    # instead of keeping their last value.
+    for series in _seen_series - counts.keys():
+        counts[series] = 0
+    _seen_series.update(counts)
+
+    return [
+        Observation(count, {"queue": queue, "task": task, "status": status})
+        for (queue, task, status), count in counts.items()
+    ]
+
+
+def register_queue_metrics() -> None:
+    """Sample the Procrastinate jobs on each export of the metrics.
+
+    Only called by the worker command (before it forks the worker processes), so
+    that the web processes don't query the jobs, too. Calling it multiple times has
+    no effect.
+    """
+    global _registered_pid
+
+    with _registered_lock:
+        if _registered_pid is not None:
+            return
+        meter.create_observable_gauge(
+            "procrastinate.jobs",
+            callbacks=[_observe_jobs],
+            unit="{job}",
+            description="Number of Procrastinate jobs by queue, task and status.",
+        )
+        _registered_pid = os.getpid()
+
+
+async def record_job_metrics(call_next: AsyncCallNext, context: JobContext, worker: Any) -> Any:
+    """A Procrastinate worker middleware that records the wait and run time of jobs.
+
+    Must run before `job_tracing.trace_job`, which removes the time of the defer
+    from the job.
+    """
+    job = context.job
+    attributes = {"queue": job.queue, "task": job.task_name}
+
+    queue_wait = get_queue_wait(job, context.start_timestamp)
+    if queue_wait is not None:
+        job_wait_histogram.record(queue_wait, attributes)
+
+    status = "failed"
+    try:
+        result = await call_next()
+        status = "succeeded"
+        return result
+    finally:
+        job_duration_histogram.record(
+            time.time() - context.start_timestamp, {**attributes, "status": status}
+        )
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import Future
+
+
+class SingleFlight[T]:
+    """Coalesces concurrent calls with the same key into one call.
+
+    The first caller of a key (the leader) does the actual work, all callers that
+    arrive while the leader is still busy wait for its result (or its exception)
+    instead of doing the same work again. Once the leader finished the key is
+    released, so results are never cached beyond the concurrent calls.
+    Callers can be threads (`do`) or asyncio tasks (`ado`), even mixed, as the
+    result is shared by a thread-safe `concurrent.futures.Future`.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future[T]] = {}
+
+    def _join(self, key: Hashable) -> tuple[Future[T], bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _release(self, key: Hashable) -> None:
+        with self._lock:
+            del self._calls[key]
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> tuple[T, bool]:
+        """Call `func` or wait for the result of a concurrent call with the same key.
+
+        Returns the result and whether it was shared from another call.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._release(key)
+        return result, False
+
+    async def ado(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """The async version of `do`.
+
+        The work of the leader runs in its own task, so that a cancelled leader (e.g.
+        because its client disconnected) doesn't cancel the calls waiting for it.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            # Each caller waits for the shared future through its own shielded future,
+            # as cancelling the wrapping future would cancel the shared one for all.
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+
+        async def run() -> T:
+            return await func()
+
+        task = asyncio.ensure_future(run())
+
+        def on_done(task: asyncio.Task[T]) -> None:
+            try:
+                if task.cancelled():
+                    future.cancel()
+                elif (err := task.exception()) is not None:
+                    future.set_exception(err)
+                else:
+                    future.set_result(task.result())
+            finally:
+                self._release(key)
+
+        task.add_done_callback(on_done)
+        return await asyncio.shield(task), False
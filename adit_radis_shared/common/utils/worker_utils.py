@@ -0,0 +1,301 @@
+import functools
+import inspect
+import os
+import resource
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from django.db import connection, transaction
+
+# The jobs that are ready to be processed (but not yet picked up by a worker) and
+# how long the oldest of them is already waiting. A job waits since it was
+# scheduled for or, if not scheduled, since it was deferred.
+QUEUE_STATS_QUERY = """
+SELECT
+    count(*) AS depth,
+    coalesce(extract(epoch FROM now() - min(coalesce(j.scheduled_at, e.at))), 0) AS oldest_wait
+FROM procrastinate_jobs j
+LEFT JOIN procrastinate_events e ON e.job_id = j.id AND e.type = 'deferred'
+WHERE j.status = 'todo'
+    AND (j.scheduled_at IS NULL OR j.scheduled_at <= now())
+    AND (%(queues)s::varchar[] IS NULL OR j.queue_name = ANY(%(queues)s))
+"""
+
+
+# Retries a batch of the running jobs of stalled workers (those with an outdated
+# heartbeat) or without a worker at all in one statement. It does the same as
+# Procrastinate's `procrastinate_retry_job_v2` function (that retries one job):
+# Jobs that were requested to be aborted fail instead. The status triggers of
+# Procrastinate record the events as usual.
+RETRY_STALLED_JOBS_QUERY = """
+WITH stalled_workers AS (
+    SELECT id
+    FROM procrastinate_workers
+    WHERE last_heartbeat < now() - make_interval(secs => %(seconds_since_heartbeat)s)
+), stalled_jobs AS (
+    SELECT job.id
+    FROM procrastinate_jobs job
+    LEFT JOIN stalled_workers sw ON sw.id = job.worker_id
+    WHERE job.status = 'doing'
+        AND (job.worker_id IS NULL OR sw.id IS NOT NULL)
+        AND (%(queue)s::varchar IS NULL OR job.queue_name = %(queue)s)
+    ORDER BY job.id
+    LIMIT %(batch_size)s
+    FOR UPDATE OF job SKIP LOCKED
+), retried_jobs AS (
+    UPDATE procrastinate_jobs job
+    SET status = (
+            CASE WHEN job.abort_requested THEN 'failed' ELSE 'todo' END
+        )::procrastinate_job_status,
+        attempts = CASE WHEN job.abort_requested THEN job.attempts ELSE job.attempts + 1 END,
+        scheduled_at = CASE WHEN job.abort_requested THEN job.scheduled_at ELSE now() END,
+        priority = CASE
+            WHEN job.abort_requested THEN job.priority
+            ELSE coalesce(%(priority)s, job.priority)
+        END
+    FROM stalled_jobs
+    WHERE job.id = stalled_jobs.id
+    RETURNING job.queue_name, job.task_name, job.status
+)
+SELECT queue_name, task_name, status::text, count(*)
+FROM retried_jobs
+GROUP BY queue_name, task_name, status
+"""
+
+
+def retry_stalled_jobs(
+    priority: int | None = None,
+    queue: str | None = None,
+    batch_size: int = 1000,
+    seconds_since_heartbeat: float = 30,
+) -> dict[tuple[str, str], int]:
+    """Retry the running jobs of stalled workers (like Procrastinate's `retry_job`).
+
+    Instead of retrying each job on its own, the jobs are retried set-based in
+    batches of `batch_size` jobs (each batch is one statement in its own short
+    transaction). Jobs locked by another retry are skipped.
+
+    Returns the number of retried jobs per queue and task name (jobs that failed
+    because their abortion was requested are not counted).
+    """
+    retried: dict[tuple[str, str], int] = {}
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                RETRY_STALLED_JOBS_QUERY,
+                {
+                    "priority": priority,
+                    "queue": queue,
+                    "batch_size": batch_size,
+                    "seconds_since_heartbeat": seconds_since_heartbeat,
+                },
+            )
+            rows = cursor.fetchall()
+
+        for queue_name, task_name, status, count in rows:
+            if status == "todo":
+                key = (queue_name, task_name)
+                retried[key] = retried.get(key, 0) + count
+
+        if sum(count for *_, count in rows) < batch_size:
+            return retried
+
+
+# Deletes a batch of the finished jobs (and their events) whose last event is older
+# than the given age and (optionally) archives them before. The jobs are locked, so
+# that concurrent prunes don't process the same jobs. Procrastinate's delete trigger
+# unlinks the periodic defers of the jobs.
+PRUNE_JOB_HISTORY_QUERY = """
+WITH old_jobs AS (
+    SELECT job.id
+    FROM procrastinate_jobs job
+    WHERE job.status IN ('succeeded', 'failed', 'cancelled', 'aborted')
+        AND (
+            SELECT max(e.at) FROM procrastinate_events e WHERE e.job_id = job.id
+        ) < now() - make_interval(secs => %(max_age)s)
+    ORDER BY job.id
+    LIMIT %(batch_size)s
+    FOR UPDATE OF job SKIP LOCKED
+), archived_jobs AS (
+    INSERT INTO common_archivedjob (
+        job_id, queue_name, task_name, status, args, attempts, events, finished_at, archived_at
+    )
+    SELECT job.id, job.queue_name, job.task_name, job.status::text, job.args, job.attempts,
+        coalesce(
+            jsonb_agg(jsonb_build_object('type', e.type, 'at', e.at) ORDER BY e.at)
+                FILTER (WHERE e.id IS NOT NULL),
+            '[]'::jsonb
+        ),
+        max(e.at),
+        now()
+    FROM procrastinate_jobs job
+    JOIN old_jobs ON old_jobs.id = job.id
+    LEFT JOIN procrastinate_events e ON e.job_id = job.id
+    WHERE %(archive)s
+    GROUP BY job.id
+    RETURNING 1
+), deleted_events AS (
+    DELETE FROM procrastinate_events e
+    USING old_jobs
+    WHERE e.job_id = old_jobs.id
+    RETURNING 1
+), deleted_jobs AS (
+    DELETE FROM procrastinate_jobs job
+    USING old_jobs
+    WHERE job.id = old_jobs.id
+    RETURNING 1
+)
+SELECT
+    (SELECT count(*) FROM deleted_jobs),
+    (SELECT count(*) FROM deleted_events),
+    (SELECT count(*) FROM archived_jobs)
+"""
+
+
+@dataclass
+class PruneReport:
+    jobs: int = 0
+    events: int = 0
+    archived: int = 0
+    batches: int = 0
+
+
+def prune_job_history(
+    max_age: float,
+    batch_size: int = 500,
+    pause: float = 0.5,
+    archive: bool = True,
+) -> PruneReport:
+    """Delete the finished jobs whose last event is older than `max_age` seconds.
+
+    The jobs (and their events) are deleted in batches of `batch_size` jobs, each in
+    its own short transaction, and with a pause of `pause` seconds in between, so
+    that autovacuum (and replicas) can keep up and the workers are not slowed down.
+    With `archive` the jobs are copied to `ArchivedJob` before.
+    """
+    report = PruneReport()
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                PRUNE_JOB_HISTORY_QUERY,
+                {"max_age": max_age, "batch_size": batch_size, "archive": archive},
+            )
+            jobs, events, archived = cursor.fetchone()
+
+        report.jobs += jobs
+        report.events += events
+        report.archived += archived
+        report.batches += 1
+
+        if jobs < batch_size:
+            return report
+        time.sleep(pause)
+
+
+@dataclass(frozen=True)
+class QueueStats:
+    depth: int
+    oldest_wait: float  # in seconds
+
+
+async def fetch_queue_stats(connector: Any, queues: list[str] | None = None) -> QueueStats:
+    """Fetch the depth and wait time of the queues (all queues if none are given).
+
+    `connector` is an (opened) async Procrastinate connector.
+    """
+    row = await connector.execute_query_one_async(QUEUE_STATS_QUERY, queues=queues or None)
+    return QueueStats(depth=row["depth"], oldest_wait=float(row["oldest_wait"]))
+
+
+class ConcurrencyAutoscaler:
+    """Decides how many jobs a worker should process concurrently.
+
+    The concurrency is raised right away (by the number of waiting jobs) when a job
+    waits longer than `scale_up_wait` seconds, but only lowered by one after the
+    queues were empty for `scale_down_samples` samples in a row. That hysteresis
+    keeps the worker from flapping between sizes on bursty queues.
+    """
+
+    def __init__(
+        self,
+        minimum: int,
+        maximum: int,
+        scale_up_wait: float = 5.0,
+        scale_down_samples: int = 6,
+    ) -> None:
+        if minimum < 1 or maximum < minimum:
+            raise ValueError(f"Invalid concurrency bounds {minimum} to {maximum}.")
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self.scale_up_wait = scale_up_wait
+        self.scale_down_samples = scale_down_samples
+        self._idle_samples = 0
+
+    def decide(self, current: int, stats: QueueStats) -> int:
+        """Return the concurrency for the latest sample of the queues."""
+        target = current
+        if stats.depth == 0:
+            self._idle_samples += 1
+            if self._idle_samples >= self.scale_down_samples:
+                self._idle_samples = 0
+                target = current - 1
+        else:
+            self._idle_samples = 0
+            if stats.oldest_wait >= self.scale_up_wait:
+                target = current + stats.depth
+
+        return max(self.minimum, min(self.maximum, target))
+
+
+def get_rss() -> int:
+    """The current resident set size (in bytes) of this process."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Not on Linux, so fall back to the peak RSS (in kilobytes on Linux, but in
+        # bytes on macOS).
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def wrap_task_funcs(app: Any, wrap: Callable[[Callable], Callable]) -> None:
+    """Wrap the functions of all tasks of a Procrastinate app.
+
+    `wrap` gets the function of a task and must return a function with the same
+    signature (an async function for an async task).
+    """
+    for task in app.tasks.values():
+        task.func = wrap(task.func)
+
+
+def on_job_finished(callback: Callable[[], None]) -> Callable[[Callable], Callable]:
+    """A task function wrapper (see `wrap_task_funcs`) that calls `callback` after
+    each job (whether it succeeded or failed)."""
+
+    def wrap(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    callback()
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                callback()
+
+        return wrapper
+
+    return wrap
@@ -1,25 +1,49 @@
-from typing import Any
-
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator, Awaitable
+from typing import Any, cast
+from weakref import WeakKeyDictionary
+
+import httpx
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.mixins import (
     LoginRequiredMixin,
     UserPassesTestMixin,
 )
-from django.core.exceptions import SuspiciousOperation
+from django.contrib.auth.models import Group
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied, SuspiciousOperation
+from django.db.models import Q
 from django.forms import Form
-from django.http import HttpResponse
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.shortcuts import render
 from django.urls import re_path
 from django.views.generic import FormView, View
 from django.views.generic.base import TemplateView
+from opentelemetry import metrics
 from revproxy.views import ProxyView
 
 from adit_radis_shared.accounts.models import User
-from adit_radis_shared.common.forms import BroadcastForm
+from adit_radis_shared.common.forms import BroadcastForm, UserSearchSelectMultiple
 from adit_radis_shared.common.models import ProjectSettings
 from adit_radis_shared.common.tasks import broadcast_mail
+from adit_radis_shared.common.utils.auth_utils import is_logged_in_user
 
 from .types import AuthenticatedHttpRequest, HtmxHttpRequest
 
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+
+upstream_duration_histogram = meter.create_histogram(
+    "http.client.request.duration",
+    unit="s",
+    description="Time until an upstream of a proxy view responded with its headers.",
+)
+
 
 class HtmxTemplateView(TemplateView):
     def get(self, request: HtmxHttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
@@ -28,6 +52,22 @@ class HtmxTemplateView(TemplateView):
         return super().get(request, *args, **kwargs)
 
 
+class AsyncTemplateView(TemplateView):
+    """A template view with an async GET handler.
+
+    The context is built by the async `aget_context_data()` so that the async view
+    mixins (see common/mixins.py) can use the async ORM. The template response
+    itself is rendered later by the (async) request handler.
+    """
+
+    async def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        context = await self.aget_context_data(**kwargs)
+        return self.render_to_response(context)
+
+    async def aget_context_data(self, **kwargs) -> dict[str, Any]:
+        return self.get_context_data(**kwargs)
+
+
 class BaseHomeView(TemplateView):
     template_name: str
 
@@ -71,21 +111,61 @@ class BaseUpdatePreferencesView(LoginRequiredMixin, View):
 class BroadcastView(LoginRequiredMixin, UserPassesTestMixin, FormView):
     template_name = "common/broadcast.html"
     form_class = BroadcastForm
+    user_search_limit = 20
     request: AuthenticatedHttpRequest
 
     def test_func(self) -> bool:
         return self.request.user.is_staff
 
+    def get(self, request: HtmxHttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        if request.htmx and "user_search" in request.GET:
+            return self.search_users(request)
+        return super().get(request, *args, **kwargs)
+
+    def search_users(self, request: HtmxHttpRequest) -> HttpResponse:
+        """Render the options of the users widget for an htmx search request."""
+        search = request.GET["user_search"].strip()
+        selected = [pk for pk in request.GET.getlist("users") if pk.isdigit()]
+        users = User.objects.order_by("username").only("pk", "username", "email")
+
+        found_users = User.objects.none()
+        if search:
+            found_users = users.filter(
+                Q(username__icontains=search) | Q(email__icontains=search)
+            ).exclude(pk__in=selected)[: self.user_search_limit]
+
+        return render(
+            request,
+            "common/_user_search_options.html",
+            {"selected_users": users.filter(pk__in=selected), "found_users": found_users},
+        )
+
+    def get_form(self, form_class=None) -> Form:
+        form = super().get_form(form_class)
+        widget = form.fields["users"].widget
+        assert isinstance(widget, UserSearchSelectMultiple)
+        widget.search_url = self.request.path
+        return form
+
     def get_success_url(self) -> str:
         return self.request.path
 
     def form_valid(self, form: Form) -> HttpResponse:
-        recipients: list[User] = form.cleaned_data["recipients"]
+        audience: str = form.cleaned_data["audience"]
+        groups: list[Group] = form.cleaned_data["groups"]
+        users: list[User] = form.cleaned_data["users"]
         subject: str = form.cleaned_data["subject"]
         message: str = form.cleaned_data["message"]
 
-        emails: list[str] = [recipient.email for recipient in recipients]
-        broadcast_mail.defer(recipients=emails, subject=subject, message=message)
+        # The recipients are resolved by the task itself, so that we don't have to
+        # load (and pass around) the Email addresses of all users here.
+        broadcast_mail.defer(
+            subject=subject,
+            message=message,
+            audience=audience,
+            group_ids=[group.pk for group in groups],
+            user_ids=[user.pk for user in users],
+        )
 
         messages.add_message(
             self.request,
@@ -112,3 +192,201 @@ class AdminProxyView(LoginRequiredMixin, UserPassesTestMixin, ProxyView):
     @classmethod
     def as_url(cls):
         return re_path(rf"^{cls.url_prefix}/(?P<path>.*)$", cls.as_view())  # type: ignore
+
+
+# Headers that only apply to a single connection and must not be forwarded by a proxy.
+HOP_BY_HOP_HEADERS = frozenset(
+    (
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailer",
+        "transfer-encoding",
+        "upgrade",
+    )
+)
+
+_proxy_clients: WeakKeyDictionary[asyncio.AbstractEventLoop, dict[Any, httpx.AsyncClient]] = (
+    WeakKeyDictionary()
+)
+
+
+class AsyncAdminProxyView(View):
+    """An async reverse proxy view to the services that only an admin can access.
+
+    Like `AdminProxyView`, but for ASGI. The upstream connections are kept alive in
+    a pool that is shared by all requests to the same upstream, and request and
+    response bodies are streamed in chunks (instead of being buffered in memory),
+    so that large pages and downloads don't tie up a thread per request.
+    """
+
+    upstream: str
+    url_prefix: str
+
+    # All timeouts are in seconds (the read timeout is per chunk, not for the whole body).
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 60.0
+    pool_timeout: float = 10.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    chunk_size: int = 64 * 1024
+
+    @classmethod
+    def as_url(cls):
+        return re_path(rf"^{cls.url_prefix}/(?P<path>.*)$", cls.as_view())
+
+    @classmethod
+    def as_view(cls, **initkwargs: Any):
+        view = super().as_view(**initkwargs)
+        # Like the ProxyView of revproxy (and so AdminProxyView), as the upstream
+        # checks the CSRF token itself (and the request body must not be consumed).
+        view.csrf_exempt = True
+        return view
+
+    def get_client(self) -> httpx.AsyncClient:
+        """The pooled client of the upstream (connections are bound to an event loop)."""
+        clients = _proxy_clients.setdefault(asyncio.get_running_loop(), {})
+        key = (
+            self.upstream,
+            self.connect_timeout,
+            self.read_timeout,
+            self.write_timeout,
+            self.pool_timeout,
+            self.max_connections,
+            self.max_keepalive_connections,
+        )
+        client = clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    connect=self.connect_timeout,
+                    read=self.read_timeout,
+                    write=self.write_timeout,
+                    pool=self.pool_timeout,
+                ),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                ),
+                follow_redirects=False,
+            )
+            clients[key] = client
+        return client
+
+    def get_upstream_url(self, path: str) -> str:
+        return f"{self.upstream.rstrip('/')}/{path}"
+
+    def get_request_headers(self, request: HttpRequest) -> dict[str, str]:
+        headers = {
+            name: value
+            for name, value in request.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() != "host"
+        }
+        forwarded_for = request.headers.get("X-Forwarded-For")
+        client_ip = request.META.get("REMOTE_ADDR", "")
+        headers["X-Forwarded-For"] = f"{forwarded_for}, {client_ip}" if forwarded_for else client_ip
+        headers["X-Forwarded-Host"] = request.get_host()
+        headers["X-Forwarded-Proto"] = request.scheme or "http"
+        return headers
+
+    async def _stream_request_body(self, request: HttpRequest) -> AsyncIterator[bytes]:
+        # The ASGI handler spools the request body to a (temporary) file, which we
+        # read in chunks instead of loading it completely into memory.
+        while chunk := await sync_to_async(request.read)(self.chunk_size):
+            yield chunk
+
+    def rewrite_location(self, location: str) -> str:
+        """Make redirects to the upstream point back to the proxy."""
+        upstream = self.upstream.rstrip("/")
+        if location.startswith(upstream):
+            return f"/{self.url_prefix}{location[len(upstream) :]}"
+        return location
+
+    async def dispatch(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponseBase:
+        user = await request.auser()
+        if not is_logged_in_user(user):
+            return redirect_to_login(request.get_full_path())
+        if not user.is_staff:
+            raise PermissionDenied
+        # All handlers of this view are async.
+        return await cast(Awaitable[HttpResponseBase], super().dispatch(request, *args, **kwargs))
+
+    async def get(self, request: HttpRequest, path: str = "") -> HttpResponseBase:
+        return await self.proxy(request, path)
+
+    async def post(self, request: HttpRequest, path: str = "") -> HttpResponseBase:
+        return await self.proxy(request, path)
+
+    async def put(self, request: HttpRequest, path: str = "") -> HttpResponseBase:
+        return await self.proxy(request, path)
+
+    async def patch(self, request: HttpRequest, path: str = "") -> HttpResponseBase:
+        return await self.proxy(request, path)
+
+    async def delete(self, request: HttpRequest, path: str = "") -> HttpResponseBase:
+        return await self.proxy(request, path)
+
+    async def head(self, request: HttpRequest, path: str = "") -> HttpResponseBase:
+        return await self.proxy(request, path)
+
+    async def options(self, request: HttpRequest, path: str = "") -> HttpResponseBase:
+        return await self.proxy(request, path)
+
+    async def proxy(self, request: HttpRequest, path: str) -> HttpResponseBase:
+        client = self.get_client()
+        has_body = "Content-Length" in request.headers or "Transfer-Encoding" in request.headers
+        upstream_request = client.build_request(
+            request.method or "GET",
+            self.get_upstream_url(path),
+            params=request.GET.urlencode(),
+            headers=self.get_request_headers(request),
+            content=self._stream_request_body(request) if has_body else None,
+        )
+
+        attributes: dict[str, Any] = {
+            "server.address": upstream_request.url.host,
+            "http.request.method": upstream_request.method,
+        }
+        start = time.perf_counter()
+        try:
+            upstream_response = await client.send(upstream_request, stream=True)
+        except httpx.TimeoutException as err:
+            attributes["error.type"] = type(err).__name__
+            logger.warning("Timeout while proxying to %s: %s", upstream_request.url, err)
+            return HttpResponse("Upstream timed out.", status=504)
+        except httpx.TransportError as err:
+            attributes["error.type"] = type(err).__name__
+            logger.warning("Error while proxying to %s: %s", upstream_request.url, err)
+            return HttpResponse("Upstream unavailable.", status=502)
+        finally:
+            # The latency until the upstream responded with its headers.
+            upstream_duration_histogram.record(time.perf_counter() - start, attributes)
+
+        async def stream_response_body() -> AsyncIterator[bytes]:
+            try:
+                # The raw (still content encoded) body, so we also pass on the encoding.
+                async for chunk in upstream_response.aiter_raw(self.chunk_size):
+                    yield chunk
+            finally:
+                await upstream_response.aclose()
+
+        response = StreamingHttpResponse(
+            stream_response_body(), status=upstream_response.status_code
+        )
+        for name, value in upstream_response.headers.multi_items():
+            if name.lower() in HOP_BY_HOP_HEADERS:
+                continue
+            if name.lower() == "set-cookie":
+                # Cookies can't be combined into one header, Django sends each one separately.
+                response.cookies.load(value)
+                continue
+            if name.lower() == "location":
+                value = self.rewrite_location(value)
+            if name in response.headers:
+                # Other repeated headers can be combined into a comma separated list.
+                value = f"{response.headers[name]}, {value}"
+            response.headers[name] = value
+        return response
@@ -0,0 +1,256 @@
+"""Thread pool executors for running sync code from async code.
+
+asgiref runs sync code (like the Django ORM) called from async views, middlewares
+and Channels consumers in thread pool executors. This module makes those pools
+configurable by environment variables and observable by OpenTelemetry metrics
+(queue depth, wait time until a thread picks up the work, busy threads).
+
+- `ASGI_THREADS`: The size of the default executor of each event loop, which is
+  used by `sync_to_async(..., thread_sensitive=False)` (defaults to the Python
+  default of `min(32, CPUs + 4)`). asgiref itself honors the same variable, but
+  only for the event loops it creates on its own.
+- `ASGI_DB_THREADS`: The size of the pool for database bound work, see
+  `db_sync_to_async` (defaults to 10).
+- `ASGI_CPU_THREADS`: The size of the pool for CPU bound work, see
+  `cpu_sync_to_async` (defaults to the number of CPUs).
+
+`db_sync_to_async` and `cpu_sync_to_async` are opt-in, the ORM calls of Django
+itself (and of all views that use plain `sync_to_async`) are thread sensitive and
+run in the single threaded executor of their request instead. Those per request
+executors are instrumented too (as pool `thread_sensitive`), but they can't be
+sized as they must stay single threaded.
+
+`install_executors` is called by `setup_opentelemetry`, so the executors are only
+replaced when telemetry is active. Event loop policies are deprecated since
+Python 3.14, so there the default executors of the event loops are left alone
+(and `ASGI_THREADS` only applies to the event loops created by asgiref).
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Literal
+
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext, sync_to_async
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+
+executor_wait_histogram = meter.create_histogram(
+    "executor.wait.duration",
+    unit="s",
+    description="Time sync work waited in the queue of an executor until a thread picked it up.",
+)
+
+_executors: weakref.WeakSet["InstrumentedThreadPoolExecutor"] = weakref.WeakSet()
+
+Pool = Literal["db", "cpu"]
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """A thread pool executor that records how busy it is.
+
+    The executors of the same `pool` are aggregated in the metrics (e.g. the
+    default executors of multiple event loops).
+    """
+
+    def __init__(self, pool: str, max_workers: int | None = None) -> None:
+        super().__init__(max_workers=max_workers, thread_name_prefix=f"executor-{pool}")
+        self.pool = pool
+        self.active = 0
+        self._active_lock = threading.Lock()
+        _executors.add(self)
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        submitted = time.perf_counter()
+
+        def run() -> Any:
+            executor_wait_histogram.record(time.perf_counter() - submitted, {"pool": self.pool})
+            with self._active_lock:
+                self.active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._active_lock:
+                    self.active -= 1
+
+        return super().submit(run)
+
+    @property
+    def queue_depth(self) -> int:
+        if self._shutdown:
+            # The queue only holds the sentinel that wakes up the threads to exit.
+            return 0
+        return self._work_queue.qsize()
+
+
+def _observe_queue_depth(options: CallbackOptions) -> Iterable[Observation]:
+    depths: dict[str, int] = {}
+    for executor in list(_executors):
+        depths[executor.pool] = depths.get(executor.pool, 0) + executor.queue_depth
+    return [Observation(depth, {"pool": pool}) for pool, depth in depths.items()]
+
+
+def _observe_active_threads(options: CallbackOptions) -> Iterable[Observation]:
+    active: dict[str, int] = {}
+    for executor in list(_executors):
+        active[executor.pool] = active.get(executor.pool, 0) + executor.active
+    return [Observation(count, {"pool": pool}) for pool, count in active.items()]
+
+
+meter.create_observable_gauge(
+    "executor.queue.depth",
+    callbacks=[_observe_queue_depth],
+    unit="{task}",
+    description="Number of sync tasks waiting for a thread of an executor.",
+)
+
+meter.create_observable_gauge(
+    "executor.threads.active",
+    callbacks=[_observe_active_threads],
+    unit="{thread}",
+    description="Number of executor threads that are running sync work.",
+)
+
+
+def _env_threads(name: str, default: int | None) -> int | None:
+    value = os.environ.get(name, "")
+    if not value:
+        return default
+    try:
+        threads = int(value)
+    except ValueError:
+        threads = 0
+    if threads < 1:
+        logger.warning("Invalid %s=%r, using the default.", name, value)
+        return default
+    return threads
+
+
+_pools: dict[str, InstrumentedThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_executor(pool: Pool) -> InstrumentedThreadPoolExecutor:
+    """The (process wide) executor of a pool, created on first use."""
+    with _pools_lock:
+        executor = _pools.get(pool)
+        if executor is None:
+            if pool == "db":
+                max_workers = _env_threads("ASGI_DB_THREADS", 10)
+            else:
+                max_workers = _env_threads("ASGI_CPU_THREADS", os.cpu_count() or 1)
+            executor = InstrumentedThreadPoolExecutor(pool, max_workers)
+            _pools[pool] = executor
+        return executor
+
+
+def _close_old_connections() -> None:
+    from django.db import close_old_connections
+
+    close_old_connections()
+
+
+def db_sync_to_async(func: Callable) -> Callable:
+    """Like `sync_to_async`, but runs database bound work in the database pool.
+
+    In contrast to the default (thread sensitive) `sync_to_async` the calls run in
+    parallel on up to `ASGI_DB_THREADS` threads. As each thread has its own database
+    connection, stale connections are closed before and after the call (like
+    Channels' `database_sync_to_async` does).
+    """
+
+    @functools.wraps(func)
+    def inner(*args: Any, **kwargs: Any) -> Any:
+        _close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _close_old_connections()
+
+    return sync_to_async(inner, thread_sensitive=False, executor=get_executor("db"))
+
+
+def cpu_sync_to_async(func: Callable) -> Callable:
+    """Like `sync_to_async`, but runs CPU bound work in the CPU pool.
+
+    The work must not access the database.
+    """
+    return sync_to_async(func, thread_sensitive=False, executor=get_executor("cpu"))
+
+
+class _ExecutorEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    """Gives each new event loop an instrumented default executor."""
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        loop = super().new_event_loop()
+        loop.set_default_executor(
+            InstrumentedThreadPoolExecutor("default", _env_threads("ASGI_THREADS", None))
+        )
+        return loop
+
+
+class _ThreadSensitiveExecutors(
+    weakref.WeakKeyDictionary[ThreadSensitiveContext, ThreadPoolExecutor]
+):
+    """Gives each thread sensitive context (e.g. a request) an instrumented executor.
+
+    asgiref checks if the context already has an executor before creating a plain
+    one, so the check creates the instrumented one instead.
+    """
+
+    def __contains__(self, key: object) -> bool:
+        if not super().__contains__(key) and isinstance(key, ThreadSensitiveContext):
+            self[key] = InstrumentedThreadPoolExecutor("thread_sensitive", 1)
+        return super().__contains__(key)
+
+
+_installed = False
+
+
+def _reset_after_fork() -> None:
+    # The threads of the executors are not forked, but an executor would still
+    # count its idle threads and wait for them instead of starting new ones.
+    global _pools_lock
+
+    _pools.clear()
+    _pools_lock = threading.Lock()
+    SyncToAsync.single_thread_executor = InstrumentedThreadPoolExecutor("thread_sensitive", 1)
+
+
+def install_executors() -> None:
+    """Replace the executors used by asgiref with instrumented ones.
+
+    Must be called before the event loop of the server is created. Event loops
+    that already exist keep their (not instrumented) default executor.
+    """
+    global _installed
+
+    if _installed:
+        return
+
+    if sys.version_info < (3, 14):
+        asyncio.set_event_loop_policy(_ExecutorEventLoopPolicy())
+
+    # The executor of thread sensitive calls outside of a request. It must stay
+    # single threaded.
+    SyncToAsync.single_thread_executor = InstrumentedThreadPoolExecutor("thread_sensitive", 1)
+
+    # Django runs each request in its own thread sensitive context with its own
+    # (single threaded) executor.
+    SyncToAsync.context_to_thread_executor = _ThreadSensitiveExecutors()
+
+    # Prefork servers fork their workers after the executors were installed.
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+    _installed = True
@@ -0,0 +1,71 @@
+"""Keeps the telemetry working in processes forked after `setup_opentelemetry`.
+
+Prefork servers (see `PreforkSupervisor`) fork their workers after telemetry was
+set up. The batch processors and the metric reader of the SDK restart their export
+threads in a forked process on their own, but two things are inherited that must
+not be shared:
+
+- The resource, so all workers would report as the same instance and their
+  metrics would overwrite each other. Each process gets its own
+  `service.instance.id` instead.
+- The HTTP connections of the OTLP exporters, which would be used by multiple
+  processes at once. The forked process opens its own connections instead.
+
+Metrics that were recorded before the fork are still inherited (the supervising
+process records hardly any).
+"""
+
+import logging
+import os
+from collections.abc import Callable, Iterable, Mapping
+
+import requests
+from opentelemetry.attributes import BoundedAttributes
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.util.types import AttributeValue
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessResource(Resource):
+    """A resource whose attributes can be renewed in a forked process.
+
+    The providers, tracers, meters and loggers all keep a reference to the same
+    resource, so renewing it in place changes the resource of all of them.
+    """
+
+    def __init__(self, resource: Resource) -> None:
+        super().__init__(resource.attributes, resource.schema_url)
+
+    def renew(self, attributes: Mapping[str, AttributeValue]) -> None:
+        self._attributes = BoundedAttributes(attributes={**self._attributes, **attributes})
+
+
+def reset_session(session: requests.Session) -> None:
+    """Drop the (inherited) connections of a session without closing them.
+
+    Closing them would also end the connections of the parent process.
+    """
+    session.adapters.clear()
+    session.mount("https://", HTTPAdapter())
+    session.mount("http://", HTTPAdapter())
+
+
+def register_fork_handler(
+    resource: ProcessResource,
+    sessions: Iterable[requests.Session],
+    build_attributes: Callable[[], Mapping[str, AttributeValue]],
+) -> None:
+    """Renew the resource (by `build_attributes`) and the sessions in forked processes."""
+    sessions = list(sessions)
+
+    def after_in_child() -> None:
+        try:
+            resource.renew(build_attributes())
+            for session in sessions:
+                reset_session(session)
+        except Exception:
+            logger.warning("Failed to renew the telemetry in forked process.", exc_info=True)
+
+    os.register_at_fork(after_in_child=after_in_child)
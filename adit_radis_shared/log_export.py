@@ -0,0 +1,180 @@
+"""Limits the log records that are exported by OpenTelemetry.
+
+A chatty library (e.g. in debug mode) can log faster than the records can be
+exported, so the exporter queue overflows and the collector gets flooded. Before a
+record is passed to the `BatchLogRecordProcessor` it has to pass (in this order):
+
+- The level of its logger (see `levels`), so that e.g. the debug records of a
+  library can be dropped while the own debug records are exported.
+- The repetition limit: Records with the same logger, level and message template
+  are only exported `repeat_limit` times per `repeat_window`.
+- The rate limit: A token bucket that allows `rate_limit` records per second on
+  average and bursts of up to `burst` records.
+
+How many records were dropped by the limits is exported as a summary record
+before the next record that passes them. The handler is added by
+`add_otel_logging_handler`, which reads the limits from the environment (see
+`ExportSettings`).
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Mapping
+
+from opentelemetry._logs import LoggerProvider
+from opentelemetry.sdk._logs import LoggingHandler
+
+# The repetition counts of (too) many different messages are dropped early.
+MAX_REPEAT_KEYS = 10000
+
+
+def parse_levels(value: str) -> dict[str, str]:
+    """Parse levels like "INFO,urllib3=WARNING" (a level without logger is the default)."""
+    levels: dict[str, str] = {}
+    for item in value.split(","):
+        name, _, level = item.strip().rpartition("=")
+        level = level.strip().upper()
+        if not level:
+            continue
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Unknown log level {level!r}.")
+        levels[name.strip()] = level
+    return levels
+
+
+class LogExportFilter:
+    """Decides which log records are exported and counts the dropped ones."""
+
+    def __init__(
+        self,
+        levels: Mapping[str, str | int] | None = None,
+        rate_limit: float = 0,
+        burst: int = 1,
+        repeat_limit: int = 0,
+        repeat_window: float = 60.0,
+    ) -> None:
+        """
+        Args:
+            levels: The minimum level by logger name (which also applies to its
+                child loggers), the empty name sets the default.
+            rate_limit: How many records per second are exported on average (0 to
+                not limit the rate).
+            burst: How many records are exported at once before the rate limit
+                kicks in.
+            repeat_limit: How often the same message is exported per window (0 to
+                not limit repetitions).
+            repeat_window: The length (in seconds) of the repetition window.
+        """
+        self.levels = {
+            name: level if isinstance(level, int) else logging.getLevelName(level.upper())
+            for name, level in (levels or {}).items()
+        }
+        self.rate_limit = rate_limit
+        self.burst = max(burst, 1)
+        self.repeat_limit = repeat_limit
+        self.repeat_window = repeat_window
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._repeats: dict[tuple[str, int, str], int] = {}
+        self._window_started = self._refilled_at
+        self.rate_limited = 0
+        self.repeated = 0
+
+    def level_of(self, logger_name: str) -> int:
+        """The minimum level of a logger (by its own name or the closest parent)."""
+        name = logger_name
+        while True:
+            level = self.levels.get(name)
+            if level is not None:
+                return level
+            if not name:
+                return logging.NOTSET
+            name = name.rpartition(".")[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level_of(record.name):
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            if not self._allow_repeat(record, now):
+                self.repeated += 1
+                return False
+            if not self._take_token(now):
+                self.rate_limited += 1
+                return False
+        return True
+
+    def _allow_repeat(self, record: logging.LogRecord, now: float) -> bool:
+        if not self.repeat_limit or self.repeat_window <= 0:
+            return True
+        window_ended = now - self._window_started >= self.repeat_window
+        if window_ended or len(self._repeats) >= MAX_REPEAT_KEYS:
+            self._repeats.clear()
+            self._window_started = now
+        key = (record.name, record.levelno, str(record.msg))
+        count = self._repeats.get(key, 0) + 1
+        self._repeats[key] = count
+        return count <= self.repeat_limit
+
+    def _take_token(self, now: float) -> bool:
+        if self.rate_limit <= 0:
+            return True
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate_limit)
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def pop_suppressed(self) -> tuple[int, int]:
+        """The number of rate limited and repeated records since the last call."""
+        with self._lock:
+            suppressed = self.rate_limited, self.repeated
+            self.rate_limited = self.repeated = 0
+        return suppressed
+
+
+class ThrottledLoggingHandler(LoggingHandler):
+    """An OpenTelemetry logging handler that applies a `LogExportFilter`."""
+
+    def __init__(
+        self,
+        level: int | str = logging.NOTSET,
+        levels: Mapping[str, str | int] | None = None,
+        rate_limit: float = 0,
+        burst: int = 1,
+        repeat_limit: int = 0,
+        repeat_window: float = 60.0,
+        logger_provider: LoggerProvider | None = None,
+    ) -> None:
+        super().__init__(logger_provider=logger_provider)
+        self.setLevel(level)
+        self.export_filter = LogExportFilter(levels, rate_limit, burst, repeat_limit, repeat_window)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self.export_filter.filter(record):
+            return
+        rate_limited, repeated = self.export_filter.pop_suppressed()
+        if rate_limited or repeated:
+            super().emit(_summary_record(rate_limited, repeated))
+        super().emit(record)
+
+
+def _summary_record(rate_limited: int, repeated: int) -> logging.LogRecord:
+    record = logging.LogRecord(
+        __name__,
+        logging.WARNING,
+        __file__,
+        0,
+        "%d log messages suppressed (%d rate limited, %d repeated).",
+        (rate_limited + repeated, rate_limited, repeated),
+        None,
+    )
+    record.suppressed_rate_limited = rate_limited
+    record.suppressed_repeated = repeated
+    return record
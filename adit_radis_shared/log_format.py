@@ -0,0 +1,58 @@
+"""A log formatter for compact JSON lines.
+
+Each record becomes one line like:
+
+    {"time":"2025-01-01T12:00:00.123Z","level":"INFO","logger":"myapp","message":"Hi",
+     "trace_id":"0af7651916cd43dd8448eb211c80319c","span_id":"b7ad6b7169203331"}
+
+The trace and span ids of the active span are added (if any), so that the lines
+can be correlated with the traces. Extra attributes of the record (`extra=...`)
+are added as well, values that are not JSON serializable as their string.
+"""
+
+import json
+import logging
+import time
+from typing import Any
+
+from opentelemetry import trace
+
+# The attributes every log record has (and the ones added by formatting it).
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+}
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str).encode
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a log record as a compact JSON line (see module docstring)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        seconds = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        line: dict[str, Any] = {
+            "time": f"{seconds}.{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            line["trace_id"] = trace.format_trace_id(span_context.trace_id)
+            line["span_id"] = trace.format_span_id(span_context.span_id)
+
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in line:
+                line[key] = value
+
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line["exception"] = record.exc_text
+        if record.stack_info:
+            line["stack"] = self.formatStack(record.stack_info)
+
+        return _encode(line)
@@ -0,0 +1,101 @@
+"""Non-blocking logging by handing the records to a thread.
+
+File and stream handlers write synchronously, so logging from a request thread or
+the event loop of the ASGI server waits for the disk or the terminal.
+`NonBlockingQueueHandler` only puts the record into a queue and a
+`QueueListener` thread passes it on to the actual handlers. The logging config
+is rewritten accordingly by `use_queue_handlers` (see `telemetry`).
+
+In contrast to the `QueueHandler` of the standard library:
+
+- The listener is started when the handler is configured and stopped (after
+  handling the queued records) when the handler is closed on shutdown.
+- The records keep their exception info (e.g. for the OpenTelemetry handler),
+  only the message is merged with its arguments right away (as the arguments
+  could change or not be usable from another thread, like Django models).
+- The OpenTelemetry context of the logging thread is restored while the record
+  is handled, so that the handlers see the active span (e.g. for trace ids).
+- A forked process (see `PreforkSupervisor`) gets a new queue and listener
+  thread, as threads don't survive a fork.
+"""
+
+import copy
+import logging
+import os
+import queue
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+
+from opentelemetry import context
+
+_CONTEXT_ATTR = "_otel_context"
+
+_handlers: weakref.WeakSet["NonBlockingQueueHandler"] = weakref.WeakSet()
+
+
+class ContextQueueListener(QueueListener):
+    """A queue listener that handles the records in the context they were logged in."""
+
+    def handle(self, record: logging.LogRecord) -> None:
+        record_context = record.__dict__.pop(_CONTEXT_ATTR, None)
+        token = context.attach(record_context) if record_context is not None else None
+        try:
+            super().handle(record)
+        finally:
+            if token is not None:
+                context.detach(token)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """A queue handler that runs its listener (see module docstring).
+
+    Meant to be configured by `logging.config.dictConfig` (with the `handlers` to
+    pass the records on to and `ContextQueueListener` as `listener`), which sets
+    the listener after creating the handler.
+    """
+
+    _listener: QueueListener | None = None
+
+    def __init__(self, queue: queue.Queue) -> None:
+        super().__init__(queue)
+        _handlers.add(self)
+
+    @property
+    def listener(self) -> QueueListener | None:
+        return self._listener
+
+    @listener.setter
+    def listener(self, listener: QueueListener | None) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+        self._listener = listener
+        if listener is not None:
+            listener.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.__dict__[_CONTEXT_ATTR] = context.get_current()
+        return record
+
+    def close(self) -> None:
+        self.listener = None
+        super().close()
+
+    def _restart(self) -> None:
+        self.queue = queue.Queue()
+        listener = self._listener
+        if listener is not None:
+            listener.queue = self.queue
+            listener._thread = None
+            listener.start()
+
+
+def _restart_after_fork() -> None:
+    for handler in list(_handlers):
+        handler._restart()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
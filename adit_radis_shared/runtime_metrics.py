@@ -0,0 +1,188 @@
+"""Runtime metrics of the Python process (opt-in).
+
+- `process.runtime.gc.duration`: The pauses of the garbage collector (by generation).
+- `process.runtime.gc.collections`: The number of collections (by generation).
+- `process.thread.count`: The number of threads of the process.
+- `asyncio.event_loop.lag`: How late the callbacks of an event loop run (see
+  `monitor_event_loop`), which shows when sync code blocks the loop.
+- `postgresql.connections` / `postgresql.connections.limit`: The connections to
+  the Django database (by state) and the maximum number of connections. Those are
+  database wide, so they are only sampled by the process that installed the
+  metrics (and not by the worker processes it forked).
+
+The metrics are enabled by setting `OTEL_RUNTIME_METRICS` to true, then
+`setup_opentelemetry` calls `install_runtime_metrics`. As long as they are not
+installed no GC callback is registered and `monitor_event_loop` does nothing.
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable
+from typing import Any
+
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter(__name__)
+
+gc_duration_histogram = meter.create_histogram(
+    "process.runtime.gc.duration",
+    unit="s",
+    description="Time the garbage collector paused the process.",
+)
+
+loop_lag_histogram = meter.create_histogram(
+    "asyncio.event_loop.lag",
+    unit="s",
+    description="Delay of a scheduled callback of an event loop.",
+)
+
+DB_CONNECTIONS_QUERY = """
+SELECT coalesce(state, 'unknown'), count(*), current_setting('max_connections')::int
+FROM pg_stat_activity
+WHERE datname = current_database()
+GROUP BY state
+"""
+
+_installed = False
+_installed_lock = threading.Lock()
+# The process that installed the metrics (forked worker processes inherit it).
+_installed_pid: int | None = None
+_gc_started: float | None = None
+_db_connection_limit: int | None = None
+
+
+def _on_gc(phase: str, info: dict[str, Any]) -> None:
+    global _gc_started
+
+    # The collector holds the GIL, so collections never overlap.
+    if phase == "start":
+        _gc_started = time.perf_counter()
+    elif _gc_started is not None:
+        gc_duration_histogram.record(
+            time.perf_counter() - _gc_started, {"generation": info["generation"]}
+        )
+        _gc_started = None
+
+
+def _observe_gc_collections(options: CallbackOptions) -> Iterable[Observation]:
+    return [
+        Observation(stats["collections"], {"generation": generation})
+        for generation, stats in enumerate(gc.get_stats())
+    ]
+
+
+def _observe_threads(options: CallbackOptions) -> Iterable[Observation]:
+    return [Observation(threading.active_count())]
+
+
+def _observe_db_connections(options: CallbackOptions) -> Iterable[Observation]:
+    global _db_connection_limit
+
+    if os.getpid() != _installed_pid:
+        # The connections of the whole database are the same for every process, so
+        # that only one process of a server samples them.
+        return []
+
+    # Not every consumer of this package is a Django project.
+    from django.apps import apps
+
+    if not apps.ready:
+        return []
+
+    from django import db
+
+    if db.connection.vendor != "postgresql":
+        return []
+
+    # Called in the thread of the metric reader, which keeps its own connection.
+    db.close_old_connections()
+    try:
+        with db.connection.cursor() as cursor:
+            cursor.execute(DB_CONNECTIONS_QUERY)
+            rows = cursor.fetchall()
+    except Exception:
+        logger.warning("Failed to sample the database connections.", exc_info=True)
+        return []
+    finally:
+        db.close_old_connections()
+
+    if rows:
+        _db_connection_limit = rows[0][2]
+    return [Observation(count, {"state": state}) for state, count, _ in rows]
+
+
+def _observe_db_connection_limit(options: CallbackOptions) -> Iterable[Observation]:
+    # Sampled together with the connections (which are observed first).
+    if _db_connection_limit is None:
+        return []
+    return [Observation(_db_connection_limit)]
+
+
+def install_runtime_metrics() -> None:
+    """Register the runtime metrics. Calling it multiple times has no effect."""
+    global _installed, _installed_pid
+
+    with _installed_lock:
+        if _installed:
+            return
+
+        gc.callbacks.append(_on_gc)
+
+        meter.create_observable_counter(
+            "process.runtime.gc.collections",
+            callbacks=[_observe_gc_collections],
+            unit="{collection}",
+            description="Number of garbage collections.",
+        )
+        meter.create_observable_gauge(
+            "process.thread.count",
+            callbacks=[_observe_threads],
+            unit="{thread}",
+            description="Number of threads of the process.",
+        )
+        meter.create_observable_gauge(
+            "postgresql.connections",
+            callbacks=[_observe_db_connections],
+            unit="{connection}",
+            description="Number of connections to the database by state.",
+        )
+        meter.create_observable_gauge(
+            "postgresql.connections.limit",
+            callbacks=[_observe_db_connection_limit],
+            unit="{connection}",
+            description="Maximum number of connections to the database server.",
+        )
+
+        _installed = True
+        _installed_pid = os.getpid()
+
+
+def monitor_event_loop(
+    loop: asyncio.AbstractEventLoop, name: str = "default", interval: float = 1.0
+) -> None:
+    """Record the lag of an event loop every `interval` seconds while it runs.
+
+    The lag is how much later than scheduled a callback runs, so it grows when the
+    loop is blocked (e.g. by sync code) or overloaded.
+    """
+    if not _installed:
+        return
+
+    attributes = {"loop": name}
+
+    def check(scheduled: float) -> None:
+        loop_lag_histogram.record(max(0.0, loop.time() - scheduled), attributes)
+        schedule()
+
+    def schedule() -> None:
+        scheduled = loop.time() + interval
+        loop.call_at(scheduled, check, scheduled)
+
+    loop.call_soon_threadsafe(schedule)
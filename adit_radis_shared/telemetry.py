@@ -8,12 +8,17 @@ in by the caller via `setup_opentelemetry(instrumentors=[...])` so this helper i
 usable from non-Django consumers such as the radis-etl-ukb Dagster pipeline.
 
 Telemetry is disabled if OTEL_EXPORTER_OTLP_ENDPOINT is not set.
+
+The sampling and the export can be tuned by environment variables (see
+`ExportSettings`). Where the OpenTelemetry specification defines a variable it is
+used, but with defaults suited for production.
 """
 
 import logging
 import os
 import socket
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
@@ -25,18 +30,36 @@ def is_telemetry_active() -> bool:
     return _telemetry_active
 
 
-def add_otel_logging_handler(logging_config: dict) -> None:
+def add_otel_logging_handler(logging_config: dict, levels: dict[str, str] | None = None) -> None:
     """Add OpenTelemetry logging handler to a Django LOGGING dict.
 
     Call this after defining LOGGING in settings, only when is_telemetry_active() is True.
     This function is idempotent and safe to call on any valid Django logging config.
+
+    The handler only exports records that pass the per-logger `levels` (like
+    `{"": "INFO", "myapp": "DEBUG"}`, overridden by `OTEL_LOGS_LEVELS`) and the rate
+    and repetition limits of `ExportSettings` (see `log_export`).
     """
+    from .log_export import parse_levels
+
+    levels = dict(levels or {})
+    try:
+        levels.update(parse_levels(os.environ.get("OTEL_LOGS_LEVELS", "")))
+    except ValueError as err:
+        logger.warning("Invalid OTEL_LOGS_LEVELS, ignoring it: %s", err)
+
+    export_settings = ExportSettings.from_env()
     handlers = logging_config.setdefault("handlers", {})
     handlers.setdefault(
         "otel",
         {
             "level": "DEBUG",
-            "class": "opentelemetry.sdk._logs.LoggingHandler",
+            "class": "adit_radis_shared.log_export.ThrottledLoggingHandler",
+            "levels": levels,
+            "rate_limit": export_settings.log_rate_limit,
+            "burst": export_settings.log_rate_burst,
+            "repeat_limit": export_settings.log_repeat_limit,
+            "repeat_window": export_settings.log_repeat_window_ms / 1000,
         },
     )
 
@@ -50,7 +73,79 @@ def add_otel_logging_handler(logging_config: dict) -> None:
         root_handlers.append("otel")
 
 
-def _build_resource_attributes(service_name: str) -> dict[str, str]:
+_QUEUE_HANDLER_CLASS = "adit_radis_shared.log_queue.NonBlockingQueueHandler"
+
+
+def build_logging_config(
+    level: str = "INFO", loggers: dict[str, str] | None = None, json_lines: bool = True
+) -> dict:
+    """Build a Django LOGGING dict that logs to the console.
+
+    Each record is logged as a compact JSON line with the ids of the active trace
+    and span (see `log_format`), or as plain text if `json_lines` is false. `loggers`
+    sets the levels of single loggers (like `{"django": "WARNING"}`).
+
+    Add the OpenTelemetry handler (see `add_otel_logging_handler`) and then call
+    `use_queue_handlers` on the result.
+    """
+    return {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {
+            "json": {"()": "adit_radis_shared.log_format.JsonFormatter"},
+            "plain": {"format": "[{asctime}] {levelname} {name}: {message}", "style": "{"},
+        },
+        "handlers": {
+            "console": {
+                "class": "logging.StreamHandler",
+                "formatter": "json" if json_lines else "plain",
+            },
+        },
+        "loggers": {
+            name: {"level": logger_level, "handlers": ["console"], "propagate": False}
+            for name, logger_level in (loggers or {}).items()
+        },
+        "root": {"level": level, "handlers": ["console"]},
+    }
+
+
+def use_queue_handlers(logging_config: dict) -> None:
+    """Route the handlers of a Django LOGGING dict through a queue.
+
+    The handlers of each logger (and the root logger) are replaced by a queue
+    handler, whose thread passes the records on to them (see `log_queue`), so that
+    logging never blocks the request threads or the event loop. Loggers with the
+    same handlers share a queue handler.
+
+    Call this last, handlers that are added afterwards are not routed through the
+    queue. This function is idempotent.
+    """
+    handlers = logging_config.setdefault("handlers", {})
+    logger_configs = list(logging_config.get("loggers", {}).values())
+    if "root" in logging_config:
+        logger_configs.append(logging_config["root"])
+
+    for logger_config in logger_configs:
+        names = logger_config.get("handlers") or []
+        if not names or any(
+            handlers.get(name, {}).get("class") == _QUEUE_HANDLER_CLASS for name in names
+        ):
+            continue
+
+        queue_name = "queue_" + "_".join(names)
+        handlers.setdefault(
+            queue_name,
+            {
+                "class": _QUEUE_HANDLER_CLASS,
+                "handlers": list(names),
+                "listener": "adit_radis_shared.log_queue.ContextQueueListener",
+                "respect_handler_level": True,
+            },
+        )
+        logger_config["handlers"] = [queue_name]
+
+
+def _build_resource_attributes(service_name: str, instance_id: str | None = None) -> dict[str, str]:
     """Build the OTel resource attribute dict for the current process.
 
     `service.component` is added when the SERVICE_COMPONENT env var is set,
@@ -60,8 +155,13 @@ def _build_resource_attributes(service_name: str) -> dict[str, str]:
     it is appended as `-N` so replicas of the same service are distinguishable.
     Outside Swarm the literal template passes through unprocessed; the digit
     check drops it so dev signals stay clean.
+
+    `service.instance.id` is added when an `instance_id` is given, which tells the
+    processes of a prefork server (and the replicas) apart (see `_instance_id`).
     """
     attrs: dict[str, str] = {"service.name": service_name}
+    if instance_id:
+        attrs["service.instance.id"] = instance_id
     if component := os.environ.get("SERVICE_COMPONENT"):
         slot = os.environ.get("TASK_SLOT", "")
         if slot.isdigit():
@@ -70,6 +170,128 @@ def _build_resource_attributes(service_name: str) -> dict[str, str]:
     return attrs
 
 
+def _instance_id() -> str:
+    """The id of this process, which changes in a forked process."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _env_number[T: (int, float)](name: str, default: T, cast: Callable[[str], T], minimum: T) -> T:
+    value = os.environ.get(name, "")
+    if not value:
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        logger.warning("Invalid %s=%r, using the default %s.", name, value, default)
+        return default
+    return number
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name, "").strip().lower()
+    if not value:
+        return default
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    logger.warning("Invalid %s=%r, using the default %s.", name, value, default)
+    return default
+
+
+@dataclass(frozen=True)
+class ExportSettings:
+    """How traces are sampled and how the signals are exported.
+
+    - `OTEL_TRACES_SAMPLER_ARG`: The ratio of traces that are sampled (0.0 to 1.0,
+      defaults to 0.1). A span follows the decision of its parent (e.g. of the
+      request that deferred a job).
+    - `OTEL_TRACES_SAMPLE_ERRORS`: Also export failed spans of not sampled traces
+      (defaults to true).
+    - `OTEL_TRACES_SAMPLE_SLOW_MS`: Also export spans of not sampled traces that took
+      at least this many milliseconds (defaults to 1000, 0 to disable).
+    - `OTEL_BSP_*` / `OTEL_BLRP_*`: Queue size, batch size, delay and timeout (in
+      ms) of the batch processors of spans and logs (SDK defaults).
+    - `OTEL_METRIC_EXPORT_INTERVAL` / `OTEL_METRIC_EXPORT_TIMEOUT`: The interval
+      and timeout (in ms) of the metric export (defaults to 60000 and 30000).
+    - `OTEL_EXPORTER_OTLP_COMPRESSION`: "gzip" (the default), "deflate" or "none".
+    - `OTEL_LOGS_RATE_LIMIT` / `OTEL_LOGS_RATE_BURST`: How many log records per
+      second are exported on average and at once (defaults to 100 and 1000, a rate
+      of 0 disables the limit).
+    - `OTEL_LOGS_REPEAT_LIMIT` / `OTEL_LOGS_REPEAT_WINDOW`: How often the same log
+      message is exported per window (in ms, defaults to 20 per 60000, a window of
+      0 disables the limit).
+    """
+
+    sample_ratio: float = 0.1
+    sample_errors: bool = True
+    sample_slow_ms: float = 1000.0
+    span_max_queue_size: int = 2048
+    span_max_export_batch_size: int = 512
+    span_schedule_delay_ms: float = 5000.0
+    span_export_timeout_ms: float = 30000.0
+    log_max_queue_size: int = 2048
+    log_max_export_batch_size: int = 512
+    log_schedule_delay_ms: float = 1000.0
+    log_export_timeout_ms: float = 30000.0
+    metric_export_interval_ms: float = 60000.0
+    metric_export_timeout_ms: float = 30000.0
+    log_rate_limit: float = 100.0
+    log_rate_burst: int = 1000
+    log_repeat_limit: int = 20
+    log_repeat_window_ms: float = 60000.0
+    compression: str = "gzip"
+
+    @classmethod
+    def from_env(cls) -> "ExportSettings":
+        defaults = cls()
+        values: dict[str, object] = {}
+        for field, name in _EXPORT_SETTINGS_ENV.items():
+            default = getattr(defaults, field)
+            if isinstance(default, bool):
+                values[field] = _env_bool(name, default)
+            elif isinstance(default, int):
+                values[field] = _env_number(name, default, int, 1)
+            else:
+                values[field] = _env_number(name, default, float, 0.0)
+        values["sample_ratio"] = min(values["sample_ratio"], 1.0)  # type: ignore
+
+        compression = os.environ.get("OTEL_EXPORTER_OTLP_COMPRESSION", "").strip().lower()
+        if compression not in ("", "gzip", "deflate", "none"):
+            logger.warning("Invalid OTEL_EXPORTER_OTLP_COMPRESSION=%r, using gzip.", compression)
+            compression = ""
+        values["compression"] = compression or defaults.compression
+
+        return cls(**values)  # type: ignore
+
+    @property
+    def keeps_unsampled_spans(self) -> bool:
+        return self.sample_errors or self.sample_slow_ms > 0
+
+
+_EXPORT_SETTINGS_ENV = {
+    "sample_ratio": "OTEL_TRACES_SAMPLER_ARG",
+    "sample_errors": "OTEL_TRACES_SAMPLE_ERRORS",
+    "sample_slow_ms": "OTEL_TRACES_SAMPLE_SLOW_MS",
+    "span_max_queue_size": "OTEL_BSP_MAX_QUEUE_SIZE",
+    "span_max_export_batch_size": "OTEL_BSP_MAX_EXPORT_BATCH_SIZE",
+    "span_schedule_delay_ms": "OTEL_BSP_SCHEDULE_DELAY",
+    "span_export_timeout_ms": "OTEL_BSP_EXPORT_TIMEOUT",
+    "log_max_queue_size": "OTEL_BLRP_MAX_QUEUE_SIZE",
+    "log_max_export_batch_size": "OTEL_BLRP_MAX_EXPORT_BATCH_SIZE",
+    "log_schedule_delay_ms": "OTEL_BLRP_SCHEDULE_DELAY",
+    "log_export_timeout_ms": "OTEL_BLRP_EXPORT_TIMEOUT",
+    "metric_export_interval_ms": "OTEL_METRIC_EXPORT_INTERVAL",
+    "metric_export_timeout_ms": "OTEL_METRIC_EXPORT_TIMEOUT",
+    "log_rate_limit": "OTEL_LOGS_RATE_LIMIT",
+    "log_rate_burst": "OTEL_LOGS_RATE_BURST",
+    "log_repeat_limit": "OTEL_LOGS_REPEAT_LIMIT",
+    "log_repeat_window_ms": "OTEL_LOGS_REPEAT_WINDOW",
+}
+
+
 def setup_opentelemetry(instrumentors: Iterable[type] | None = None) -> None:
     """Initialize OpenTelemetry instrumentation for traces, metrics, and logs.
 
@@ -106,6 +328,7 @@ def setup_opentelemetry(instrumentors: Iterable[type] | None = None) -> None:
         # recommended by the OTel Python documentation.
         from opentelemetry import metrics, trace
         from opentelemetry._logs import set_logger_provider
+        from opentelemetry.exporter.otlp.proto.http import Compression
         from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
         from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
         from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
@@ -125,30 +348,95 @@ def setup_opentelemetry(instrumentors: Iterable[type] | None = None) -> None:
             role = hostname.split(".")[0] if "." in hostname else hostname
             service_name = f"{site_name}-{role}".lower().replace(" ", "-")
 
-        # Create resource with service name and (optionally) component
-        resource = Resource.create(_build_resource_attributes(service_name))
+        import requests
+
+        from .fork_safety import ProcessResource, register_fork_handler
+        from .trace_sampling import KeepErrorsAndSlowSpanProcessor, RatioOrRecordSampler
+
+        # Create resource with service name, instance id and (optionally) component
+        resource = ProcessResource(
+            Resource.create(_build_resource_attributes(service_name, _instance_id()))
+        )
+        # The sessions of the exporters, which are replaced in forked processes
+        trace_session, metric_session, log_session = (requests.Session() for _ in range(3))
+
+        export = ExportSettings.from_env()
+        compression = Compression(export.compression)
 
         # Setup tracing - otel-collector handles authentication to OpenObserve.
         # Construct full signal-specific URLs because passing endpoint to
         # the constructor bypasses the SDK's automatic path-appending logic.
         base = endpoint.rstrip("/")
-        trace_exporter = OTLPSpanExporter(endpoint=f"{base}/v1/traces")
-        tracer_provider = TracerProvider(resource=resource)
-        tracer_provider.add_span_processor(BatchSpanProcessor(trace_exporter))
+        trace_exporter = OTLPSpanExporter(
+            endpoint=f"{base}/v1/traces", compression=compression, session=trace_session
+        )
+        tracer_provider = TracerProvider(
+            resource=resource,
+            sampler=RatioOrRecordSampler(
+                export.sample_ratio, record_unsampled=export.keeps_unsampled_spans
+            ),
+        )
+        tracer_provider.add_span_processor(
+            KeepErrorsAndSlowSpanProcessor(
+                BatchSpanProcessor(
+                    trace_exporter,
+                    max_queue_size=export.span_max_queue_size,
+                    schedule_delay_millis=export.span_schedule_delay_ms,
+                    max_export_batch_size=export.span_max_export_batch_size,
+                    export_timeout_millis=export.span_export_timeout_ms,
+                ),
+                keep_errors=export.sample_errors,
+                slow_threshold=export.sample_slow_ms / 1000,
+            )
+        )
         trace.set_tracer_provider(tracer_provider)
 
         # Setup metrics
-        metric_exporter = OTLPMetricExporter(endpoint=f"{base}/v1/metrics")
-        metric_reader = PeriodicExportingMetricReader(metric_exporter, export_interval_millis=60000)
+        metric_exporter = OTLPMetricExporter(
+            endpoint=f"{base}/v1/metrics", compression=compression, session=metric_session
+        )
+        metric_reader = PeriodicExportingMetricReader(
+            metric_exporter,
+            export_interval_millis=export.metric_export_interval_ms,
+            export_timeout_millis=export.metric_export_timeout_ms,
+        )
         meter_provider = MeterProvider(resource=resource, metric_readers=[metric_reader])
         metrics.set_meter_provider(meter_provider)
 
         # Setup logging - export structured logs via OTLP
-        log_exporter = OTLPLogExporter(endpoint=f"{base}/v1/logs")
+        log_exporter = OTLPLogExporter(
+            endpoint=f"{base}/v1/logs", compression=compression, session=log_session
+        )
         logger_provider = LoggerProvider(resource=resource)
-        logger_provider.add_log_record_processor(BatchLogRecordProcessor(log_exporter))
+        logger_provider.add_log_record_processor(
+            BatchLogRecordProcessor(
+                log_exporter,
+                schedule_delay_millis=export.log_schedule_delay_ms,
+                max_export_batch_size=export.log_max_export_batch_size,
+                export_timeout_millis=export.log_export_timeout_ms,
+                max_queue_size=export.log_max_queue_size,
+            )
+        )
         set_logger_provider(logger_provider)
 
+        # Prefork servers fork their workers after telemetry was set up.
+        register_fork_handler(
+            resource,
+            [trace_session, metric_session, log_session],
+            lambda: _build_resource_attributes(service_name, _instance_id()),
+        )
+
+        # Make the executors of asgiref configurable and observable (before the
+        # event loop of the server is created).
+        from .executors import install_executors
+
+        install_executors()
+
+        if _env_bool("OTEL_RUNTIME_METRICS", False):
+            from .runtime_metrics import install_runtime_metrics
+
+            install_runtime_metrics()
+
         # Mark telemetry as active BEFORE running caller-provided instrumentors,
         # because some of them (notably DjangoInstrumentor) trigger framework
         # settings to load, which check is_telemetry_active() to decide whether
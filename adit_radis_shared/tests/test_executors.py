@@ -0,0 +1,111 @@
+"""Unit tests for the instrumented executors of the executors module."""
+
+import asyncio
+import threading
+
+import pytest
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext, async_to_sync, sync_to_async
+
+from adit_radis_shared import executors
+from adit_radis_shared.executors import (
+    InstrumentedThreadPoolExecutor,
+    cpu_sync_to_async,
+    get_executor,
+    install_executors,
+)
+
+
+@pytest.fixture(autouse=True)
+def _reset_executors(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(executors, "_pools", {})
+    monkeypatch.setattr(executors, "_installed", False)
+    monkeypatch.setattr(SyncToAsync, "single_thread_executor", SyncToAsync.single_thread_executor)
+    monkeypatch.setattr(
+        SyncToAsync, "context_to_thread_executor", SyncToAsync.context_to_thread_executor
+    )
+    policy = asyncio.get_event_loop_policy()
+    yield
+    asyncio.set_event_loop_policy(policy)
+
+
+def test_executor_tracks_active_threads_and_queue_depth():
+    executor = InstrumentedThreadPoolExecutor("test", max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    first = executor.submit(block)
+    started.wait(5)
+    second = executor.submit(lambda: None)
+
+    assert executor.active == 1
+    assert executor.queue_depth == 1
+
+    release.set()
+    first.result(5)
+    second.result(5)
+    executor.shutdown()
+
+    assert executor.active == 0
+    assert executor.queue_depth == 0
+
+
+def test_executor_observations_are_aggregated_per_pool():
+    first = InstrumentedThreadPoolExecutor("aggregated", max_workers=1)
+    second = InstrumentedThreadPoolExecutor("aggregated", max_workers=1)
+    first.active = 1
+    second.active = 2
+
+    observations = executors._observe_active_threads(None)  # type: ignore
+
+    assert any(o.value == 3 and o.attributes == {"pool": "aggregated"} for o in observations)
+    first.shutdown()
+    second.shutdown()
+
+
+def test_pool_sizes_are_read_from_environment(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("ASGI_DB_THREADS", "3")
+    monkeypatch.setenv("ASGI_CPU_THREADS", "invalid")
+
+    assert get_executor("db")._max_workers == 3
+    assert get_executor("cpu")._max_workers >= 1
+    assert get_executor("db") is get_executor("db")
+
+
+def test_cpu_sync_to_async_runs_in_cpu_pool():
+    @cpu_sync_to_async
+    def thread_name() -> str:
+        return threading.current_thread().name
+
+    assert async_to_sync(thread_name)().startswith("executor-cpu")
+
+
+def test_install_executors_instruments_new_event_loops(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("ASGI_THREADS", "4")
+
+    install_executors()
+
+    async def default_executor_thread() -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: threading.current_thread().name)
+
+    assert asyncio.run(default_executor_thread()).startswith("executor-default")
+    assert isinstance(SyncToAsync.single_thread_executor, InstrumentedThreadPoolExecutor)
+    assert SyncToAsync.single_thread_executor._max_workers == 1
+
+
+def test_install_executors_instruments_thread_sensitive_contexts():
+    install_executors()
+
+    async def request_thread_names() -> tuple[str, str]:
+        async with ThreadSensitiveContext():
+            name = sync_to_async(lambda: threading.current_thread().name)
+            return await name(), await name()
+
+    first, second = asyncio.run(request_thread_names())
+
+    assert first.startswith("executor-thread_sensitive")
+    assert first == second
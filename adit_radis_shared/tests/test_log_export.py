@@ -0,0 +1,127 @@
+"""Unit tests for the limits of the exported log records."""
+
+import logging
+
+import pytest
+from opentelemetry.sdk._logs import LoggerProvider
+from opentelemetry.sdk._logs.export import InMemoryLogExporter, SimpleLogRecordProcessor
+
+from adit_radis_shared import log_export, telemetry
+from adit_radis_shared.log_export import LogExportFilter, ThrottledLoggingHandler, parse_levels
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(log_export.time, "monotonic", clock)
+    return clock
+
+
+def _record(name: str = "myapp", level: int = logging.INFO, msg: str = "") -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, None, None)
+
+
+# --- Levels ---
+
+
+def test_parse_levels():
+    assert parse_levels("INFO, urllib3=warning,myapp.jobs=DEBUG") == {
+        "": "INFO",
+        "urllib3": "WARNING",
+        "myapp.jobs": "DEBUG",
+    }
+    assert parse_levels("") == {}
+    with pytest.raises(ValueError):
+        parse_levels("urllib3=LOUD")
+
+
+def test_closest_logger_level_applies():
+    export_filter = LogExportFilter({"": "INFO", "urllib3": "WARNING", "myapp": "DEBUG"})
+
+    assert not export_filter.filter(_record("urllib3.connectionpool", logging.INFO))
+    assert export_filter.filter(_record("urllib3.connectionpool", logging.WARNING))
+    assert export_filter.filter(_record("myapp.views", logging.DEBUG))
+    assert not export_filter.filter(_record("other", logging.DEBUG))
+    assert export_filter.filter(_record("other", logging.INFO))
+    # Records dropped by their level are not counted as suppressed.
+    assert export_filter.pop_suppressed() == (0, 0)
+
+
+# --- Limits ---
+
+
+def test_rate_limit_allows_bursts_and_refills(clock: _Clock):
+    export_filter = LogExportFilter(rate_limit=2, burst=3)
+
+    passed = [export_filter.filter(_record(msg=f"message {i}")) for i in range(5)]
+    assert passed == [True, True, True, False, False]
+
+    clock.now += 1
+    passed = [export_filter.filter(_record(msg=f"later {i}")) for i in range(3)]
+    assert passed == [True, True, False]
+    assert export_filter.pop_suppressed() == (3, 0)
+    assert export_filter.pop_suppressed() == (0, 0)
+
+
+def test_repeated_messages_are_limited_per_window(clock: _Clock):
+    export_filter = LogExportFilter(repeat_limit=2, repeat_window=60)
+
+    passed = [export_filter.filter(_record(msg="Retrying %s")) for _ in range(4)]
+    assert passed == [True, True, False, False]
+    # Other messages (and other levels) are counted separately.
+    assert export_filter.filter(_record(msg="Done"))
+    assert export_filter.filter(_record(level=logging.WARNING, msg="Retrying %s"))
+
+    clock.now += 60
+    assert export_filter.filter(_record(msg="Retrying %s"))
+    assert export_filter.pop_suppressed() == (0, 2)
+
+
+# --- Handler ---
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_handler_exports_summary_of_suppressed_records(clock: _Clock):
+    exporter = InMemoryLogExporter()
+    provider = LoggerProvider()
+    provider.add_log_record_processor(SimpleLogRecordProcessor(exporter))
+    handler = ThrottledLoggingHandler(
+        levels={"": "INFO"}, rate_limit=1, burst=2, logger_provider=provider
+    )
+
+    for i in range(5):
+        handler.handle(_record(msg=f"message {i}"))
+    handler.handle(_record(level=logging.DEBUG, msg="ignored"))
+    clock.now += 1
+    handler.handle(_record(msg="after the flood"))
+
+    bodies = [log.log_record.body for log in exporter.get_finished_logs()]
+    assert bodies == [
+        "message 0",
+        "message 1",
+        "3 log messages suppressed (3 rate limited, 0 repeated).",
+        "after the flood",
+    ]
+
+
+def test_add_otel_logging_handler_configures_limits(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("OTEL_LOGS_LEVELS", "urllib3=WARNING")
+    monkeypatch.setenv("OTEL_LOGS_RATE_LIMIT", "50")
+    monkeypatch.setenv("OTEL_LOGS_REPEAT_WINDOW", "0")
+    logging_config: dict = {"version": 1}
+
+    telemetry.add_otel_logging_handler(logging_config, levels={"": "INFO", "urllib3": "ERROR"})
+
+    handler = logging_config["handlers"]["otel"]
+    assert handler["class"] == "adit_radis_shared.log_export.ThrottledLoggingHandler"
+    assert handler["levels"] == {"": "INFO", "urllib3": "WARNING"}
+    assert handler["rate_limit"] == 50
+    assert handler["repeat_window"] == 0
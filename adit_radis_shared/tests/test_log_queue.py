@@ -0,0 +1,125 @@
+"""Unit tests for the queue based logging config and the JSON log lines."""
+
+import json
+import logging
+import logging.config
+import sys
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+
+from adit_radis_shared import telemetry
+from adit_radis_shared.log_format import JsonFormatter
+
+
+class _ListHandler(logging.Handler):
+    """Collects the records with the span that was active when handling them."""
+
+    records: list[tuple[logging.LogRecord, trace.Span]] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        type(self).records.append((record, trace.get_current_span()))
+
+
+@pytest.fixture
+def configure_logging():
+    """Apply a LOGGING dict and restore the previous logging config afterwards."""
+    root = logging.getLogger()
+    root_handlers, root_level = list(root.handlers), root.level
+    _ListHandler.records = []
+
+    yield logging.config.dictConfig
+
+    for handler in root.handlers:
+        handler.close()
+    root.handlers[:] = root_handlers
+    root.setLevel(root_level)
+
+
+# --- JSON lines ---
+
+
+def test_json_line_has_message_extra_and_trace_ids():
+    tracer = TracerProvider().get_tracer(__name__)
+    record = logging.LogRecord("myapp", logging.INFO, __file__, 1, "Hi %s", ("there",), None)
+    record.job_id = 5
+    record.path = object()
+
+    with tracer.start_as_current_span("request") as span:
+        line = JsonFormatter().format(record)
+
+    assert "\n" not in line and ", " not in line
+    data = json.loads(line)
+    assert data["message"] == "Hi there"
+    assert data["level"] == "INFO"
+    assert data["logger"] == "myapp"
+    assert data["time"].endswith("Z")
+    assert data["job_id"] == 5
+    assert data["path"].startswith("<object object")
+    assert data["trace_id"] == format(span.get_span_context().trace_id, "032x")
+    assert data["span_id"] == format(span.get_span_context().span_id, "016x")
+    assert "args" not in data and "msg" not in data
+
+
+def test_json_line_has_exception():
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = logging.makeLogRecord(
+            {"name": "myapp", "msg": "Failed", "exc_info": sys.exc_info()}
+        )
+
+    data = json.loads(JsonFormatter().format(record))
+
+    assert data["exception"].endswith("ValueError: broken")
+    assert "trace_id" not in data
+
+
+# --- Queue handlers ---
+
+
+def test_use_queue_handlers_routes_each_handler_set_once():
+    logging_config = telemetry.build_logging_config(loggers={"django": "WARNING"})
+    logging_config["loggers"]["myapp"] = {"handlers": ["console", "otel"]}
+
+    telemetry.use_queue_handlers(logging_config)
+    telemetry.use_queue_handlers(logging_config)
+
+    handlers = logging_config["handlers"]
+    assert set(handlers) == {"console", "queue_console", "queue_console_otel"}
+    assert handlers["queue_console"]["handlers"] == ["console"]
+    assert handlers["queue_console_otel"]["handlers"] == ["console", "otel"]
+    assert logging_config["loggers"]["django"]["handlers"] == ["queue_console"]
+    assert logging_config["loggers"]["myapp"]["handlers"] == ["queue_console_otel"]
+    assert logging_config["root"]["handlers"] == ["queue_console"]
+
+
+def test_queued_records_are_handled_in_their_context(configure_logging):
+    logging_config = {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "handlers": {"list": {"()": _ListHandler}},
+        "root": {"level": "INFO", "handlers": ["list"]},
+    }
+    telemetry.use_queue_handlers(logging_config)
+    configure_logging(logging_config)
+    tracer = TracerProvider().get_tracer(__name__)
+
+    with tracer.start_as_current_span("request") as span:
+        items = ["a"]
+        logging.getLogger("myapp").info("Items %s", items)
+        items.append("b")
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        logging.getLogger("myapp").exception("Failed")
+    # Closing the queue handler waits until the queued records are handled.
+    logging.getLogger().handlers[0].close()
+
+    (info, info_span), (error, error_span) = _ListHandler.records
+    assert info.getMessage() == "Items ['a']"
+    assert info_span is span
+    assert not hasattr(info, "_otel_context")
+    assert error.exc_info is not None
+    assert not error_span.get_span_context().is_valid
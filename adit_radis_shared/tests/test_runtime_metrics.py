@@ -0,0 +1,112 @@
+"""Unit tests for the opt-in runtime metrics."""
+
+import asyncio
+import gc
+import os
+import threading
+
+import pytest
+from django import db
+
+from adit_radis_shared import runtime_metrics
+
+
+class _Recorder:
+    def __init__(self):
+        self.records = []
+
+    def record(self, value, attributes=None):
+        self.records.append((value, attributes))
+
+
+@pytest.fixture
+def recorder(monkeypatch: pytest.MonkeyPatch) -> _Recorder:
+    recorder = _Recorder()
+    monkeypatch.setattr(runtime_metrics, "gc_duration_histogram", recorder)
+    monkeypatch.setattr(runtime_metrics, "loop_lag_histogram", recorder)
+    return recorder
+
+
+@pytest.fixture
+def installed(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(runtime_metrics, "_installed", False)
+    monkeypatch.setattr(runtime_metrics, "_installed_pid", None)
+    callbacks = list(gc.callbacks)
+    runtime_metrics.install_runtime_metrics()
+    yield
+    gc.callbacks[:] = callbacks
+
+
+def test_gc_pauses_are_recorded_by_generation(recorder: _Recorder, installed):
+    gc.collect(1)
+
+    assert any(attributes == {"generation": 1} for _, attributes in recorder.records)
+    assert all(duration >= 0 for duration, _ in recorder.records)
+
+
+def test_install_is_idempotent(installed):
+    runtime_metrics.install_runtime_metrics()
+
+    assert gc.callbacks.count(runtime_metrics._on_gc) == 1
+
+
+def test_gc_collections_are_observed_per_generation():
+    observations = runtime_metrics._observe_gc_collections(None)  # type: ignore
+
+    assert [o.attributes for o in observations] == [{"generation": g} for g in range(3)]
+
+
+def test_event_loop_lag_is_recorded_while_installed(recorder: _Recorder, installed):
+    async def run():
+        runtime_metrics.monitor_event_loop(asyncio.get_running_loop(), "test", interval=0.01)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+
+    assert recorder.records
+    assert all(attributes == {"loop": "test"} for _, attributes in recorder.records)
+
+
+def test_event_loop_is_not_monitored_when_not_installed(
+    recorder: _Recorder, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(runtime_metrics, "_installed", False)
+
+    async def run():
+        runtime_metrics.monitor_event_loop(asyncio.get_running_loop(), "test", interval=0.01)
+        await asyncio.sleep(0.03)
+
+    asyncio.run(run())
+
+    assert recorder.records == []
+
+
+def _observe_in_reader_thread(callback) -> list:
+    # Like the metric reader, which keeps its own database connection.
+    observations = []
+
+    def observe():
+        try:
+            observations.extend(callback(None))
+        finally:
+            db.connection.close()
+
+    thread = threading.Thread(target=observe)
+    thread.start()
+    thread.join()
+    return observations
+
+
+@pytest.mark.django_db
+def test_db_connections_are_only_observed_by_the_installing_process(
+    installed, monkeypatch: pytest.MonkeyPatch
+):
+    observations = _observe_in_reader_thread(runtime_metrics._observe_db_connections)
+
+    assert sum(o.value for o in observations) >= 1
+    assert runtime_metrics._observe_db_connection_limit(None)  # type: ignore
+
+    # Like a forked worker process that inherited the metrics of its supervisor.
+    monkeypatch.setattr(runtime_metrics, "_installed_pid", os.getpid() + 1)
+
+    assert _observe_in_reader_thread(runtime_metrics._observe_db_connections) == []
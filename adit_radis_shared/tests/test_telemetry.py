@@ -1,13 +1,25 @@
-"""Unit tests for the telemetry module: the resource-attribute helper and the
-pluggable-instrumentor contract used by setup_opentelemetry()."""
+"""Unit tests for the telemetry module: the resource-attribute helper, the
+pluggable-instrumentor contract used by setup_opentelemetry() and the sampling
+and export settings, and the renewal of the telemetry in forked processes."""
 
+import asyncio
 import importlib
+import os
+import time
 from typing import Any
 
 import pytest
-
-from adit_radis_shared import telemetry
+import requests
+from asgiref.sync import SyncToAsync
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from adit_radis_shared import executors, telemetry
+from adit_radis_shared.fork_safety import ProcessResource, register_fork_handler
 from adit_radis_shared.telemetry import _build_resource_attributes
+from adit_radis_shared.trace_sampling import KeepErrorsAndSlowSpanProcessor, RatioOrRecordSampler
 
 
 def test_only_service_name_when_component_unset(monkeypatch: pytest.MonkeyPatch):
@@ -62,6 +74,12 @@ def test_task_slot_alone_does_not_create_component(monkeypatch: pytest.MonkeyPat
     assert attrs == {"service.name": "adit_prod"}
 
 
+def test_instance_id_added_when_given(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv("SERVICE_COMPONENT", raising=False)
+    attrs = _build_resource_attributes("adit_prod", "web-1-42")
+    assert attrs == {"service.name": "adit_prod", "service.instance.id": "web-1-42"}
+
+
 # ----------------------------------------------------------------------------
 # Pluggable-instrumentor contract
 # ----------------------------------------------------------------------------
@@ -82,7 +100,15 @@ def _reset_telemetry_state(monkeypatch: pytest.MonkeyPatch):
     each scenario starts from a clean slate.
     """
     monkeypatch.setattr(telemetry, "_telemetry_active", False)
+    # setup_opentelemetry() also installs the instrumented executors globally.
+    monkeypatch.setattr(executors, "_installed", False)
+    monkeypatch.setattr(SyncToAsync, "single_thread_executor", SyncToAsync.single_thread_executor)
+    monkeypatch.setattr(
+        SyncToAsync, "context_to_thread_executor", SyncToAsync.context_to_thread_executor
+    )
+    policy = asyncio.get_event_loop_policy()
     yield
+    asyncio.set_event_loop_policy(policy)
     monkeypatch.setattr(telemetry, "_telemetry_active", False)
 
 
@@ -266,3 +292,169 @@ def test_module_imports_without_django_extras() -> None:
     assert hasattr(reloaded, "setup_opentelemetry")
     assert hasattr(reloaded, "add_otel_logging_handler")
     assert hasattr(reloaded, "is_telemetry_active")
+
+
+def test_setup_installs_instrumented_executors(_otel_endpoint: str) -> None:
+    """The executors of asgiref are only replaced when telemetry is active, as
+    only then their metrics are exported."""
+    telemetry.setup_opentelemetry()
+
+    assert isinstance(SyncToAsync.single_thread_executor, executors.InstrumentedThreadPoolExecutor)
+
+
+# ----------------------------------------------------------------------------
+# Sampling and export settings
+# ----------------------------------------------------------------------------
+
+
+def test_export_settings_defaults(monkeypatch: pytest.MonkeyPatch) -> None:
+    for name in (*telemetry._EXPORT_SETTINGS_ENV.values(), "OTEL_EXPORTER_OTLP_COMPRESSION"):
+        monkeypatch.delenv(name, raising=False)
+
+    export = telemetry.ExportSettings.from_env()
+
+    assert export == telemetry.ExportSettings()
+    assert export.compression == "gzip"
+    assert export.keeps_unsampled_spans is True
+
+
+def test_export_settings_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OTEL_TRACES_SAMPLER_ARG", "0.5")
+    monkeypatch.setenv("OTEL_TRACES_SAMPLE_ERRORS", "false")
+    monkeypatch.setenv("OTEL_TRACES_SAMPLE_SLOW_MS", "0")
+    monkeypatch.setenv("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "128")
+    monkeypatch.setenv("OTEL_METRIC_EXPORT_INTERVAL", "15000")
+    monkeypatch.setenv("OTEL_EXPORTER_OTLP_COMPRESSION", "none")
+
+    export = telemetry.ExportSettings.from_env()
+
+    assert export.sample_ratio == 0.5
+    assert export.keeps_unsampled_spans is False
+    assert export.span_max_export_batch_size == 128
+    assert export.metric_export_interval_ms == 15000
+    assert export.compression == "none"
+
+
+def test_invalid_export_settings_fall_back_to_defaults(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setenv("OTEL_TRACES_SAMPLER_ARG", "lots")
+    monkeypatch.setenv("OTEL_BSP_MAX_QUEUE_SIZE", "0")
+    monkeypatch.setenv("OTEL_TRACES_SAMPLE_ERRORS", "maybe")
+    monkeypatch.setenv("OTEL_EXPORTER_OTLP_COMPRESSION", "brotli")
+
+    with caplog.at_level("WARNING", logger="adit_radis_shared.telemetry"):
+        export = telemetry.ExportSettings.from_env()
+
+    assert export.sample_ratio == 0.1
+    assert export.span_max_queue_size == 2048
+    assert export.sample_errors is True
+    assert export.compression == "gzip"
+    assert len(caplog.records) == 4
+
+
+def test_sample_ratio_is_capped(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OTEL_TRACES_SAMPLER_ARG", "5")
+
+    assert telemetry.ExportSettings.from_env().sample_ratio == 1.0
+
+
+def _sampling_provider(
+    ratio: float, keep_errors: bool = True, slow_threshold: float = 0
+) -> tuple[Any, InMemorySpanExporter]:
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(sampler=RatioOrRecordSampler(ratio))
+    provider.add_span_processor(
+        KeepErrorsAndSlowSpanProcessor(
+            SimpleSpanProcessor(exporter), keep_errors=keep_errors, slow_threshold=slow_threshold
+        )
+    )
+    return provider.get_tracer(__name__), exporter
+
+
+def test_sampler_follows_the_ratio_and_the_parent() -> None:
+    tracer, exporter = _sampling_provider(1.0)
+    with tracer.start_as_current_span("parent"):
+        with tracer.start_as_current_span("child"):
+            pass
+
+    assert [span.name for span in exporter.get_finished_spans()] == ["child", "parent"]
+
+
+def test_unsampled_spans_are_only_exported_when_failed() -> None:
+    tracer, exporter = _sampling_provider(0.0)
+    with tracer.start_as_current_span("ok") as ok_span:
+        assert ok_span.is_recording()
+    with pytest.raises(RuntimeError):
+        with tracer.start_as_current_span("failed"):
+            raise RuntimeError
+
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ["failed"]
+    assert spans[0].context is not None
+    assert spans[0].context.trace_flags.sampled
+
+
+def test_unsampled_spans_are_exported_when_slow() -> None:
+    tracer, exporter = _sampling_provider(0.0, keep_errors=False, slow_threshold=0.01)
+    with tracer.start_as_current_span("fast"):
+        pass
+    with tracer.start_as_current_span("slow"):
+        time.sleep(0.02)
+
+    assert [span.name for span in exporter.get_finished_spans()] == ["slow"]
+
+
+# ----------------------------------------------------------------------------
+# Forked processes
+# ----------------------------------------------------------------------------
+
+
+def _run_in_fork(check: Any) -> str:
+    """Run `check` in a forked process and return what it returned."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write_fd, str(check()).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as reader:
+        result = reader.read()
+    os.waitpid(pid, 0)
+    return result
+
+
+def test_forked_process_renews_instance_id_and_sessions() -> None:
+    resource = ProcessResource(Resource.create({"service.instance.id": f"test-{os.getpid()}"}))
+    session = requests.Session()
+    session.get_adapter("http://otel-collector.test").inherited = True  # type: ignore
+    register_fork_handler(
+        resource, [session], lambda: {"service.instance.id": f"test-{os.getpid()}"}
+    )
+
+    def check() -> str:
+        inherited = hasattr(session.get_adapter("http://otel-collector.test"), "inherited")
+        return f"{resource.attributes['service.instance.id']} {inherited}"
+
+    instance_id, inherited = _run_in_fork(check).split()
+
+    assert instance_id != f"test-{os.getpid()}"
+    assert instance_id.startswith("test-")
+    assert inherited == "False"
+    # The parent keeps its resource and connections.
+    assert resource.attributes["service.instance.id"] == f"test-{os.getpid()}"
+    assert hasattr(session.get_adapter("http://otel-collector.test"), "inherited")
+
+
+def test_forked_process_gets_new_executors(_otel_endpoint: str) -> None:
+    telemetry.setup_opentelemetry()
+    db_executor = executors.get_executor("db")
+    db_executor.submit(lambda: None).result()
+
+    def check() -> bool:
+        executor = executors.get_executor("db")
+        return executor is not db_executor and executor.submit(lambda: True).result(timeout=5)
+
+    assert _run_in_fork(check) == "True"
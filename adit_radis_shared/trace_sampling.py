@@ -0,0 +1,131 @@
+"""Trace sampling that keeps a ratio of the traces plus all failed and slow spans.
+
+A plain head sampler decides when a span starts, so it can't keep spans that later
+fail or turn out to be slow. Instead `RatioOrRecordSampler` samples a ratio of the
+traces (following the decision of the parent span, like the parent-based ratio
+sampler of the SDK) and only records the other spans without sampling them.
+`KeepErrorsAndSlowSpanProcessor` then exports the sampled spans and additionally
+the recorded spans that failed or took longer than a threshold.
+
+Recording a span that is not exported costs some CPU and memory, so the not
+sampled spans are dropped right away if neither errors nor slow spans are kept.
+"""
+
+from collections.abc import Sequence
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import Link, SpanKind, StatusCode, TraceFlags, get_current_span
+from opentelemetry.trace.span import SpanContext, TraceState
+from opentelemetry.util.types import Attributes
+
+
+class RatioOrRecordSampler(Sampler):
+    """Samples a ratio of the traces and records (but doesn't sample) the others."""
+
+    def __init__(self, ratio: float, record_unsampled: bool = True) -> None:
+        self._root = TraceIdRatioBased(ratio)
+        self._unsampled = Decision.RECORD_ONLY if record_unsampled else Decision.DROP
+
+    def should_sample(
+        self,
+        parent_context: Context | None,
+        trace_id: int,
+        name: str,
+        kind: SpanKind | None = None,
+        attributes: Attributes = None,
+        links: Sequence[Link] | None = None,
+        trace_state: TraceState | None = None,
+    ) -> SamplingResult:
+        parent = get_current_span(parent_context).get_span_context()
+        if parent.is_valid:
+            sampled = parent.trace_flags.sampled
+        else:
+            result = self._root.should_sample(parent_context, trace_id, name, kind, attributes)
+            sampled = result.decision.is_sampled()
+
+        return SamplingResult(
+            Decision.RECORD_AND_SAMPLE if sampled else self._unsampled,
+            attributes,
+            parent.trace_state if parent.is_valid else None,
+        )
+
+    def get_description(self) -> str:
+        return f"RatioOrRecordSampler{{{self._root.get_description()}}}"
+
+
+class KeepErrorsAndSlowSpanProcessor(SpanProcessor):
+    """Passes the sampled spans and the recorded failed or slow spans on.
+
+    The span processors of the SDK (like `BatchSpanProcessor`) ignore spans that
+    are not sampled, so the kept spans are passed on marked as sampled.
+    """
+
+    def __init__(
+        self, processor: SpanProcessor, keep_errors: bool = True, slow_threshold: float = 0
+    ) -> None:
+        """
+        Args:
+            processor: The processor (usually a `BatchSpanProcessor`) to pass the
+                spans on to.
+            keep_errors: Whether to keep the spans with an error status.
+            slow_threshold: Spans that took at least this many seconds are kept
+                (0 to not keep slow spans).
+        """
+        self.processor = processor
+        self.keep_errors = keep_errors
+        self.slow_threshold_ns = int(slow_threshold * 1e9)
+
+    def on_start(self, span: Span, parent_context: Context | None = None) -> None:
+        self.processor.on_start(span, parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        context = span.context
+        if context is None:
+            return
+        if context.trace_flags.sampled:
+            self.processor.on_end(span)
+        elif self._keep(span):
+            self.processor.on_end(_as_sampled(span, context))
+
+    def _keep(self, span: ReadableSpan) -> bool:
+        if self.keep_errors and span.status.status_code is StatusCode.ERROR:
+            return True
+        if self.slow_threshold_ns and span.start_time and span.end_time:
+            return span.end_time - span.start_time >= self.slow_threshold_ns
+        return False
+
+    def shutdown(self) -> None:
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
+
+
+def _as_sampled(span: ReadableSpan, context: SpanContext) -> ReadableSpan:
+    return ReadableSpan(
+        name=span.name,
+        context=SpanContext(
+            context.trace_id,
+            context.span_id,
+            context.is_remote,
+            TraceFlags(context.trace_flags | TraceFlags.SAMPLED),
+            context.trace_state,
+        ),
+        parent=span.parent,
+        resource=span.resource,
+        attributes=span.attributes,
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
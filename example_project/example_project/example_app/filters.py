@@ -1,8 +1,10 @@
 import django_filters
 from django.http import HttpRequest
 
-from adit_radis_shared.common.forms import SingleFilterFieldFormHelper
+from adit_radis_shared.common.filters import TrigramSearchFilter
+from adit_radis_shared.common.forms import SearchFieldFormHelper, SingleFilterFieldFormHelper
 from adit_radis_shared.common.types import with_form_helper
+from adit_radis_shared.common.utils.facet_utils import get_facet_counts
 
 from .models import ExampleJob
 
@@ -17,4 +19,28 @@ class ExampleJobFilter(django_filters.FilterSet):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        with_form_helper(self.form).helper = SingleFilterFieldFormHelper(self.request.GET, "status")
+        # Without a passed queryset the filter set uses all objects of the model.
+        queryset = self.queryset
+        assert queryset is not None
+
+        with_form_helper(self.form).helper = SingleFilterFieldFormHelper(
+            self.request.GET,
+            "status",
+            # Only queried when the filter is rendered.
+            facet_counts=lambda: get_facet_counts(queryset, "status"),
+        )
+
+
+class ExampleJobSearchFilter(django_filters.FilterSet):
+    request: HttpRequest
+
+    name = TrigramSearchFilter(label="Name")
+
+    class Meta:
+        model = ExampleJob
+        fields = ("name",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        with_form_helper(self.form).helper = SearchFieldFormHelper(self.request.GET, "name")
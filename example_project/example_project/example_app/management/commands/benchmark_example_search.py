@@ -0,0 +1,70 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from example_project.example_app.filters import ExampleJobSearchFilter
+from example_project.example_app.models import ExampleJob
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the trigram indexed name search of example jobs."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=1_000_000,
+            help="Number of example jobs to search in (missing ones are created).",
+        )
+        parser.add_argument("--term", default="abc", help="The search term.")
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Number of times each query is run."
+        )
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        count: int = options["count"]
+        missing = count - ExampleJob.objects.count()
+        if missing > 0:
+            self.stdout.write(f"Creating {missing} example jobs...", ending="")
+            self.stdout.flush()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {ExampleJob._meta.db_table} (name, status)
+                    SELECT md5(random()::text), 'PE' FROM generate_series(1, %s)
+                    """,
+                    [missing],
+                )
+                cursor.execute(f"ANALYZE {ExampleJob._meta.db_table}")
+            self.stdout.write("Done")
+
+        request = RequestFactory().get("/", {"name": options["term"]})
+        filterset = ExampleJobSearchFilter(
+            data=request.GET, queryset=ExampleJob.objects.all(), request=request
+        )
+        assert filterset.is_valid(), filterset.errors
+        queryset = filterset.qs.order_by()
+
+        self.stdout.write(queryset.explain())
+        indexed = self._measure(queryset, options["repeat"], use_index=True)
+        scanned = self._measure(queryset, options["repeat"], use_index=False)
+
+        self.stdout.write(f"With trigram index: {indexed * 1000:.1f} ms")
+        self.stdout.write(f"Sequential scan: {scanned * 1000:.1f} ms")
+
+    def _measure(self, queryset, repeat: int, use_index: bool) -> float:
+        """Return the best time (in seconds) to count the matching jobs."""
+        best = float("inf")
+        for _ in range(repeat):
+            with transaction.atomic():
+                if not use_index:
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL enable_bitmapscan = off")
+                        cursor.execute("SET LOCAL enable_indexscan = off")
+                start = time.perf_counter()
+                queryset.count()
+                best = min(best, time.perf_counter() - start)
+        return best
@@ -1,5 +1,7 @@
 from django.db import models
 
+from adit_radis_shared.common.utils.migration_utils import trigram_index
+
 
 class ExampleJob(models.Model):
     class Status(models.TextChoices):
@@ -10,5 +12,8 @@ class ExampleJob(models.Model):
     name = models.CharField(max_length=100)
     status = models.CharField(max_length=2, choices=Status.choices, default=Status.PENDING)
 
+    class Meta:
+        indexes = [trigram_index("name", name="examplejob_name_trgm_idx")]
+
     def __str__(self):
         return f"{self.__class__.__name__} {self.name} [{self.pk}]"
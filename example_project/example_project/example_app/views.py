@@ -1,7 +1,6 @@
 from datetime import UTC
 from typing import cast
 
-from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -11,17 +10,19 @@ from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
 from django.utils.formats import date_format
-from django.views import View
-from django.views.generic import ListView
 from django_filters.views import FilterView
 from django_tables2 import SingleTableMixin
 
 from adit_radis_shared.accounts.models import User
-from adit_radis_shared.common.mixins import PageSizeSelectMixin
+from adit_radis_shared.common.mixins import ColumnProjectionMixin, PageSizeSelectMixin
 from adit_radis_shared.common.site import THEME_PREFERENCE_KEY
-from adit_radis_shared.common.views import BaseHomeView, BaseUpdatePreferencesView
+from adit_radis_shared.common.views import (
+    AsyncTemplateView,
+    BaseHomeView,
+    BaseUpdatePreferencesView,
+)
 
-from .filters import ExampleJobFilter
+from .filters import ExampleJobFilter, ExampleJobSearchFilter
 from .forms import DateDemoForm
 from .models import ExampleJob
 from .tables import ExampleJobTable
@@ -227,20 +228,23 @@ def example_background_task_view(request: HttpRequest) -> HttpResponse:
     return render(request, "example_app/example_background_task.html", {})
 
 
-class AsyncExampleClassView(View):
-    async def get(self, request: HttpRequest) -> HttpResponse:
-        return await sync_to_async(render)(request, "example_app/example_async_view.html")
+class AsyncExampleClassView(AsyncTemplateView):
+    template_name = "example_app/example_async_view.html"
 
 
-class ExampleTableHeadingView(PageSizeSelectMixin, SingleTableMixin, FilterView):
+class ExampleTableHeadingView(
+    PageSizeSelectMixin, ColumnProjectionMixin, SingleTableMixin, FilterView
+):
     model = ExampleJob
     table_class = ExampleJobTable
     filterset_class = ExampleJobFilter
     template_name = "example_app/example_table_heading.html"
 
 
-class ExampleCustomPaginationView(PageSizeSelectMixin, ListView):
+class ExampleCustomPaginationView(PageSizeSelectMixin, FilterView):
     model = ExampleJob
+    filterset_class = ExampleJobSearchFilter
+    ordering = "id"
     template_name = "example_app/example_custom_pagination.html"
     context_object_name = "jobs"
 
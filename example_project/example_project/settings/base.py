@@ -14,6 +14,13 @@ from pathlib import Path
 
 from environs import env
 
+from adit_radis_shared.telemetry import (
+    add_otel_logging_handler,
+    build_logging_config,
+    is_telemetry_active,
+    use_queue_handlers,
+)
+
 # During development and calling `manage.py` from the host we have to load the .env file manually.
 # Some env variables will still need a default value, as those are only set in the compose file.
 if not env.bool("IS_DOCKER_CONTAINER", default=False):
@@ -57,6 +64,7 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "django.contrib.humanize",
     "django.contrib.sites",
+    "django.contrib.postgres",
     "django_extensions",
     "procrastinate.contrib.django",
     "dbbackup",
@@ -201,7 +209,17 @@ REST_FRAMEWORK = {
     ],
 }
 
-# TODO: Setup LOGGING
+# Log to the console as JSON lines (with the ids of the active trace and span). All
+# handlers run in a thread behind a queue, so logging never blocks a request or the
+# event loop of the ASGI server.
+LOGGING = build_logging_config(
+    level=env.str("LOG_LEVEL", default="INFO"),
+    loggers={"django": "WARNING", "procrastinate": "WARNING"},
+    json_lines=env.bool("LOG_JSON_LINES", default=True),
+)
+if is_telemetry_active():
+    add_otel_logging_handler(LOGGING)
+use_queue_handlers(LOGGING)
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -251,3 +269,34 @@ BACKUP_CRON = env.str("BACKUP_CRON", default="0 3 * * *")
 
 # The priority for stalled jobs that are retried.
 STALLED_JOBS_RETRY_PRIORITY = 10
+
+# Procrastinate workers update their heartbeat every update_heartbeat_interval seconds.
+# The running jobs of a worker whose heartbeat is older than stalled_worker_timeout
+# seconds are retried (by the retry_stalled_jobs task).
+PROCRASTINATE_WORKER_DEFAULTS = {
+    "update_heartbeat_interval": 10,
+    "stalled_worker_timeout": 30,
+}
+
+# Continue the traces of requests that defer jobs in the workers.
+PROCRASTINATE_ON_APP_READY = "adit_radis_shared.common.utils.job_tracing.setup_job_tracing"
+
+# Finished jobs (and their events) are archived (see ArchivedJob) and deleted from
+# the job queue after JOB_HISTORY_MAX_AGE_DAYS days by the prune_job_history task.
+# They are deleted in batches with a pause (in seconds) in between.
+JOB_HISTORY_MAX_AGE_DAYS = env.int("JOB_HISTORY_MAX_AGE_DAYS", default=30)
+JOB_HISTORY_ARCHIVE = env.bool("JOB_HISTORY_ARCHIVE", default=True)
+JOB_HISTORY_PRUNE_BATCH_SIZE = 500
+JOB_HISTORY_PRUNE_PAUSE = 0.5
+
+# The maximum number of recipients of a broadcast Email that are sent by one job
+# (over one SMTP connection).
+BROADCAST_MAIL_CHUNK_SIZE = 50
+
+# Mails of send_mail_to_user and send_mail_to_admins are put into an outbox and sent
+# by a background task in batches. Failed mails are retried with exponential backoff.
+MAIL_OUTBOX_BATCH_SIZE = 100
+MAIL_OUTBOX_MAX_ATTEMPTS = 10
+# Seconds a worker has to send a claimed batch before other workers may pick up
+# its mails again (e.g. when the worker died while sending).
+MAIL_OUTBOX_LEASE = 600